@@ -7,7 +7,7 @@ def main():
     print("Welcome to CLED (Claude LLM Environment Dispatcher) CLI!")
     print("Available commands:")
     print("  install   - Launch the visual installer")
-    print("  serve     - Start the LLMBridgeClaudeCode server")
+    print("  serve     - Start the LLMBridgeClaudeCode server (--help for tuning options)")
     print("  ollama    - Check Ollama status")
     print("  help      - Show this help message")
     if len(sys.argv) < 2:
@@ -16,7 +16,10 @@ def main():
     if cmd == "install":
         subprocess.run([sys.executable, os.path.join(os.path.dirname(__file__), "cled_installer.py")])
     elif cmd == "serve":
-        subprocess.run(["uvicorn", "server:app", "--host", "0.0.0.0", "--port", "8083"])
+        # Production profile; see `cled serve --help` for the tuning options. Exec'd so that
+        # signals sent to this process (SIGHUP restarts, SIGTERM drains) reach the server
+        serve = os.path.join(os.path.dirname(__file__), "cled_serve.py")
+        os.execv(sys.executable, [sys.executable, serve] + sys.argv[2:])
     elif cmd == "ollama":
         subprocess.run(["ollama", "list"])
     elif cmd == "help":
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Production launcher for the LLMBridgeClaudeCode server (`cled serve`).
+
+Picks uvloop and httptools when they are installed, and listens either on TCP
+or on a Unix domain socket for Claude Code clients on the same host. With
+SO_REUSEPORT every worker process gets its own listening socket and the kernel
+spreads connections across them.
+
+Stopping drains: in-flight streams get up to --drain-timeout seconds to finish.
+`kill -HUP` restarts the workers (e.g. after a deploy or config change) with
+no downtime, handing the listening sockets to the new workers while the old
+ones drain.
+"""
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = "server:app"
+# Seconds new workers get to start accepting connections
+STARTUP_TIMEOUT = 120
+# Least seconds between restarts of a worker that keeps dying
+RESTART_DELAY = 1.0
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _installed(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="cled serve", description="Start the LLMBridgeClaudeCode server")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("PORT", 8083))
+    parser.add_argument("--uds", default=os.environ.get("SERVE_UDS") or None,
+                        help="listen on this Unix domain socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=_env_int("SERVE_WORKERS", 1))
+    parser.add_argument("--backlog", type=int, default=_env_int("SERVE_BACKLOG", 2048))
+    parser.add_argument("--keep-alive", type=int, default=_env_int("SERVE_KEEP_ALIVE", 30),
+                        help="seconds an idle keep-alive connection stays open")
+    parser.add_argument("--drain-timeout", type=int, default=_env_int("DRAIN_TIMEOUT_SECONDS", 300),
+                        help="seconds in-flight streams get to finish when a worker stops")
+    parser.add_argument("--no-reuse-port", dest="reuse_port", action="store_false",
+                        help="share one listening socket instead of one SO_REUSEPORT socket per worker")
+    parser.add_argument("--loop", choices=["auto", "uvloop", "asyncio"], default="auto")
+    parser.add_argument("--http", choices=["auto", "httptools", "h11"], default="auto")
+    parser.add_argument("--access-log", action="store_true", help="log every request (slower)")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info").lower())
+    parser.add_argument("--print-config", action="store_true", help="print the effective tuning and exit")
+    return parser.parse_args(argv)
+
+
+def build_profile(args):
+    """Resolve the effective server tuning from the arguments and what is installed"""
+    loop = args.loop
+    if loop == "auto":
+        loop = "uvloop" if _installed("uvloop") else "asyncio"
+    http = args.http
+    if http == "auto":
+        http = "httptools" if _installed("httptools") else "h11"
+    reuse_port = bool(args.reuse_port and not args.uds and hasattr(socket, "SO_REUSEPORT"))
+    return {
+        "listen": f"unix:{args.uds}" if args.uds else f"{args.host}:{args.port}",
+        "uds": args.uds,
+        "host": args.host,
+        "port": args.port,
+        "workers": max(1, args.workers),
+        "backlog": args.backlog,
+        "keep_alive": args.keep_alive,
+        "drain_timeout": args.drain_timeout,
+        "reuse_port": reuse_port,
+        "loop": loop,
+        "http": http,
+        "access_log": args.access_log,
+        "log_level": args.log_level,
+    }
+
+
+def print_profile(profile):
+    print("LLMBridgeClaudeCode server tuning:")
+    for key in ("listen", "workers", "backlog", "keep_alive", "drain_timeout", "reuse_port", "loop", "http", "access_log"):
+        print(f"  {key:<13} {profile[key]}")
+    sys.stdout.flush()
+
+
+def bind_reuse_port_socket(host, port, backlog):
+    """A listening TCP socket that other processes may bind to the same port"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def bind_shared_socket(profile):
+    """The one listening socket all workers accept from, TCP or Unix"""
+    import uvicorn
+    if profile["uds"] and os.path.exists(profile["uds"]):
+        os.unlink(profile["uds"]) # Stale socket from a previous run
+    listen = {"uds": profile["uds"]} if profile["uds"] else {"host": profile["host"], "port": profile["port"]}
+    sock = uvicorn.Config(app=APP, backlog=profile["backlog"], **listen).bind_socket()
+    sock.set_inheritable(True)
+    return sock
+
+
+def _uvicorn_config(profile):
+    import uvicorn
+    return uvicorn.Config(
+        app=APP,
+        loop=profile["loop"],
+        http=profile["http"],
+        backlog=profile["backlog"],
+        timeout_keep_alive=profile["keep_alive"],
+        timeout_graceful_shutdown=profile["drain_timeout"],
+        access_log=profile["access_log"],
+        log_level=profile["log_level"],
+    )
+
+
+def _begin_drain():
+    from app.services.lifecycle import lifecycle
+    lifecycle.begin_drain()
+
+
+def make_server(profile, ready=None):
+    """
+    A uvicorn server that drains on SIGTERM and sets `ready` once it accepts connections.
+
+    Uvicorn stops accepting connections, closes idle ones and waits up to
+    drain_timeout seconds for in-flight streams; meanwhile /health reports
+    the worker as draining.
+    """
+    import uvicorn
+
+    class DrainingServer(uvicorn.Server):
+        async def shutdown(self, sockets=None):
+            # Only once the main loop stops accepting, so no connection accepted before is refused
+            _begin_drain()
+            await super().shutdown(sockets=sockets)
+
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            if ready is not None and self.started:
+                ready.set()
+
+    return DrainingServer(_uvicorn_config(profile))
+
+
+def run_worker(profile, sock, ready=None):
+    """One worker process accepting from a socket the supervisor holds"""
+    sys.path.insert(0, REPO_ROOT) # uvicorn.run's app_dir, which Config does not take
+    make_server(profile, ready).run(sockets=[sock])
+
+
+class Supervisor:
+    """
+    Runs the workers and replaces them without dropping connections.
+
+    The supervisor owns the listening sockets for its whole life: one shared
+    socket, or with SO_REUSEPORT one socket per worker slot. On SIGHUP it
+    starts a new generation of workers on the same sockets, waits until they
+    accept, then sends SIGTERM to the old generation, which drains its
+    in-flight streams. Connections waiting in a socket's backlog are picked
+    up by the new workers instead of being reset.
+
+    A worker that dies is restarted on its own socket; with SO_REUSEPORT the
+    kernel keeps sending a share of new connections to that socket, and they
+    would wait there with nobody accepting them.
+    """
+
+    def __init__(self, profile, sockets, target=None):
+        self.profile = profile
+        self.sockets = sockets
+        self.target = target or run_worker
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = []
+        self.retiring = []
+        self.restarted_at = {}
+        self.reload_requested = False
+        self.stopping = False
+
+    def _spawn(self, sock, wait_ready=True):
+        # The caller must hold on to `ready` until the worker has started, or the child can't unpickle it
+        ready = self.context.Event() if wait_ready else None
+        worker = self.context.Process(target=self.target, args=(self.profile, sock, ready), daemon=False)
+        worker.start()
+        return worker, ready
+
+    def start_generation(self):
+        """Start one worker per socket; the workers, or None if they did not come up in time"""
+        started = [self._spawn(sock) for sock in self.sockets]
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        for worker, ready in started:
+            while not ready.wait(0.1):
+                if not worker.is_alive() or time.monotonic() > deadline or self.stopping:
+                    for other, _ in started:
+                        _terminate(other)
+                    return None
+        return [worker for worker, _ in started]
+
+    def reload(self):
+        workers = self.start_generation()
+        if workers is None:
+            print("New workers failed to start, keeping the current ones", flush=True)
+            return
+        self.retiring += self.workers
+        for worker in self.workers:
+            _terminate(worker)
+        self.workers = workers
+        print(f"Workers replaced; {len(self.retiring)} old worker(s) draining", flush=True)
+
+    def respawn_dead(self):
+        """Restart workers that exited on their own, at most once per RESTART_DELAY per slot"""
+        now = time.monotonic()
+        for slot, worker in enumerate(self.workers):
+            if worker.is_alive() or now - self.restarted_at.get(slot, float("-inf")) < RESTART_DELAY:
+                continue
+            print(f"Worker {worker.pid} exited with code {worker.exitcode}, restarting it", flush=True)
+            self.restarted_at[slot] = now
+            self.workers[slot], _ = self._spawn(self.sockets[slot], wait_ready=False)
+
+    def run(self):
+        def stop(signum, frame):
+            self.stopping = True
+
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGHUP, request_reload)
+        self.workers = self.start_generation() or []
+        while self.workers and not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            self.retiring = [worker for worker in self.retiring if worker.is_alive()]
+            self.respawn_dead()
+            time.sleep(0.2)
+        for worker in self.workers:
+            _terminate(worker)
+        for worker in self.workers + self.retiring:
+            worker.join()
+        for sock in self.sockets:
+            sock.close()
+
+
+def _terminate(worker):
+    if worker.is_alive():
+        os.kill(worker.pid, signal.SIGTERM)
+
+
+def serve(profile):
+    if profile["reuse_port"]:
+        sockets = [bind_reuse_port_socket(profile["host"], profile["port"], profile["backlog"])
+                   for _ in range(profile["workers"])]
+    else:
+        sockets = [bind_shared_socket(profile)] * profile["workers"]
+    Supervisor(profile, sockets).run()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    profile = build_profile(args)
+    print_profile(profile)
+    if args.print_config:
+        return
+    serve(profile)
+
+
+if __name__ == "__main__":
+    main()
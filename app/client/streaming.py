@@ -0,0 +1,258 @@
+"""
+Async client for the proxy's Anthropic-compatible /v1/messages endpoint.
+
+One BridgeClient keeps a pooled keep-alive connection (TCP or Unix socket) that
+any number of concurrent Conversations and streams can share. Streams are parsed
+incrementally from raw bytes and handed out as StreamEvents.
+"""
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+import httpx
+
+DEFAULT_BASE_URL = "http://localhost:8083"
+ANTHROPIC_VERSION = "2023-06-01"
+
+
+class SSEMessage(NamedTuple):
+    """One raw server-sent event"""
+    event: Optional[str]
+    data: bytes
+
+
+class SSEParser:
+    """
+    Incremental server-sent events parser working on bytes.
+
+    Chunks may split lines, events or multi-byte characters anywhere. Every byte
+    is scanned once; only an incomplete trailing line is kept between feeds.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._event: Optional[str] = None
+        self._data: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[SSEMessage]:
+        self._buffer += chunk
+        messages = []
+        start = 0
+        while True:
+            end = self._buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = bytes(self._buffer[start:end])
+            start = end + 1
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if not line:
+                message = self._dispatch()
+                if message is not None:
+                    messages.append(message)
+            elif line.startswith(b"data:"):
+                value = line[5:]
+                self._data.append(value[1:] if value.startswith(b" ") else value)
+            elif line.startswith(b"event:"):
+                self._event = line[6:].strip().decode("utf-8")
+            # Comments (":") and other fields are ignored
+        del self._buffer[:start]
+        return messages
+
+    def flush(self) -> List[SSEMessage]:
+        """Return the last event if the stream ended without a blank line"""
+        if self._buffer:
+            self.feed(b"\n")
+        message = self._dispatch()
+        return [message] if message is not None else []
+
+    def _dispatch(self) -> Optional[SSEMessage]:
+        if not self._data:
+            self._event = None
+            return None
+        message = SSEMessage(self._event, b"\n".join(self._data))
+        self._event = None
+        self._data = []
+        return message
+
+
+class StreamEvent(NamedTuple):
+    """A decoded Anthropic stream event"""
+    # message_start, content_block_start, content_block_delta, content_block_stop,
+    # message_delta, message_stop, ping or error
+    type: str
+    data: Dict[str, Any]
+    # Seconds since the request was sent
+    elapsed: float
+
+    @property
+    def text(self) -> str:
+        """The text of a text_delta, empty for every other event"""
+        if self.type != "content_block_delta":
+            return ""
+        delta = self.data.get("delta", {})
+        return delta.get("text", "") if delta.get("type") == "text_delta" else ""
+
+
+class StreamResult(NamedTuple):
+    """Everything collected from one streamed response"""
+    events: List[StreamEvent]
+    text: str
+    stop_reason: Optional[str]
+    usage: Dict[str, Any]
+    # Seconds until the first content_block_delta (None if there was none)
+    time_to_first_token: Optional[float]
+    duration: float
+    error: Optional[Dict[str, Any]]
+
+
+class BridgeHTTPError(Exception):
+    """The proxy answered with a non-200 status"""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"HTTP {status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+class BridgeClient:
+    """
+    Pooled async client for /v1/messages.
+
+    Use as an async context manager, or call aclose() when done. `uds` connects
+    through a Unix domain socket (see `cled serve --uds`); `transport` replaces
+    the network entirely, e.g. with httpx.ASGITransport in tests.
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, api_key: Optional[str] = None,
+                 headers: Optional[Dict[str, str]] = None, uds: Optional[str] = None,
+                 timeout: float = 600.0, max_connections: int = 100,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        request_headers = {"anthropic-version": ANTHROPIC_VERSION, "content-type": "application/json"}
+        if api_key:
+            request_headers["x-api-key"] = api_key
+        request_headers.update(headers or {})
+        if transport is None and uds:
+            transport = httpx.AsyncHTTPTransport(uds=uds)
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=request_headers,
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "BridgeClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def create(self, request: Dict[str, Any], path: str = "/v1/messages") -> Dict[str, Any]:
+        """Send a non-streaming request and return the decoded message"""
+        response = await self._client.post(path, json={**request, "stream": False})
+        if response.status_code != 200:
+            raise BridgeHTTPError(response.status_code, response.text)
+        return response.json()
+
+    async def stream(self, request: Dict[str, Any], path: str = "/v1/messages") -> AsyncIterator[StreamEvent]:
+        """Send a streaming request and yield its events as they arrive"""
+        started = time.perf_counter()
+        async with self._client.stream("POST", path, json={**request, "stream": True}) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise BridgeHTTPError(response.status_code, body.decode("utf-8", "replace"))
+            parser = SSEParser()
+            async for chunk in response.aiter_bytes():
+                for message in parser.feed(chunk):
+                    event = _decode(message, started)
+                    if event is None:
+                        return
+                    yield event
+            for message in parser.flush():
+                event = _decode(message, started)
+                if event is not None:
+                    yield event
+
+    async def collect(self, request: Dict[str, Any], path: str = "/v1/messages") -> StreamResult:
+        """Stream a request to completion and summarise it"""
+        started = time.perf_counter()
+        events = []
+        text_parts = []
+        stop_reason = None
+        usage: Dict[str, Any] = {}
+        first_token = None
+        error = None
+        async for event in self.stream(request, path):
+            events.append(event)
+            if event.type == "content_block_delta" and first_token is None:
+                first_token = event.elapsed
+            if event.text:
+                text_parts.append(event.text)
+            elif event.type == "message_start":
+                usage.update(event.data.get("message", {}).get("usage", {}))
+            elif event.type == "message_delta":
+                stop_reason = event.data.get("delta", {}).get("stop_reason")
+                usage.update(event.data.get("usage", {}))
+            elif event.type == "error":
+                error = event.data.get("error", {})
+        return StreamResult(events, "".join(text_parts), stop_reason, usage, first_token,
+                            time.perf_counter() - started, error)
+
+
+def _decode(message: SSEMessage, started: float) -> Optional[StreamEvent]:
+    """Decode one SSE message; None marks the end of the stream ([DONE])"""
+    if message.data == b"[DONE]":
+        return None
+    data = json.loads(message.data)
+    return StreamEvent(data.get("type", message.event or ""), data, time.perf_counter() - started)
+
+
+class Conversation:
+    """
+    A multi-turn conversation over a shared BridgeClient.
+
+    Each Conversation keeps its own history, so many can stream concurrently on
+    the same pooled connection.
+    """
+
+    def __init__(self, client: BridgeClient, model: str, system: Optional[str] = None,
+                 max_tokens: int = 1024, **params: Any):
+        self.client = client
+        self.model = model
+        self.system = system
+        self.max_tokens = max_tokens
+        self.params = params
+        self.messages: List[Dict[str, Any]] = []
+
+    def request(self) -> Dict[str, Any]:
+        request = {"model": self.model, "max_tokens": self.max_tokens,
+                   "messages": list(self.messages), **self.params}
+        if self.system:
+            request["system"] = self.system
+        return request
+
+    async def send(self, content: Any) -> AsyncIterator[StreamEvent]:
+        """Add a user turn and stream the reply; the reply joins the history when done"""
+        self.messages.append({"role": "user", "content": content})
+        reply = []
+        try:
+            async for event in self.client.stream(self.request()):
+                if event.text:
+                    reply.append(event.text)
+                yield event
+        finally:
+            text = "".join(reply).strip()
+            if text:
+                self.messages.append({"role": "assistant", "content": text})
+            else:
+                # Nothing came back: drop the turn so user/assistant keep alternating
+                self.messages.pop()
+
+    async def ask(self, content: Any) -> str:
+        """Add a user turn and return the whole reply text"""
+        return "".join([event.text async for event in self.send(content)])
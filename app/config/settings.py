@@ -19,15 +19,211 @@ SMALL_MODEL = os.environ.get("SMALL_MODEL", "gpt-3.5-turbo")
 
 # Ollama Configuration
 OLLAMA_API_BASE = os.environ.get("OLLAMA_API_BASE", "http://localhost:11434")
+# Additional Ollama hosts serving the same models, comma separated
+OLLAMA_API_BASES = [OLLAMA_API_BASE] + [
+    base.strip() for base in os.environ.get("OLLAMA_EXTRA_API_BASES", "").split(",")
+    if base.strip() and base.strip() != OLLAMA_API_BASE
+]
 
 # Server Configuration
 HOST = os.environ.get("HOST", "0.0.0.0")
 PORT = int(os.environ.get("PORT", "8083"))
+# Seconds a stopping server waits for in-flight requests and streams before cutting them off
+DRAIN_TIMEOUT_SECONDS = int(os.environ.get("DRAIN_TIMEOUT_SECONDS", "300"))
 
 # Logging Configuration
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+# LiteLLM's own debug output (very noisy)
+LITELLM_VERBOSE = os.environ.get("LITELLM_VERBOSE", "false").lower() == "true"
+# Import LiteLLM in a background thread once the server has started, so the first
+# request doesn't wait for it. Off by default: the import holds the GIL for seconds
+# and slows the requests served meanwhile; LiteLLM is imported on first use otherwise
+LITELLM_WARM_UP = os.environ.get("LITELLM_WARM_UP", "false").lower() == "true"
+
+def _parse_int_map(value: str) -> Dict[str, int]:
+    """Parse a "name=number,name=number" environment value into a dict"""
+    result = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        key, _, number = item.partition("=")
+        try:
+            result[key.strip()] = int(number.strip())
+        except ValueError:
+            continue
+    return result
+
+# Context Window Configuration
+CONTEXT_FIT_ENABLED = os.environ.get("CONTEXT_FIT_ENABLED", "true").lower() == "true"
+DEFAULT_CONTEXT_LENGTH = int(os.environ.get("DEFAULT_CONTEXT_LENGTH", "8192"))
+# Most of the context window held back for the output when fitting, whatever max_tokens asks for
+CONTEXT_MAX_OUTPUT_SHARE = float(os.environ.get("CONTEXT_MAX_OUTPUT_SHARE", "0.25"))
+# Per-model overrides, e.g. "codellama:13b=16384,llama3=8192"
+MODEL_CONTEXT_LENGTHS = _parse_int_map(os.environ.get("MODEL_CONTEXT_LENGTHS", ""))
+CONTEXT_KEEP_LAST_TURNS = int(os.environ.get("CONTEXT_KEEP_LAST_TURNS", "4"))
+CONTEXT_PINNED_MESSAGES = int(os.environ.get("CONTEXT_PINNED_MESSAGES", "1"))
+# Send Ollama a per-request num_ctx sized to the prompt plus max_tokens
+NUM_CTX_ENABLED = os.environ.get("NUM_CTX_ENABLED", "true").lower() == "true"
+# num_ctx is rounded up to one of these sizes so Ollama rarely has to reload the model
+NUM_CTX_BUCKETS = sorted(int(b) for b in os.environ.get("NUM_CTX_BUCKETS", "4096,8192,16384,32768,65536,131072").split(",") if b.strip())
+
+# Tool Result Configuration
+# Results longer than HEAD + TAIL characters keep only their head and tail (0 disables)
+TOOL_RESULT_HEAD_CHARS = int(os.environ.get("TOOL_RESULT_HEAD_CHARS", "24000"))
+TOOL_RESULT_TAIL_CHARS = int(os.environ.get("TOOL_RESULT_TAIL_CHARS", "8000"))
+# Replace outputs identical to an earlier tool result with a short reference
+TOOL_RESULT_DEDUPE = os.environ.get("TOOL_RESULT_DEDUPE", "true").lower() == "true"
+
+# System Prompt Configuration
+# JSON file of per-model system prompt rewrite rules (see system_prompt_rules.example.json)
+SYSTEM_PROMPT_RULES_FILE = os.environ.get("SYSTEM_PROMPT_RULES_FILE", "")
+SYSTEM_PROMPT_CACHE_SIZE = int(os.environ.get("SYSTEM_PROMPT_CACHE_SIZE", "64"))
+
+# Tool Definition Configuration
+# Send request tools to the model as OpenAI-style functions (Ollama models use the chat API for this)
+TOOL_FORWARDING_ENABLED = os.environ.get("TOOL_FORWARDING_ENABLED", "true").lower() == "true"
+TOOL_DEFINITION_CACHE_SIZE = int(os.environ.get("TOOL_DEFINITION_CACHE_SIZE", "32"))
+# Trim tool definitions for small models: "off", "descriptions" (shorten them) or "prune" (also drop rarely used tools)
+TOOL_PRUNING = os.environ.get("TOOL_PRUNING", "off").lower()
+# Only trim for models up to this many billion parameters, per the model registry (0 trims for every model)
+TOOL_PRUNING_MAX_PARAMETERS_B = float(os.environ.get("TOOL_PRUNING_MAX_PARAMETERS_B", "14"))
+TOOL_DESCRIPTION_MAX_CHARS = int(os.environ.get("TOOL_DESCRIPTION_MAX_CHARS", "300"))
+# "prune" drops tools called in less than this share of the last TOOL_PRUNING_WINDOW assistant turns
+TOOL_PRUNING_WINDOW = int(os.environ.get("TOOL_PRUNING_WINDOW", "100"))
+TOOL_PRUNING_MIN_SHARE = float(os.environ.get("TOOL_PRUNING_MIN_SHARE", "0.01"))
+
+# Image Configuration
+# Longest image side in pixels sent to the model (0 keeps the original size)
+DEFAULT_IMAGE_MAX_DIMENSION = int(os.environ.get("DEFAULT_IMAGE_MAX_DIMENSION", "0"))
+# Per-model overrides, e.g. "llava=672,minicpm-v=1344"
+MODEL_IMAGE_MAX_DIMENSIONS = _parse_int_map(os.environ.get("MODEL_IMAGE_MAX_DIMENSIONS", ""))
+IMAGE_CACHE_SIZE = int(os.environ.get("IMAGE_CACHE_SIZE", "64"))
+# Larger images are not decoded (decompression bomb guard for Pillow)
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", "40000000"))
+
+# Hedged Request Configuration
+# Send a streaming request to a second Ollama host when the first token is late
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "false").lower() == "true"
+# Hedge after this percentile of the model's recent time-to-first-token
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+# Delay used until enough samples exist, and the lower bound for any delay
+HEDGE_DEFAULT_DELAY_MS = int(os.environ.get("HEDGE_DEFAULT_DELAY_MS", "3000"))
+HEDGE_MIN_DELAY_MS = int(os.environ.get("HEDGE_MIN_DELAY_MS", "250"))
+# At most this fraction of requests may be hedged
+HEDGE_MAX_RATIO = float(os.environ.get("HEDGE_MAX_RATIO", "0.1"))
+
+# Failover Configuration
+# Consecutive failures that open a backend's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "30"))
+# Extra passes over the failover chain before giving up (first byte not yet sent)
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "2"))
+RETRY_BASE_DELAY_MS = int(os.environ.get("RETRY_BASE_DELAY_MS", "200"))
+RETRY_MAX_DELAY_MS = int(os.environ.get("RETRY_MAX_DELAY_MS", "2000"))
+# Smaller models tried on every host after the requested one, comma separated
+FAILOVER_MODELS = [m.strip() for m in os.environ.get("FAILOVER_MODELS", "").split(",") if m.strip()]
+
+# Deadline Configuration (seconds, 0 disables a deadline)
+DEADLINE_CONNECT_SECONDS = float(os.environ.get("DEADLINE_CONNECT_SECONDS", "10"))
+DEADLINE_FIRST_TOKEN_SECONDS = float(os.environ.get("DEADLINE_FIRST_TOKEN_SECONDS", "120"))
+DEADLINE_IDLE_SECONDS = float(os.environ.get("DEADLINE_IDLE_SECONDS", "60"))
+DEADLINE_TOTAL_SECONDS = float(os.environ.get("DEADLINE_TOTAL_SECONDS", "600"))
+# Per-model overrides as connect/first_token/idle/total, e.g. "llama3:70b=10/300/60/1200"
+MODEL_DEADLINES = {
+    key: value for key, value in (
+        item.split("=", 1) for item in os.environ.get("MODEL_DEADLINES", "").split(",") if "=" in item
+    )
+}
+
+# Message Batches Configuration
+# Off by default: the queue is a SQLite file at BATCH_DB_PATH, relative to the working directory
+BATCH_ENABLED = os.environ.get("BATCH_ENABLED", "false").lower() == "true"
+BATCH_DB_PATH = os.environ.get("BATCH_DB_PATH", "batches.db")
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "2"))
+BATCH_MODEL_CONCURRENCY = int(os.environ.get("BATCH_MODEL_CONCURRENCY", "1"))
+# Batch workers pause while interactive requests run and for this long afterwards
+BATCH_INTERACTIVE_GRACE_SECONDS = float(os.environ.get("BATCH_INTERACTIVE_GRACE_SECONDS", "2"))
+BATCH_EXPIRY_HOURS = float(os.environ.get("BATCH_EXPIRY_HOURS", "24"))
+# A running request goes back to the queue when its process stops renewing the lease for this long
+BATCH_LEASE_SECONDS = float(os.environ.get("BATCH_LEASE_SECONDS", "60"))
+BATCH_MAX_REQUESTS = int(os.environ.get("BATCH_MAX_REQUESTS", "100000"))
+
+# Prompt Cache Configuration
+# Track cache_control breakpoints per session and keep warm prefixes on the same host
+PROMPT_CACHE_ENABLED = os.environ.get("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+# Ollama keep_alive for requests with breakpoints, so the model (and its KV cache) stays loaded
+PROMPT_CACHE_KEEP_ALIVE = os.environ.get("PROMPT_CACHE_KEEP_ALIVE", "30m")
+PROMPT_CACHE_MAX_SESSIONS = int(os.environ.get("PROMPT_CACHE_MAX_SESSIONS", "1024"))
+
+# Upstream Recording and Replay Configuration
+# Record raw upstream chunk streams: "off", "header" (requests sending x-record-upstream: 1) or "all"
+RECORD_UPSTREAM = os.environ.get("RECORD_UPSTREAM", "off").lower()
+RECORD_DIR = os.environ.get("RECORD_DIR", "recordings")
+# With RECORD_UPSTREAM=all, only record these models (comma separated, empty means every model)
+RECORD_MODELS = [m.strip() for m in os.environ.get("RECORD_MODELS", "").split(",") if m.strip()]
+# Serve recordings from this file or directory instead of calling the upstream
+REPLAY_PATH = os.environ.get("REPLAY_PATH", "")
+# "original", "max", or a multiplier such as "2" (twice as fast)
+REPLAY_SPEED = os.environ.get("REPLAY_SPEED", "original")
+
+# Rate Limit Configuration
+# Per-client token buckets; clients are identified by metadata.user_id or x-api-key.
+# Limits are enforced per worker process: with N workers a client can get up to N times these rates
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "false").lower() == "true"
+# 0 disables a limit
+RATE_LIMIT_REQUESTS_PER_SECOND = float(os.environ.get("RATE_LIMIT_REQUESTS_PER_SECOND", "2"))
+RATE_LIMIT_REQUEST_BURST = int(os.environ.get("RATE_LIMIT_REQUEST_BURST", "10"))
+RATE_LIMIT_INPUT_TOKENS_PER_MINUTE = int(os.environ.get("RATE_LIMIT_INPUT_TOKENS_PER_MINUTE", "400000"))
+RATE_LIMIT_OUTPUT_TOKENS_PER_MINUTE = int(os.environ.get("RATE_LIMIT_OUTPUT_TOKENS_PER_MINUTE", "80000"))
+# Each worker writes its ledger (usage totals and bucket levels) next to this path, e.g.
+# rate_limits.<pid>.json; on startup the files of exited workers are reloaded
+RATE_LIMIT_SNAPSHOT_PATH = os.environ.get("RATE_LIMIT_SNAPSHOT_PATH", "rate_limits.json")
+RATE_LIMIT_SNAPSHOT_SECONDS = float(os.environ.get("RATE_LIMIT_SNAPSHOT_SECONDS", "30"))
+# Clients idle this long with full buckets are dropped from memory (0 keeps them forever)
+RATE_LIMIT_IDLE_SECONDS = float(os.environ.get("RATE_LIMIT_IDLE_SECONDS", "3600"))
+
+# Scheduler Configuration
+# Upstream requests allowed at once; more wait in a priority queue (0 means no limit)
+SCHEDULER_MAX_CONCURRENCY = int(os.environ.get("SCHEDULER_MAX_CONCURRENCY", "0"))
+# Requested models containing one of these (comma separated) run in the background class
+SCHEDULER_BACKGROUND_MODELS = [m.strip().lower() for m in os.environ.get("SCHEDULER_BACKGROUND_MODELS", "haiku").split(",") if m.strip()]
+# A queued job's estimated cost halves after waiting this long
+SCHEDULER_AGING_SECONDS = float(os.environ.get("SCHEDULER_AGING_SECONDS", "30"))
+# Background jobs waiting this long compete with interactive ones (0 never promotes)
+SCHEDULER_PROMOTE_SECONDS = float(os.environ.get("SCHEDULER_PROMOTE_SECONDS", "60"))
+
+# Model Registry Configuration
+# Discover installed models and their capabilities from the Ollama hosts
+MODEL_REGISTRY_ENABLED = os.environ.get("MODEL_REGISTRY_ENABLED", "true").lower() == "true"
+MODEL_REGISTRY_REFRESH_SECONDS = float(os.environ.get("MODEL_REGISTRY_REFRESH_SECONDS", "300"))
+
+# Stop Sequence Configuration
+# Also apply stop_sequences in the proxy, cutting the response and the upstream at a match
+STOP_SEQUENCES_ENFORCED = os.environ.get("STOP_SEQUENCES_ENFORCED", "true").lower() == "true"
+
+# Tool Call Parsing Configuration
+# Turn tool calls that models write into their text (e.g. <tool_call>{...}</tool_call>) into tool_use blocks
+TOOL_CALL_PARSING_ENABLED = os.environ.get("TOOL_CALL_PARSING_ENABLED", "true").lower() == "true"
+# Formats per model, overriding the built-in families, e.g. "granite=json,mymodel=hermes+xml"
+# Formats: hermes (<tool_call>), xml (<function_calls><invoke>), mistral ([TOOL_CALLS]), json (Llama 3)
+TOOL_CALL_FORMATS = {
+    pattern.strip().lower(): [f.strip() for f in formats.split("+") if f.strip()]
+    for pattern, formats in (
+        item.split("=", 1) for item in os.environ.get("TOOL_CALL_FORMATS", "").split(",") if "=" in item
+    )
+}
+
+# Compression Configuration
+# Largest /v1/messages body accepted after decompression (bytes, 0 means no limit)
+MAX_REQUEST_BODY_BYTES = int(os.environ.get("MAX_REQUEST_BODY_BYTES", str(32 * 1024 * 1024)))
+# Gzip non-streaming responses for clients that accept it; event streams are never compressed
+RESPONSE_COMPRESSION_ENABLED = os.environ.get("RESPONSE_COMPRESSION_ENABLED", "false").lower() == "true"
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+RESPONSE_COMPRESSION_LEVEL = int(os.environ.get("RESPONSE_COMPRESSION_LEVEL", "6"))
 
 # Model Lists
+# Static fallbacks; Ollama models found by the model registry are used ahead of OLLAMA_MODELS
 OPENAI_MODELS = [
     "o3-mini", "o1", "o1-mini", "o1-pro", "gpt-4.5-preview", "gpt-4o",
     "gpt-4o-audio-preview", "chatgpt-4o-latest", "gpt-4o-mini",
@@ -94,5 +290,13 @@ def validate_configuration() -> List[str]:
         issues.append("Anthropic is set as preferred provider but ANTHROPIC_API_KEY is not configured")
     elif PREFERRED_PROVIDER == "google" and not GEMINI_API_KEY:
         issues.append("Google is set as preferred provider but GEMINI_API_KEY is not configured")
+
+    # Imported here, as tool_calls itself reads these settings
+    from app.utils.tool_calls import FORMATS
+    for pattern, formats in TOOL_CALL_FORMATS.items():
+        unknown = [f for f in formats if f not in FORMATS]
+        if unknown:
+            issues.append(f"TOOL_CALL_FORMATS entry '{pattern}' has unknown formats {', '.join(unknown)} "
+                          f"(known: {', '.join(FORMATS)})")
     
     return issues 
\ No newline at end of file
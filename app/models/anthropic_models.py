@@ -4,25 +4,31 @@ from typing import List, Dict, Any, Optional, Union, Literal
 class ContentBlockText(BaseModel):
     type: Literal["text"]
     text: str
+    cache_control: Optional[Dict[str, Any]] = None
 
 class ContentBlockImage(BaseModel):
     type: Literal["image"]
     source: Dict[str, Any]
+    cache_control: Optional[Dict[str, Any]] = None
 
 class ContentBlockToolUse(BaseModel):
     type: Literal["tool_use"]
     id: str
     name: str
     input: Dict[str, Any]
+    cache_control: Optional[Dict[str, Any]] = None
 
 class ContentBlockToolResult(BaseModel):
     type: Literal["tool_result"]
     tool_use_id: str
     content: Union[str, List[Dict[str, Any]], Dict[str, Any], List[Any], Any]
+    is_error: Optional[bool] = None
+    cache_control: Optional[Dict[str, Any]] = None
 
 class SystemContent(BaseModel):
     type: Literal["text"]
     text: str
+    cache_control: Optional[Dict[str, Any]] = None
 
 class Message(BaseModel):
     role: Literal["user", "assistant"] 
@@ -32,6 +38,7 @@ class Tool(BaseModel):
     name: str
     description: Optional[str] = None
     input_schema: Dict[str, Any]
+    cache_control: Optional[Dict[str, Any]] = None
 
 class ThinkingConfig(BaseModel):
     enabled: bool
@@ -83,3 +90,10 @@ class MessagesResponse(BaseModel):
     stop_reason: Optional[Literal["end_turn", "max_tokens", "stop_sequence", "tool_use"]] = None
     stop_sequence: Optional[str] = None
     usage: Usage
+
+class MessageBatchRequestItem(BaseModel):
+    custom_id: str
+    params: Dict[str, Any]
+
+class CreateMessageBatchRequest(BaseModel):
+    requests: List[MessageBatchRequestItem]
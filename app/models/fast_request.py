@@ -0,0 +1,285 @@
+"""
+Fast-path parsing of /v1/messages request bodies.
+
+Claude Code requests can be 1-2 MB of conversation history and tool schemas.
+Validating them into the nested pydantic models and then walking the result
+again during conversion costs tens of milliseconds before any upstream work
+starts. `parse_messages_request` decodes the body once into slotted records
+with the same attribute names as the pydantic models, so the conversion code
+accepts either.
+
+The fast path is deliberately strict: it only accepts values the pydantic
+models would accept unchanged (or with the same trivial coercion, int to float).
+Anything else (a missing field, an unknown block type, a value pydantic would
+coerce or reject) returns None and the caller validates with the pydantic
+model, which produces the usual 422 errors. test_fast_request.py checks that
+both paths agree on random requests.
+"""
+import json
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is optional
+    _loads = json.loads
+
+
+class _Unsupported(Exception):
+    """The value needs the pydantic path"""
+
+
+def _dump(value: Any) -> Any:
+    if isinstance(value, _Record):
+        return value.model_dump()
+    if type(value) is list:
+        return [_dump(item) for item in value]
+    return value
+
+
+class _Record:
+    """Slotted stand-in for a pydantic model"""
+    __slots__ = ()
+
+    def model_dump(self) -> Dict[str, Any]:
+        """Same shape as the pydantic model's model_dump()"""
+        return {name: _dump(getattr(self, name)) for name in self.__slots__}
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and self.model_dump() == other.model_dump()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class TextBlock(_Record):
+    __slots__ = ("type", "text", "cache_control")
+
+    def __init__(self, text: str, cache_control: Optional[Dict[str, Any]]):
+        self.type = "text"
+        self.text = text
+        self.cache_control = cache_control
+
+
+class ImageBlock(_Record):
+    __slots__ = ("type", "source", "cache_control")
+
+    def __init__(self, source: Dict[str, Any], cache_control: Optional[Dict[str, Any]]):
+        self.type = "image"
+        self.source = source
+        self.cache_control = cache_control
+
+
+class ToolUseBlock(_Record):
+    __slots__ = ("type", "id", "name", "input", "cache_control")
+
+    def __init__(self, id: str, name: str, input: Dict[str, Any], cache_control: Optional[Dict[str, Any]]):
+        self.type = "tool_use"
+        self.id = id
+        self.name = name
+        self.input = input
+        self.cache_control = cache_control
+
+
+class ToolResultBlock(_Record):
+    __slots__ = ("type", "tool_use_id", "content", "is_error", "cache_control")
+
+    def __init__(self, tool_use_id: str, content: Any, is_error: Optional[bool],
+                 cache_control: Optional[Dict[str, Any]]):
+        self.type = "tool_result"
+        self.tool_use_id = tool_use_id
+        self.content = content
+        self.is_error = is_error
+        self.cache_control = cache_control
+
+
+ContentBlock = Union[TextBlock, ImageBlock, ToolUseBlock, ToolResultBlock]
+
+
+class MessageRecord(_Record):
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: Union[str, List[ContentBlock]]):
+        self.role = role
+        self.content = content
+
+
+class ToolRecord(_Record):
+    __slots__ = ("name", "description", "input_schema", "cache_control")
+
+    def __init__(self, name: str, description: Optional[str], input_schema: Dict[str, Any],
+                 cache_control: Optional[Dict[str, Any]]):
+        self.name = name
+        self.description = description
+        self.input_schema = input_schema
+        self.cache_control = cache_control
+
+
+class ThinkingRecord(_Record):
+    __slots__ = ("enabled",)
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+
+
+class MessagesRequestRecord(_Record):
+    __slots__ = ("model", "max_tokens", "messages", "system", "stop_sequences", "stream",
+                 "temperature", "top_p", "top_k", "metadata", "tools", "tool_choice",
+                 "thinking", "original_model")
+
+    def __init__(self, **fields: Any):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+
+def _str(value: Any) -> str:
+    if type(value) is not str:
+        raise _Unsupported
+    return value
+
+
+def _opt_str(value: Any) -> Optional[str]:
+    return None if value is None else _str(value)
+
+
+def _dict(value: Any) -> Dict[str, Any]:
+    if type(value) is not dict:
+        raise _Unsupported
+    return value
+
+
+def _opt_dict(value: Any) -> Optional[Dict[str, Any]]:
+    return None if value is None else _dict(value)
+
+
+def _list(value: Any) -> List[Any]:
+    if type(value) is not list:
+        raise _Unsupported
+    return value
+
+
+def _int(value: Any) -> int:
+    if type(value) is not int:
+        raise _Unsupported
+    return value
+
+
+def _bool(value: Any) -> bool:
+    if type(value) is not bool:
+        raise _Unsupported
+    return value
+
+
+def _opt_bool(value: Any) -> Optional[bool]:
+    if value is not None and type(value) is not bool:
+        raise _Unsupported
+    return value
+
+
+def _opt_float(value: Any) -> Optional[float]:
+    if value is None or type(value) is float:
+        return value
+    if type(value) is int:
+        try:
+            return float(value)
+        except OverflowError:
+            raise _Unsupported
+    raise _Unsupported
+
+
+def _required(data: Dict[str, Any], name: str) -> Any:
+    try:
+        return data[name]
+    except KeyError:
+        raise _Unsupported
+
+
+def _block(data: Any) -> ContentBlock:
+    _dict(data)
+    block_type = data.get("type")
+    cache_control = _opt_dict(data.get("cache_control"))
+    if block_type == "text":
+        return TextBlock(_str(_required(data, "text")), cache_control)
+    if block_type == "tool_result":
+        return ToolResultBlock(_str(_required(data, "tool_use_id")), _required(data, "content"),
+                               _opt_bool(data.get("is_error")), cache_control)
+    if block_type == "tool_use":
+        return ToolUseBlock(_str(_required(data, "id")), _str(_required(data, "name")),
+                            _dict(_required(data, "input")), cache_control)
+    if block_type == "image":
+        return ImageBlock(_dict(_required(data, "source")), cache_control)
+    raise _Unsupported
+
+
+def _message(data: Any) -> MessageRecord:
+    _dict(data)
+    role = data.get("role")
+    if role != "user" and role != "assistant":
+        raise _Unsupported
+    content = _required(data, "content")
+    if type(content) is not str:
+        content = [_block(block) for block in _list(content)]
+    return MessageRecord(role, content)
+
+
+def _system(value: Any) -> Union[None, str, List[TextBlock]]:
+    if value is None or type(value) is str:
+        return value
+    blocks = []
+    for data in _list(value):
+        _dict(data)
+        if data.get("type") != "text":
+            raise _Unsupported
+        blocks.append(TextBlock(_str(_required(data, "text")), _opt_dict(data.get("cache_control"))))
+    return blocks
+
+
+def _tool(data: Any) -> ToolRecord:
+    _dict(data)
+    return ToolRecord(_str(_required(data, "name")), _opt_str(data.get("description")),
+                      _dict(_required(data, "input_schema")), _opt_dict(data.get("cache_control")))
+
+
+def _request(data: Any) -> MessagesRequestRecord:
+    _dict(data)
+    stop_sequences = data.get("stop_sequences")
+    if stop_sequences is not None:
+        for item in _list(stop_sequences):
+            _str(item)
+    top_k = data.get("top_k")
+    tools = data.get("tools")
+    thinking = data.get("thinking")
+    if thinking is not None:
+        thinking = ThinkingRecord(_bool(_required(_dict(thinking), "enabled")))
+    return MessagesRequestRecord(
+        model=_str(_required(data, "model")),
+        max_tokens=_int(_required(data, "max_tokens")),
+        messages=[_message(message) for message in _list(_required(data, "messages"))],
+        system=_system(data.get("system")),
+        stop_sequences=stop_sequences,
+        stream=_opt_bool(data.get("stream", False)),
+        temperature=_opt_float(data.get("temperature", 1.0)),
+        top_p=_opt_float(data.get("top_p")),
+        top_k=None if top_k is None else _int(top_k),
+        metadata=_opt_dict(data.get("metadata")),
+        tools=None if tools is None else [_tool(tool) for tool in _list(tools)],
+        tool_choice=_opt_dict(data.get("tool_choice")),
+        thinking=thinking,
+        original_model=_opt_str(data.get("original_model")),
+    )
+
+
+def parse_messages_request(body: bytes) -> Optional[MessagesRequestRecord]:
+    """
+    Parse a /v1/messages body into records, or return None when the body
+    needs full pydantic validation (invalid JSON or anything unusual).
+    """
+    try:
+        data = _loads(body)
+    except ValueError:
+        return None
+    try:
+        return _request(data)
+    except _Unsupported:
+        return None
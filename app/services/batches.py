@@ -0,0 +1,425 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from app.config.settings import (
+    BATCH_DB_PATH, BATCH_WORKERS, BATCH_MODEL_CONCURRENCY,
+    BATCH_INTERACTIVE_GRACE_SECONDS, BATCH_EXPIRY_HOURS, BATCH_LEASE_SECONDS
+)
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Runs one batch request's params and returns the Anthropic message dict
+RequestRunner = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    ended_at REAL,
+    cancel_initiated_at REAL,
+    processing_status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batch_requests (
+    batch_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    custom_id TEXT NOT NULL,
+    model TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    owner TEXT,
+    lease_expires REAL,
+    PRIMARY KEY (batch_id, idx)
+);
+CREATE INDEX IF NOT EXISTS batch_requests_status ON batch_requests (status, batch_id, idx);
+"""
+
+_COUNT_KEYS = {
+    "pending": "processing", "running": "processing", "succeeded": "succeeded",
+    "errored": "errored", "canceled": "canceled", "expired": "expired",
+}
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class BatchStore:
+    """
+    SQLite-backed store for message batches and their individual requests.
+
+    Every method is blocking; async callers go through asyncio.to_thread. A
+    lock serializes access to the shared connection. Several processes may
+    share the database (`cled serve --workers N`, or old and new workers
+    during a restart): claims are made under SQLite's write lock, and a running
+    request belongs to its claimer only while the claimer renews its lease.
+    """
+
+    def __init__(self, path: str = BATCH_DB_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(batch_requests)")}
+        for column, column_type in (("owner", "TEXT"), ("lease_expires", "REAL")):
+            if column not in columns:
+                # Databases created before leases existed
+                self._conn.execute(f"ALTER TABLE batch_requests ADD COLUMN {column} {column_type}")
+        self._lock = threading.Lock()
+
+    def create_batch(self, requests: List[Tuple[str, str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """Persist a batch of (custom_id, model key, params) requests"""
+        batch_id = f"msgbatch_{uuid.uuid4().hex}"
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT INTO batches VALUES (?, ?, ?, NULL, NULL, 'in_progress')",
+                (batch_id, now, now + BATCH_EXPIRY_HOURS * 3600)
+            )
+            self._conn.executemany(
+                "INSERT INTO batch_requests VALUES (?, ?, ?, ?, ?, 'pending', NULL, NULL, NULL)",
+                ((batch_id, idx, custom_id, model, json.dumps(params))
+                 for idx, (custom_id, model, params) in enumerate(requests))
+            )
+            self._conn.execute("COMMIT")
+        return self.get_batch(batch_id)
+
+    def _batch_object(self, row: Tuple) -> Dict[str, Any]:
+        batch_id, created_at, expires_at, ended_at, cancel_initiated_at, status = row
+        counts = {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+        for request_status, count in self._conn.execute(
+            "SELECT status, COUNT(*) FROM batch_requests WHERE batch_id = ? GROUP BY status", (batch_id,)
+        ):
+            counts[_COUNT_KEYS[request_status]] += count
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": status,
+            "request_counts": counts,
+            "ended_at": _iso(ended_at),
+            "created_at": _iso(created_at),
+            "expires_at": _iso(expires_at),
+            "archived_at": None,
+            "cancel_initiated_at": _iso(cancel_initiated_at),
+            "results_url": f"/v1/messages/batches/{batch_id}/results" if status == "ended" else None,
+        }
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            return self._batch_object(row) if row else None
+
+    def list_batches(self, limit: int = 20, after_id: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """Newest first; `after_id` pages past a previously returned batch"""
+        with self._lock:
+            query = "SELECT * FROM batches"
+            args: List[Any] = []
+            if after_id:
+                query += " WHERE created_at < (SELECT created_at FROM batches WHERE id = ?)"
+                args.append(after_id)
+            query += " ORDER BY created_at DESC LIMIT ?"
+            args.append(limit + 1)
+            rows = self._conn.execute(query, args).fetchall()
+            return [self._batch_object(row) for row in rows[:limit]], len(rows) > limit
+
+    def cancel_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            updated = self._conn.execute(
+                "UPDATE batches SET processing_status = 'canceling', cancel_initiated_at = ? "
+                "WHERE id = ? AND processing_status = 'in_progress'", (time.time(), batch_id)
+            ).rowcount
+            if updated:
+                self._conn.execute(
+                    "UPDATE batch_requests SET status = 'canceled', result = ? "
+                    "WHERE batch_id = ? AND status = 'pending'",
+                    (json.dumps({"type": "canceled"}), batch_id)
+                )
+                self._finish_if_done(batch_id)
+            self._conn.execute("COMMIT")
+        return self.get_batch(batch_id)
+
+    def delete_batch(self, batch_id: str) -> Optional[bool]:
+        """Delete an ended batch; None if it does not exist, False if still processing"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT processing_status FROM batches WHERE id = ?", (batch_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] != "ended":
+                return False
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM batch_requests WHERE batch_id = ?", (batch_id,))
+            self._conn.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
+            self._conn.execute("COMMIT")
+            return True
+
+    def _finish_if_done(self, batch_id: str) -> None:
+        remaining = self._conn.execute(
+            "SELECT COUNT(*) FROM batch_requests WHERE batch_id = ? AND status IN ('pending', 'running')",
+            (batch_id,)
+        ).fetchone()[0]
+        if remaining == 0:
+            self._conn.execute(
+                "UPDATE batches SET processing_status = 'ended', ended_at = ? "
+                "WHERE id = ? AND processing_status != 'ended'", (time.time(), batch_id)
+            )
+
+    def claim_next(self, busy_models: List[str], owner: str = "",
+                   lease_seconds: float = BATCH_LEASE_SECONDS) -> Optional[Tuple[str, int, str, Dict[str, Any]]]:
+        """Mark the oldest pending request whose model has capacity as running, leased to owner"""
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so no other process can claim the same row
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                query = (
+                    "SELECT r.batch_id, r.idx, r.model, r.params FROM batch_requests r "
+                    "JOIN batches b ON b.id = r.batch_id "
+                    "WHERE r.status = 'pending' AND b.processing_status = 'in_progress'"
+                )
+                if busy_models:
+                    query += f" AND r.model NOT IN ({','.join('?' * len(busy_models))})"
+                query += " ORDER BY b.created_at, r.idx LIMIT 1"
+                row = self._conn.execute(query, busy_models).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE batch_requests SET status = 'running', owner = ?, lease_expires = ? "
+                        "WHERE batch_id = ? AND idx = ? AND status = 'pending'",
+                        (owner, time.time() + lease_seconds, row[0], row[1])
+                    )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return (row[0], row[1], row[2], json.loads(row[3])) if row is not None else None
+
+    def complete_request(self, batch_id: str, idx: int, status: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "UPDATE batch_requests SET status = ?, result = ?, owner = NULL, lease_expires = NULL "
+                "WHERE batch_id = ? AND idx = ?",
+                (status, json.dumps(result), batch_id, idx)
+            )
+            self._finish_if_done(batch_id)
+            self._conn.execute("COMMIT")
+
+    def renew_leases(self, owner: str, lease_seconds: float = BATCH_LEASE_SECONDS) -> int:
+        """Extend the leases of the requests owner is still running"""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE batch_requests SET lease_expires = ? WHERE status = 'running' AND owner = ?",
+                (time.time() + lease_seconds, owner)
+            ).rowcount
+
+    def _return_running(self, condition: str, args: Tuple[Any, ...]) -> int:
+        """
+        Give up running requests matching condition: back to the queue, or
+        canceled when their batch was canceled meanwhile (nothing claims
+        requests of a canceling batch, so it would never end otherwise).
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            canceling = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT r.batch_id FROM batch_requests r JOIN batches b ON b.id = r.batch_id "
+                f"WHERE r.status = 'running' AND b.processing_status = 'canceling' AND {condition}", args
+            )]
+            for batch_id in canceling:
+                self._conn.execute(
+                    "UPDATE batch_requests SET status = 'canceled', result = ?, owner = NULL, lease_expires = NULL "
+                    f"WHERE batch_id = ? AND status = 'running' AND {condition}",
+                    (json.dumps({"type": "canceled"}), batch_id, *args)
+                )
+                self._finish_if_done(batch_id)
+            returned = self._conn.execute(
+                "UPDATE batch_requests SET status = 'pending', owner = NULL, lease_expires = NULL "
+                f"WHERE status = 'running' AND {condition}", args
+            ).rowcount
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return returned
+
+    def requeue_expired(self) -> int:
+        """Return running requests whose claimer stopped renewing (e.g. it crashed) to the queue"""
+        with self._lock:
+            return self._return_running("(lease_expires IS NULL OR lease_expires < ?)", (time.time(),))
+
+    def release(self, owner: str) -> int:
+        """Return owner's running requests to the queue, when it stops before finishing them"""
+        with self._lock:
+            return self._return_running("owner = ?", (owner,))
+
+    def expire_batches(self) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT id FROM batches WHERE processing_status = 'in_progress' AND expires_at < ?",
+                (time.time(),)
+            )]
+            for batch_id in expired:
+                self._conn.execute(
+                    "UPDATE batch_requests SET status = 'expired', result = ? "
+                    "WHERE batch_id = ? AND status = 'pending'",
+                    (json.dumps({"type": "expired"}), batch_id)
+                )
+                self._finish_if_done(batch_id)
+            self._conn.execute("COMMIT")
+
+    def result_page(self, batch_id: str, after_idx: int, page_size: int = 500) -> List[Tuple[int, str, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT idx, custom_id, result FROM batch_requests "
+                "WHERE batch_id = ? AND idx > ? AND result IS NOT NULL ORDER BY idx LIMIT ?",
+                (batch_id, after_idx, page_size)
+            ).fetchall()
+
+    def iter_results_jsonl(self, batch_id: str) -> Iterator[bytes]:
+        """Yield JSONL lines in request order, one page of rows at a time"""
+        after_idx = -1
+        while True:
+            rows = self.result_page(batch_id, after_idx)
+            if not rows:
+                return
+            yield "".join(
+                f'{{"custom_id": {json.dumps(custom_id)}, "result": {result}}}\n'
+                for _, custom_id, result in rows
+            ).encode("utf-8")
+            after_idx = rows[-1][0]
+
+
+# Interactive traffic tracking so batch work yields capacity to Claude Code users
+_interactive_in_flight = 0
+_last_interactive_at = 0.0
+
+
+def interactive_started() -> None:
+    global _interactive_in_flight, _last_interactive_at
+    _interactive_in_flight += 1
+    _last_interactive_at = time.monotonic()
+
+
+def interactive_finished() -> None:
+    global _interactive_in_flight, _last_interactive_at
+    _interactive_in_flight = max(0, _interactive_in_flight - 1)
+    _last_interactive_at = time.monotonic()
+
+
+def interactive_busy() -> bool:
+    return (_interactive_in_flight > 0
+            or time.monotonic() - _last_interactive_at < BATCH_INTERACTIVE_GRACE_SECONDS)
+
+
+def error_result(error_type: str, message: str) -> Dict[str, Any]:
+    return {"type": "errored", "error": {"type": "error", "error": {"type": error_type, "message": message}}}
+
+
+class BatchProcessor:
+    """
+    Background worker pool that drains pending batch requests.
+
+    Workers respect a per-model concurrency limit and idle while interactive
+    requests are in flight. Claimed requests are leased and the leases renewed
+    while they run; requests whose lease ran out, because the process running
+    them died, go back to the queue, so batches resume after a crash.
+    """
+
+    POLL_SECONDS = 1.0
+
+    def __init__(self, store: BatchStore, run_request: RequestRunner,
+                 error_type: Callable[[Exception], str],
+                 workers: int = BATCH_WORKERS, model_concurrency: int = BATCH_MODEL_CONCURRENCY):
+        self.store = store
+        self.run_request = run_request
+        self.error_type = error_type
+        self.workers = workers
+        self.model_concurrency = model_concurrency
+        self._running: Dict[str, int] = {}
+        self._tasks: List[asyncio.Task] = []
+        # Identifies this processor's leases among the processes sharing the database
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        # Claims are serialized so two workers cannot overshoot a model's limit
+        self._claim_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        await self._requeue_expired()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._renew_leases()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Only this processor's requests; other processes may still be running theirs
+        await asyncio.to_thread(self.store.release, self.owner)
+
+    async def _requeue_expired(self) -> None:
+        requeued = await asyncio.to_thread(self.store.requeue_expired)
+        if requeued:
+            logger.info(f"Resuming {requeued} batch requests whose worker stopped")
+
+    async def _renew_leases(self) -> None:
+        while True:
+            await asyncio.sleep(BATCH_LEASE_SECONDS / 3)
+            await asyncio.to_thread(self.store.renew_leases, self.owner)
+
+    def notify(self) -> None:
+        """Wake idle workers, e.g. after a batch was created"""
+        self._wakeup.set()
+
+    async def _idle(self) -> None:
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _worker(self) -> None:
+        while True:
+            if interactive_busy():
+                await asyncio.sleep(self.POLL_SECONDS / 4)
+                continue
+            async with self._claim_lock:
+                busy = [model for model, count in self._running.items() if count >= self.model_concurrency]
+                claimed = await asyncio.to_thread(self.store.claim_next, busy, self.owner)
+                if claimed is not None:
+                    batch_id, idx, model, params = claimed
+                    self._running[model] = self._running.get(model, 0) + 1
+            if claimed is None:
+                await asyncio.to_thread(self.store.expire_batches)
+                await self._requeue_expired()
+                await self._idle()
+                continue
+            try:
+                status, result = await self._run(params)
+                await asyncio.to_thread(self.store.complete_request, batch_id, idx, status, result)
+            finally:
+                self._running[model] -= 1
+
+    async def _run(self, params: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        try:
+            message = await self.run_request(params)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Batch request failed: {e}")
+            metrics.increment("batch.errored")
+            return "errored", error_result(self.error_type(e), str(e))
+        metrics.increment("batch.succeeded")
+        return "succeeded", {"type": "succeeded", "message": message}
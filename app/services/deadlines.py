@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, NamedTuple, Optional, TypeVar
+from app.config.settings import (
+    DEADLINE_CONNECT_SECONDS, DEADLINE_FIRST_TOKEN_SECONDS,
+    DEADLINE_IDLE_SECONDS, DEADLINE_TOTAL_SECONDS, MODEL_DEADLINES
+)
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Deadlines(NamedTuple):
+    """Per-request time limits in seconds (0 means no limit)"""
+    connect: float
+    first_token: float
+    idle: float
+    total: float
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an upstream call misses one of its deadlines"""
+
+    # Reported as a gateway timeout; see failover.is_retryable
+    status_code = 504
+
+    def __init__(self, cause: str, seconds: float, model: str):
+        super().__init__(f"Upstream {cause} deadline of {seconds:g}s exceeded for '{model}'")
+        self.cause = cause
+        self.seconds = seconds
+        self.model = model
+        # Connect and first-token timeouts happen before the client sees any
+        # output, so another backend can still take the request
+        self.retryable = cause in ("connect", "first_token")
+
+
+_DEFAULT_DEADLINES = Deadlines(
+    DEADLINE_CONNECT_SECONDS, DEADLINE_FIRST_TOKEN_SECONDS,
+    DEADLINE_IDLE_SECONDS, DEADLINE_TOTAL_SECONDS
+)
+
+
+def _parse_deadlines(value: str) -> Optional[Deadlines]:
+    try:
+        parts = [float(part) for part in value.split("/")]
+    except ValueError:
+        return None
+    if len(parts) != 4:
+        return None
+    return Deadlines(*parts)
+
+
+def get_deadlines(model: str) -> Deadlines:
+    """Get the deadlines for a model, with or without provider prefix"""
+    name = model.split("/", 1)[1] if "/" in model else model
+    value = MODEL_DEADLINES.get(name) or MODEL_DEADLINES.get(name.split(":", 1)[0])
+    if value:
+        parsed = _parse_deadlines(value)
+        if parsed:
+            return parsed
+        logger.warning(f"Ignoring malformed MODEL_DEADLINES entry for '{name}': {value}")
+    return _DEFAULT_DEADLINES
+
+
+async def run_with_deadline(awaitable: Awaitable[T], cause: str, limit: float,
+                            model: str, deadline_at: Optional[float] = None) -> T:
+    """Await something under a deadline, cancelling it when the deadline fires"""
+    timeout = limit if limit > 0 else None
+    if deadline_at is not None:
+        remaining = max(0.0, deadline_at - time.monotonic())
+        if timeout is None or remaining < timeout:
+            # What is left of the total deadline is the tighter limit
+            timeout, cause, limit = remaining, "total", get_deadlines(model).total
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        metrics.increment(f"timeout.{cause}")
+        logger.warning(f"Upstream {cause} deadline of {limit:g}s exceeded for '{model}'")
+        raise DeadlineExceeded(cause, limit, model) from None
+
+
+class DeadlineStream:
+    """
+    Wraps an upstream chunk stream and enforces first-token, idle and total deadlines.
+
+    A missed deadline cancels the pending read, closes the upstream stream and
+    raises DeadlineExceeded to the consumer.
+    """
+
+    def __init__(self, stream: Any, model: str, deadlines: Deadlines, started: float):
+        self.stream = stream
+        self.model = model
+        self.deadlines = deadlines
+        self.deadline_at = started + deadlines.total if deadlines.total > 0 else None
+        self.received = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        if self.received == 0:
+            cause, limit = "first_token", self.deadlines.first_token
+        else:
+            cause, limit = "idle", self.deadlines.idle
+        try:
+            chunk = await run_with_deadline(self.stream.__anext__(), cause, limit,
+                                            self.model, self.deadline_at)
+        except DeadlineExceeded:
+            await self.aclose()
+            raise
+        self.received += 1
+        return chunk
+
+    async def aclose(self) -> None:
+        aclose = getattr(self.stream, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception as e:
+                logger.debug(f"Error closing timed out upstream stream: {e}")
+
+
+async def open_stream_with_deadlines(open_call: Awaitable[Any], model: str) -> DeadlineStream:
+    """Open an upstream stream under the connect deadline and wrap it"""
+    deadlines = get_deadlines(model)
+    started = time.monotonic()
+    deadline_at = started + deadlines.total if deadlines.total > 0 else None
+    stream = await run_with_deadline(open_call, "connect", deadlines.connect, model, deadline_at)
+    return DeadlineStream(stream, model, deadlines, started)
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, TypeVar
+from app.config.settings import (
+    OLLAMA_API_BASES, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS,
+    RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY_MS, RETRY_MAX_DELAY_MS, FAILOVER_MODELS
+)
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Backend(NamedTuple):
+    """One entry of a failover chain: a model served by a specific host"""
+    model: str
+    api_base: str
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised when every backend in the failover chain failed or is open"""
+
+    def __init__(self, message: str, last_error: Optional[BaseException] = None):
+        super().__init__(message)
+        self.last_error = last_error
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker for one upstream host.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are rejected without touching the network. Once `reset_seconds` have passed
+    a single trial call is let through (half-open); its outcome closes or
+    re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+            self.trial_in_flight = False
+        if self.state == self.HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                metrics.increment(f"circuit.opened.{self.name}")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(api_base: str) -> CircuitBreaker:
+    breaker = _breakers.get(api_base)
+    if breaker is None:
+        breaker = _breakers[api_base] = CircuitBreaker(api_base)
+    return breaker
+
+
+def breaker_states() -> Dict[str, str]:
+    return {name: breaker.state for name, breaker in _breakers.items()}
+
+
+def _with_provider(model: str) -> str:
+    return model if "/" in model else f"ollama/{model}"
+
+
+def failover_chain(model: str, preferred_api_base: Optional[str] = None) -> List[Backend]:
+    """The requested model on every host, then each fallback model on every host"""
+    api_bases = list(OLLAMA_API_BASES)
+    if preferred_api_base in api_bases:
+        # e.g. the host already holding this session's cached prompt prefix
+        api_bases.remove(preferred_api_base)
+        api_bases.insert(0, preferred_api_base)
+    chain = [Backend(model, api_base) for api_base in api_bases]
+    for fallback in FAILOVER_MODELS:
+        fallback_model = _with_provider(fallback)
+        if fallback_model != model:
+            chain.extend(Backend(fallback_model, api_base) for api_base in OLLAMA_API_BASES)
+    return chain
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Connection problems, timeouts, overload and 5xx are worth another backend"""
+    if getattr(error, "retryable", None) is False:
+        return False
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code >= 500 or status_code in (408, 429)
+    return isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError, OSError))
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff in seconds"""
+    cap = min(RETRY_MAX_DELAY_MS, RETRY_BASE_DELAY_MS * (2 ** attempt))
+    return random.uniform(0, cap) / 1000.0
+
+
+async def call_with_failover(model: str, call: Callable[[Backend, List[Backend]], Awaitable[T]],
+                             preferred_api_base: Optional[str] = None) -> T:
+    """
+    Run `call` against the failover chain for `model` until one backend succeeds.
+
+    `call` receives the backend to use and the remaining healthy backends (which
+    hedged streams may race against). It must return before anything has been
+    sent to the client, so retrying it is always safe. Non-retryable errors
+    (e.g. a 400 from the backend) are raised immediately. `preferred_api_base`
+    moves one host to the front of the chain.
+    """
+    last_error: Optional[BaseException] = None
+    chain = failover_chain(model, preferred_api_base)
+    for attempt in range(RETRY_MAX_ATTEMPTS + 1):
+        if attempt > 0:
+            metrics.increment("retry.attempts")
+            await asyncio.sleep(backoff_delay(attempt - 1))
+        tried = 0
+        for index, backend in enumerate(chain):
+            breaker = get_breaker(backend.api_base)
+            if not breaker.allow():
+                continue
+            if tried > 0 or index > 0:
+                metrics.increment("failover.attempts")
+                logger.info(f"Failing over to {backend.model} on {backend.api_base}")
+            tried += 1
+            alternates = [b for b in chain[index + 1:]
+                          if get_breaker(b.api_base).state == CircuitBreaker.CLOSED]
+            try:
+                result = await call(backend, alternates)
+            except asyncio.CancelledError:
+                breaker.trial_in_flight = False
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    if getattr(e, "status_code", 500) < 500:
+                        breaker.record_success() # The host answered, the request itself was bad
+                    else:
+                        breaker.trial_in_flight = False
+                    raise
+                breaker.record_failure()
+                last_error = e
+                logger.warning(f"Upstream {backend.model} on {backend.api_base} failed: {e}")
+                continue
+            breaker.record_success()
+            return result
+        if tried == 0:
+            # Every circuit is open: fail fast instead of queueing doomed work
+            break
+    metrics.increment("failover.exhausted")
+    raise UpstreamUnavailableError(
+        f"All upstream backends for '{model}' failed or are unavailable"
+        + (f": {last_error}" if last_error else ""),
+        last_error
+    )
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from app.config.settings import (
+    HEDGE_ENABLED, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES,
+    HEDGE_DEFAULT_DELAY_MS, HEDGE_MIN_DELAY_MS, HEDGE_MAX_RATIO
+)
+from app.services import metrics
+from app.services.failover import Backend, get_breaker, is_retryable
+
+logger = logging.getLogger(__name__)
+
+# Opens an upstream stream against the given backend
+StreamOpener = Callable[[Backend], Awaitable[Any]]
+
+
+class HedgeBudget:
+    """
+    Caps hedging to a fraction of requests.
+
+    Every request earns `ratio` tokens and every hedge spends one, so during an
+    overload where every request is slow at most `ratio` extra load is added.
+    """
+
+    def __init__(self, ratio: float, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def on_request(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+_budget = HedgeBudget(HEDGE_MAX_RATIO)
+
+
+def on_request() -> None:
+    """Count one client request towards the hedge budget (not once per failover attempt)"""
+    _budget.on_request()
+
+
+def ttft_metric(model: str) -> str:
+    return f"ttft_seconds.{model}"
+
+
+def hedge_delay(model: str) -> float:
+    """Seconds to wait for a first token before hedging a request for this model"""
+    metric = ttft_metric(model)
+    if metrics.sample_count(metric) < HEDGE_MIN_SAMPLES:
+        delay_ms = HEDGE_DEFAULT_DELAY_MS
+    else:
+        delay_ms = metrics.percentile(metric, HEDGE_PERCENTILE) * 1000
+    return max(delay_ms, HEDGE_MIN_DELAY_MS) / 1000.0
+
+
+async def _close_stream(stream: Any) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is None:
+        return
+    try:
+        await aclose()
+    except Exception as e:
+        logger.debug(f"Error closing abandoned upstream stream: {e}")
+
+
+async def _open_and_read_first(opener: StreamOpener, backend: Backend) -> Tuple[Any, Any]:
+    """Open a stream and wait for its first chunk"""
+    stream = await opener(backend)
+    try:
+        first_chunk = await stream.__anext__()
+    except StopAsyncIteration:
+        return stream, None
+    except BaseException:
+        await _close_stream(stream)
+        raise
+    return stream, first_chunk
+
+
+async def _discard(task: "asyncio.Task") -> None:
+    """Cancel a losing attempt and close its stream if it already opened one"""
+    if not task.done():
+        task.cancel()
+    try:
+        stream, _ = await task
+    except BaseException:
+        return
+    await _close_stream(stream)
+
+
+def _record_hedge_outcome(backend: Backend, error: Optional[BaseException]) -> None:
+    """Report a hedge attempt to its host's circuit breaker, as call_with_failover does for the primary"""
+    breaker = get_breaker(backend.api_base)
+    if error is None:
+        breaker.record_success()
+    elif is_retryable(error):
+        breaker.record_failure()
+        logger.warning(f"Hedge to {backend.model} on {backend.api_base} failed: {error}")
+    elif getattr(error, "status_code", 500) < 500:
+        breaker.record_success()  # The host answered, the request itself was bad
+
+
+async def _race(model: str, opener: StreamOpener, backends: List[Backend]) -> Tuple[Any, Any]:
+    """Start on the primary backend, hedge to the next one if the first token is late"""
+    started = time.monotonic()
+    if len(backends) < 2:
+        result = await _open_and_read_first(opener, backends[0])
+        metrics.observe(ttft_metric(model), time.monotonic() - started)
+        return result
+
+    primary = asyncio.ensure_future(_open_and_read_first(opener, backends[0]))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_delay(model))
+    if done or not _budget.try_spend():
+        if not done:
+            metrics.increment("hedge.skipped")
+        result = await primary
+        metrics.observe(ttft_metric(model), time.monotonic() - started)
+        return result
+
+    logger.info(f"No first token from {backends[0]} for '{model}' after "
+                f"{time.monotonic() - started:.2f}s, hedging to {backends[1]}")
+    metrics.increment("hedge.sent")
+    hedge = asyncio.ensure_future(_open_and_read_first(opener, backends[1]))
+    pending = {primary, hedge}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if hedge in done:
+                _record_hedge_outcome(backends[1], hedge.exception())
+            succeeded = [task for task in (primary, hedge) if task in done and task.exception() is None]
+            if not succeeded:
+                error = next(iter(done)).exception()
+                continue
+            winner = succeeded[0]
+            # Both may finish in the same step; the other opened stream must be closed too
+            for loser in (done | pending) - {winner}:
+                await _discard(loser)
+            pending = set()
+            # A hedge "wins" when the second backend produced the first token
+            metrics.increment("hedge.won" if winner is hedge else "hedge.lost")
+            metrics.observe(ttft_metric(model), time.monotonic() - started)
+            return winner.result()
+    except asyncio.CancelledError:
+        for task in (primary, hedge):
+            await _discard(task)
+        raise
+    raise error
+
+
+async def _iterate(stream: Any, first_chunk: Any) -> AsyncIterator[Any]:
+    try:
+        if first_chunk is None:
+            return
+        yield first_chunk
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await _close_stream(stream)
+
+
+async def open_hedged_stream(model: str, opener: StreamOpener, backends: List[Backend]) -> AsyncIterator[Any]:
+    """
+    Open a streaming completion, hedging across backends, and return its chunks.
+
+    The first chunk is awaited here, so upstream failures surface before any
+    byte is sent to the client. When hedging is disabled or there is only one
+    backend this is a plain pass-through that still records time-to-first-token.
+    Failover may call this several times for one client request, so callers
+    count the request with on_request() once, before failing over.
+    """
+    if not HEDGE_ENABLED:
+        backends = backends[:1]
+    stream, first_chunk = await _race(model, opener, backends)
+    return _iterate(stream, first_chunk)
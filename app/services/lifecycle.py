@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Lifecycle:
+    """
+    In-flight /v1/messages requests, and whether the server is draining.
+
+    A draining server takes no new connections (the server stops listening)
+    but lets the requests in flight, long streams included, run to completion
+    so a restart cuts nobody off. /health answers 503 while draining so load
+    balancers move traffic elsewhere. A request counts as in flight until its
+    stream has been fully sent.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.in_flight = 0
+        self._drain_started: Optional[float] = None
+
+    def request_started(self) -> None:
+        self.in_flight += 1
+
+    def request_finished(self) -> None:
+        self.in_flight = max(0, self.in_flight - 1)
+
+    def begin_drain(self) -> None:
+        if self.draining:
+            return
+        self.draining = True
+        self._drain_started = time.monotonic()
+        metrics.increment("lifecycle.drains")
+        logger.info(f"Draining: no new requests, waiting for {self.in_flight} in flight")
+
+    async def wait_idle(self, timeout: float, poll: float = 0.1) -> bool:
+        """Wait up to timeout seconds for in-flight requests to finish; whether they all did"""
+        deadline = time.monotonic() + timeout
+        while self.in_flight > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(poll)
+        if self.in_flight > 0:
+            logger.warning(f"Drain deadline passed with {self.in_flight} request(s) still in flight")
+            return False
+        return True
+
+    def state(self) -> Dict[str, Any]:
+        state = {"draining": self.draining, "in_flight": self.in_flight}
+        if self._drain_started is not None:
+            state["draining_seconds"] = round(time.monotonic() - self._drain_started, 1)
+        return state
+
+
+lifecycle = Lifecycle()
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any
+from app.config.settings import OLLAMA_API_BASE, LITELLM_VERBOSE, REPLAY_PATH
+from app.services import metrics
+from app.services.recording import get_replay_backend
+
+logger = logging.getLogger(__name__)
+
+# Importing LiteLLM takes seconds, so it happens on first use rather than when
+# the server module is imported
+_litellm: Any = None
+_import_lock = threading.Lock()
+
+
+def get_litellm() -> Any:
+    """Import and configure LiteLLM on first use"""
+    global _litellm
+    if _litellm is not None:
+        return _litellm
+    with _import_lock:
+        if _litellm is None:
+            # Use the model cost map bundled with the package instead of fetching it
+            os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+            started = time.perf_counter()
+            import litellm
+            litellm.ollama_api_base = OLLAMA_API_BASE
+            litellm.set_verbose = LITELLM_VERBOSE
+            elapsed = time.perf_counter() - started
+            metrics.observe("startup.litellm_import_seconds", elapsed)
+            logger.info(f"Loaded LiteLLM in {elapsed:.2f}s")
+            _litellm = litellm
+    return _litellm
+
+
+def is_loaded() -> bool:
+    return _litellm is not None
+
+
+async def warm_up() -> None:
+    """Import LiteLLM off the event loop; requests arriving meanwhile wait on the same import"""
+    if _litellm is not None or REPLAY_PATH:
+        # Replayed traffic never reaches LiteLLM
+        return
+    try:
+        await asyncio.to_thread(get_litellm)
+    except Exception as e:
+        # get_litellm retries on the first request and raises there
+        logger.warning(f"Could not load LiteLLM in the background: {e}")
+
+
+async def acompletion(**kwargs: Any) -> Any:
+    """litellm.acompletion, importing LiteLLM if needed (or the replay backend when configured)"""
+    replay = get_replay_backend()
+    if replay is not None:
+        return await replay.acompletion(**kwargs)
+    return await get_litellm().acompletion(**kwargs)
+
+
+def token_counter(**kwargs: Any) -> int:
+    """litellm.token_counter, importing LiteLLM if needed"""
+    return get_litellm().token_counter(**kwargs)
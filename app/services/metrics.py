@@ -0,0 +1,54 @@
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict
+
+# Number of recent observations kept per metric for percentiles
+_WINDOW_SIZE = 512
+
+_counters: Dict[str, int] = defaultdict(int)
+_observations: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=_WINDOW_SIZE))
+_started_at = time.time()
+
+
+def increment(name: str, amount: int = 1) -> None:
+    """Increment a named counter"""
+    _counters[name] += amount
+
+
+def observe(name: str, value: float) -> None:
+    """Record one observation (e.g. a latency in seconds) for a named metric"""
+    _observations[name].append(value)
+
+
+def percentile(name: str, pct: float) -> float:
+    """Get a percentile of the recent observations of a metric (0.0 if none)"""
+    values = _observations.get(name)
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def sample_count(name: str) -> int:
+    values = _observations.get(name)
+    return len(values) if values else 0
+
+
+def snapshot() -> Dict[str, Any]:
+    """Get all counters and a percentile summary of every observed metric"""
+    summaries = {}
+    for name, values in _observations.items():
+        if not values:
+            continue
+        summaries[name] = {
+            "count": len(values),
+            "p50": percentile(name, 50),
+            "p95": percentile(name, 95),
+            "max": max(values),
+        }
+    return {
+        "uptime_seconds": round(time.time() - _started_at, 1),
+        "counters": dict(_counters),
+        "observations": summaries,
+    }
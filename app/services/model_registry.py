@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+from app.config.settings import OLLAMA_API_BASES, MODEL_REGISTRY_REFRESH_SECONDS
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+_PROVIDER_PREFIXES = ("ollama", "ollama_chat")
+
+
+class ModelCapabilities(NamedTuple):
+    name: str                      # Ollama model name with tag, e.g. "qwen2.5-coder:7b"
+    api_base: str                  # First host the model was found on
+    context_length: Optional[int]  # Trained context window from the GGUF metadata
+    tools: bool
+    vision: bool
+    quantization: Optional[str]    # e.g. "Q4_K_M"
+    parameter_size: Optional[str]  # e.g. "7.6B"
+    size: int                      # Bytes on disk
+    digest: str
+
+
+def parse_show(name: str, api_base: str, tag: Dict[str, Any], show: Dict[str, Any]) -> ModelCapabilities:
+    """Build capabilities from an /api/tags entry and the model's /api/show response"""
+    details = show.get("details") or tag.get("details") or {}
+    model_info = show.get("model_info") or {}
+    context_length = None
+    for key, value in model_info.items():
+        if key.endswith(".context_length") and isinstance(value, int):
+            context_length = value
+            break
+    capabilities = show.get("capabilities")
+    if capabilities is not None:
+        tools = "tools" in capabilities
+        vision = "vision" in capabilities
+    else:
+        # Older Ollama releases: the chat template mentions tools, vision models have a projector
+        tools = ".Tools" in (show.get("template") or "")
+        families = details.get("families") or []
+        vision = bool(show.get("projector_info")) or any(f in ("clip", "mllama") for f in families)
+    return ModelCapabilities(
+        name=name, api_base=api_base, context_length=context_length, tools=tools, vision=vision,
+        quantization=details.get("quantization_level"), parameter_size=details.get("parameter_size"),
+        size=tag.get("size", 0), digest=tag.get("digest", ""),
+    )
+
+
+class ModelRegistry:
+    """
+    Capabilities of the models installed on the Ollama hosts.
+
+    Discovered from /api/tags and /api/show and refreshed in the background;
+    /api/show is only called again for models whose digest changed. Lookups are
+    single dict reads against an index that is swapped in whole after each
+    refresh, so request handling never waits on Ollama. A host that does not
+    answer keeps the models last seen on it until it answers again.
+    """
+
+    def __init__(self, api_bases: Optional[List[str]] = None,
+                 refresh_seconds: float = MODEL_REGISTRY_REFRESH_SECONDS):
+        self.api_bases = api_bases if api_bases is not None else OLLAMA_API_BASES
+        self.refresh_seconds = refresh_seconds
+        self.models: Dict[str, ModelCapabilities] = {}
+        self.refreshed_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def lookup(self, model: str) -> Optional[ModelCapabilities]:
+        """Capabilities of a model, with or without provider prefix or ":latest" tag"""
+        if "/" in model:
+            prefix, name = model.split("/", 1)
+            if prefix not in _PROVIDER_PREFIXES:
+                return None
+        else:
+            name = model
+        return self.models.get(name)
+
+    def supports_tools(self, model: str) -> Optional[bool]:
+        """Whether a model supports tool calls, or None if the registry doesn't know it"""
+        capabilities = self.lookup(model)
+        return capabilities.tools if capabilities is not None else None
+
+    def supports_vision(self, model: str) -> Optional[bool]:
+        capabilities = self.lookup(model)
+        return capabilities.vision if capabilities is not None else None
+
+    def context_length(self, model: str) -> Optional[int]:
+        capabilities = self.lookup(model)
+        return capabilities.context_length if capabilities is not None else None
+
+    async def refresh(self, client: Any = None) -> None:
+        """Rediscover the models on every host"""
+        import httpx
+
+        owns_client = client is None
+        if owns_client:
+            client = httpx.AsyncClient(timeout=10.0)
+        started = time.perf_counter()
+        models: Dict[str, ModelCapabilities] = {}
+        unreachable: List[str] = []
+        try:
+            for api_base in self.api_bases:
+                try:
+                    response = await client.get(f"{api_base}/api/tags")
+                    response.raise_for_status()
+                    tags = response.json().get("models") or []
+                except (httpx.HTTPError, ValueError) as e:
+                    logger.debug(f"Could not list models on {api_base}: {e}")
+                    unreachable.append(api_base)
+                    continue
+                for tag in tags:
+                    name = tag.get("name") or tag.get("model")
+                    if not name or name in models:
+                        continue
+                    known = self.models.get(name)
+                    if known is not None and known.digest == tag.get("digest") and known.api_base == api_base:
+                        models[name] = known
+                        continue
+                    try:
+                        response = await client.post(f"{api_base}/api/show", json={"model": name})
+                        response.raise_for_status()
+                        show = response.json()
+                    except (httpx.HTTPError, ValueError) as e:
+                        logger.debug(f"Could not inspect {name} on {api_base}: {e}")
+                        if known is not None:
+                            models[name] = known
+                        continue
+                    models[name] = parse_show(name, api_base, tag, show)
+        finally:
+            if owns_client:
+                await client.aclose()
+        # A timeout or restart must not make a host's models look uninstalled
+        for name, known in self.models.items():
+            if name == known.name and known.api_base in unreachable:
+                models.setdefault(name, known)
+        # Index untagged names too, as Ollama treats "llama3" as "llama3:latest"
+        for name, capabilities in list(models.items()):
+            if name.endswith(":latest"):
+                models.setdefault(name[:-len(":latest")], capabilities)
+        added = sorted(set(models) - set(self.models))
+        self.models = models
+        self.refreshed_at = time.time()
+        metrics.observe("model_registry.refresh_seconds", time.perf_counter() - started)
+        if added:
+            logger.info(f"Model registry: {len(models)} models known, new: {', '.join(added)}")
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Model registry refresh failed: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: c._asdict() for name, c in self.models.items() if name == c.name}
+
+
+registry = ModelRegistry()
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+from app.config.settings import PROMPT_CACHE_MAX_SESSIONS
+from app.utils.context_window import estimate_message_tokens
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBreakpoint(NamedTuple):
+    """The prompt prefix ending at a cache_control block"""
+    prefix_hash: str
+    tokens: int
+
+
+class CachePlan(NamedTuple):
+    """What the proxy expects the backend to reuse for one request"""
+    session: str
+    model: str
+    breakpoints: List[CacheBreakpoint]
+    # Estimated tokens of the longest breakpoint prefix this session already sent
+    warm_tokens: int
+    # Estimated tokens of the whole prompt
+    prompt_tokens: int
+    # Host that served the warm prefix, preferred so its KV cache is reused
+    api_base: Optional[str]
+
+
+class _SessionState(NamedTuple):
+    model: str
+    api_base: str
+    prefixes: Dict[str, int]
+
+
+def compute_breakpoints(messages: List[Dict[str, Any]],
+                        marked: List[Dict[str, Any]]) -> List[CacheBreakpoint]:
+    """
+    Hash the prompt prefix ending at every marked message.
+
+    `marked` holds the message dicts that carried cache_control. Messages that
+    were rewritten or dropped while fitting the context are no longer in
+    `messages`, so their breakpoints disappear with them.
+    """
+    marked_ids = {id(message) for message in marked}
+    digest = hashlib.sha256()
+    tokens = 0
+    breakpoints = []
+    for message in messages:
+        digest.update(json.dumps(message, sort_keys=True, default=str).encode("utf-8"))
+        tokens += estimate_message_tokens(message)
+        if id(message) in marked_ids:
+            breakpoints.append(CacheBreakpoint(digest.hexdigest(), tokens))
+    return breakpoints
+
+
+class PromptCacheTracker:
+    """
+    Remembers which breakpoint prefixes each session last sent, and where.
+
+    Ollama keeps the KV cache of the previous prompt in a model slot and only
+    evaluates the part after the longest common prefix. A session's next request
+    is therefore warm up to the longest breakpoint prefix it shares with the last
+    request, provided it goes to the same host and model.
+    """
+
+    def __init__(self, max_sessions: int = PROMPT_CACHE_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionState]" = OrderedDict()
+
+    def plan(self, session: str, model: str, messages: List[Dict[str, Any]],
+             marked: List[Dict[str, Any]]) -> CachePlan:
+        breakpoints = compute_breakpoints(messages, marked)
+        prompt_tokens = sum(estimate_message_tokens(message) for message in messages)
+        state = self._sessions.get(session)
+        warm_tokens = 0
+        if state is not None and state.model == model:
+            self._sessions.move_to_end(session)
+            warm_tokens = max(
+                (bp.tokens for bp in breakpoints if bp.prefix_hash in state.prefixes),
+                default=0
+            )
+        api_base = state.api_base if warm_tokens else None
+        return CachePlan(session, model, breakpoints, warm_tokens, prompt_tokens, api_base)
+
+    def record(self, plan: CachePlan, model: str, api_base: str) -> None:
+        """Remember the prefixes of a request once a backend has accepted it"""
+        if not plan.breakpoints:
+            return
+        # Only the latest prompt stays cached upstream, so replace, don't merge
+        self._sessions[plan.session] = _SessionState(
+            model, api_base, {bp.prefix_hash: bp.tokens for bp in plan.breakpoints}
+        )
+        self._sessions.move_to_end(plan.session)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+
+def cache_usage(plan: Optional[CachePlan], prompt_tokens: int) -> Dict[str, int]:
+    """
+    Split the backend's prompt token count into Anthropic usage fields.
+
+    Ollama reports prompt_eval_count (LiteLLM's prompt_tokens) for the tokens it
+    actually evaluated, so tokens missing from it relative to the full prompt were
+    read from the KV cache. Reads are capped at the warm prefix this session is
+    known to share; the rest of the newest breakpoint prefix counts as written.
+    """
+    prompt_tokens = prompt_tokens or 0
+    if plan is None or not plan.breakpoints or prompt_tokens <= 0:
+        # Nothing to split, or the backend did not report a count to measure against
+        return {"input_tokens": prompt_tokens,
+                "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+    cache_read = 0
+    if plan.warm_tokens:
+        cache_read = min(plan.warm_tokens, max(0, plan.prompt_tokens - prompt_tokens))
+    newest_prefix = max(bp.tokens for bp in plan.breakpoints)
+    cache_creation = min(max(0, newest_prefix - plan.warm_tokens), prompt_tokens)
+    metrics.increment("prompt_cache.read_tokens", cache_read)
+    metrics.increment("prompt_cache.creation_tokens", cache_creation)
+    return {
+        "input_tokens": prompt_tokens - cache_creation,
+        "cache_creation_input_tokens": cache_creation,
+        "cache_read_input_tokens": cache_read,
+    }
@@ -0,0 +1,292 @@
+import asyncio
+import glob
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+from app.config.settings import (
+    RATE_LIMIT_REQUESTS_PER_SECOND, RATE_LIMIT_REQUEST_BURST,
+    RATE_LIMIT_INPUT_TOKENS_PER_MINUTE, RATE_LIMIT_OUTPUT_TOKENS_PER_MINUTE,
+    RATE_LIMIT_SNAPSHOT_PATH, RATE_LIMIT_SNAPSHOT_SECONDS, RATE_LIMIT_IDLE_SECONDS
+)
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rough bytes of JSON request body per prompt token
+BODY_BYTES_PER_TOKEN = 4
+
+
+def estimate_body_tokens(body_bytes: int) -> int:
+    """Prompt tokens for a request body, estimated before it is converted"""
+    return body_bytes // BODY_BYTES_PER_TOKEN
+
+
+def worker_snapshot_path(path: str, pid: int) -> str:
+    """The snapshot file of one worker process, e.g. rate_limits.1234.json"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{pid}{ext}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RateLimitExceeded(Exception):
+    """A client is over one of its limits; retry_after is in seconds"""
+
+    def __init__(self, client: str, limit: str, retry_after: float):
+        self.client = client
+        self.limit = limit
+        self.retry_after = retry_after
+        super().__init__(f"Rate limit exceeded for {limit}; retry after {math.ceil(retry_after)}s")
+
+
+class TokenBucket:
+    """
+    Refills continuously at `rate` per second up to `capacity`.
+
+    The level may go negative: output tokens are only known after a response,
+    so they are charged as debt that has to refill before the next request.
+    """
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (requests larger than the bucket wait for a full bucket)"""
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+
+class ClientLedger:
+    """Buckets and usage totals for one client"""
+
+    def __init__(self, buckets: Dict[str, TokenBucket]):
+        self.buckets = buckets
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.rejected = 0
+        self.last_seen = 0.0
+
+
+class RateLimiter:
+    """
+    Per-client request and token limits, checked before a request is dispatched.
+
+    Everything is kept in memory of one process, so with several workers each
+    enforces the limits on its own: a client spread over N workers gets up to
+    N times the configured rates. A background task snapshots the ledger to a
+    per-process JSON file, and on startup a worker takes over the files of
+    processes that are gone, so totals and bucket levels survive a restart.
+    Clients idle for RATE_LIMIT_IDLE_SECONDS with full buckets are forgotten.
+    """
+
+    def __init__(self, requests_per_second: float = RATE_LIMIT_REQUESTS_PER_SECOND,
+                 request_burst: int = RATE_LIMIT_REQUEST_BURST,
+                 input_tokens_per_minute: int = RATE_LIMIT_INPUT_TOKENS_PER_MINUTE,
+                 output_tokens_per_minute: int = RATE_LIMIT_OUTPUT_TOKENS_PER_MINUTE,
+                 snapshot_path: str = RATE_LIMIT_SNAPSHOT_PATH,
+                 clock: Callable[[], float] = time.monotonic,
+                 idle_seconds: float = RATE_LIMIT_IDLE_SECONDS):
+        # (capacity, refill per second) for each enabled limit
+        self.limits: Dict[str, tuple] = {}
+        if requests_per_second > 0:
+            self.limits["requests"] = (max(1, request_burst), requests_per_second)
+        if input_tokens_per_minute > 0:
+            self.limits["input_tokens"] = (input_tokens_per_minute, input_tokens_per_minute / 60.0)
+        if output_tokens_per_minute > 0:
+            self.limits["output_tokens"] = (output_tokens_per_minute, output_tokens_per_minute / 60.0)
+        self.snapshot_path = snapshot_path
+        self.worker_path = worker_snapshot_path(snapshot_path, os.getpid())
+        self.clock = clock
+        self.idle_seconds = idle_seconds
+        self.clients: Dict[str, ClientLedger] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _ledger(self, client: str) -> ClientLedger:
+        ledger = self.clients.get(client)
+        now = self.clock()
+        if ledger is None:
+            ledger = ClientLedger({name: TokenBucket(capacity, rate, now)
+                                   for name, (capacity, rate) in self.limits.items()})
+            self.clients[client] = ledger
+        ledger.last_seen = now
+        return ledger
+
+    def evict_idle(self) -> int:
+        """Forget clients idle for idle_seconds whose buckets have refilled; how many were dropped"""
+        if self.idle_seconds <= 0:
+            return 0
+        now = self.clock()
+        idle = []
+        for client, ledger in self.clients.items():
+            if now - ledger.last_seen < self.idle_seconds:
+                continue
+            for bucket in ledger.buckets.values():
+                bucket.refill(now)
+            if all(bucket.level >= bucket.capacity for bucket in ledger.buckets.values()):
+                idle.append(client)
+        for client in idle:
+            del self.clients[client]
+        if idle:
+            metrics.increment("rate_limit.evicted", len(idle))
+        return len(idle)
+
+    def acquire(self, client: str, input_tokens: int) -> None:
+        """Admit one request with an estimated prompt size, or raise RateLimitExceeded"""
+        ledger = self._ledger(client)
+        now = self.clock()
+        # Output tokens are charged afterwards, so only a bucket in debt blocks
+        wanted = {"requests": 1, "input_tokens": input_tokens, "output_tokens": 0}
+        limit, retry_after = None, 0.0
+        for name, bucket in ledger.buckets.items():
+            bucket.refill(now)
+            wait = bucket.wait_time(wanted[name])
+            if wait > retry_after:
+                limit, retry_after = name, wait
+        if limit is not None:
+            ledger.rejected += 1
+            metrics.increment(f"rate_limit.rejected.{limit}")
+            raise RateLimitExceeded(client, limit, retry_after)
+        for name in ("requests", "input_tokens"):
+            if name in ledger.buckets:
+                ledger.buckets[name].take(wanted[name])
+        ledger.requests += 1
+        ledger.input_tokens += input_tokens
+
+    def record_output(self, client: str, output_tokens: int) -> None:
+        """Charge the output tokens of a finished response"""
+        ledger = self._ledger(client)
+        bucket = ledger.buckets.get("output_tokens")
+        if bucket is not None:
+            bucket.refill(self.clock())
+            bucket.take(output_tokens)
+        ledger.output_tokens += output_tokens
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = self.clock()
+        clients = {}
+        for client, ledger in self.clients.items():
+            levels = {}
+            for name, bucket in ledger.buckets.items():
+                bucket.refill(now)
+                levels[name] = round(bucket.level, 3)
+            clients[client] = {
+                "requests": ledger.requests, "input_tokens": ledger.input_tokens,
+                "output_tokens": ledger.output_tokens, "rejected": ledger.rejected, "levels": levels,
+            }
+        return {"saved_at": time.time(), "clients": clients}
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        """
+        Merge a snapshot in; buckets refill for the time since it was saved.
+
+        Totals add up and the lower bucket level wins, so several snapshots
+        of the same client can be restored one after another.
+        """
+        elapsed = max(0.0, time.time() - snapshot.get("saved_at", time.time()))
+        for client, data in snapshot.get("clients", {}).items():
+            ledger = self._ledger(client)
+            ledger.requests += data.get("requests", 0)
+            ledger.input_tokens += data.get("input_tokens", 0)
+            ledger.output_tokens += data.get("output_tokens", 0)
+            ledger.rejected += data.get("rejected", 0)
+            for name, level in data.get("levels", {}).items():
+                bucket = ledger.buckets.get(name)
+                if bucket is not None:
+                    bucket.level = min(bucket.level, level + elapsed * bucket.rate)
+
+    def save(self, snapshot: Optional[Dict[str, Any]] = None) -> None:
+        snapshot = snapshot if snapshot is not None else self.snapshot()
+        temporary = f"{self.worker_path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(temporary, self.worker_path)
+
+    def _orphaned_snapshots(self) -> List[str]:
+        """Snapshot files no running worker is writing: this pid's (left by an earlier process) or dead pids'"""
+        root, ext = os.path.splitext(self.snapshot_path)
+        # A single snapshot_path file is what older versions wrote
+        paths = [self.snapshot_path]
+        for path in glob.glob(f"{glob.escape(root)}.*{glob.escape(ext)}"):
+            pid = path[len(root) + 1:len(path) - len(ext)]
+            if pid.isdigit() and (int(pid) == os.getpid() or not _pid_alive(int(pid))):
+                paths.append(path)
+        return paths
+
+    def load(self) -> None:
+        """Take over the ledgers of earlier and dead workers"""
+        claimed = []
+        for path in self._orphaned_snapshots():
+            claim = f"{path}.{os.getpid()}.loading"
+            try:
+                # Only one of several starting workers wins the rename
+                os.rename(path, claim)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"Could not claim rate limit ledger {path}: {e}")
+                continue
+            claimed.append(claim)
+            try:
+                with open(claim) as f:
+                    self.restore(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not load rate limit ledger {path}: {e}")
+        if not claimed:
+            return
+        try:
+            # Saved under this worker before the claimed files go away
+            self.save()
+            for claim in claimed:
+                os.remove(claim)
+        except OSError as e:
+            logger.warning(f"Could not write rate limit ledger {self.worker_path}: {e}")
+        logger.info(f"Loaded rate limit ledger for {len(self.clients)} clients from {len(claimed)} file(s)")
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self.load)
+        self._task = asyncio.create_task(self._snapshot_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._save()
+
+    async def _snapshot_loop(self) -> None:
+        while True:
+            await asyncio.sleep(RATE_LIMIT_SNAPSHOT_SECONDS)
+            self.evict_idle()
+            await self._save()
+
+    async def _save(self) -> None:
+        try:
+            # Taken on the event loop, written off it
+            await asyncio.to_thread(self.save, self.snapshot())
+        except OSError as e:
+            logger.warning(f"Could not write rate limit ledger {self.worker_path}: {e}")
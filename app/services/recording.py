@@ -0,0 +1,246 @@
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional
+from app.config.settings import RECORD_UPSTREAM, RECORD_DIR, RECORD_MODELS, REPLAY_PATH, REPLAY_SPEED
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Recording format (JSONL, one file per upstream stream):
+#   {"type": "header", "model": ..., "api_base": ..., "request_hash": ..., "request": {...}}
+#   {"t": 0.412, "content": "Hel", "tool_calls": null, "finish_reason": null, "usage": null}
+#   ...
+#   {"type": "end", "duration": 3.2, "chunks": 57}
+# "t" is seconds since the stream was opened, so inter-chunk timing is preserved.
+
+RECORD_HEADER = "x-record-upstream"
+
+
+def request_hash(messages: List[Dict[str, Any]]) -> str:
+    """Stable hash of a request's messages, used to match replays to requests"""
+    return hashlib.sha256(json.dumps(messages, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def should_record(model: str, headers: Any) -> bool:
+    """Whether a streaming request's upstream traffic should be recorded"""
+    if RECORD_UPSTREAM == "header":
+        return headers.get(RECORD_HEADER, "").lower() in ("1", "true", "yes")
+    if RECORD_UPSTREAM == "all":
+        name = model.split("/", 1)[1] if "/" in model else model
+        return not RECORD_MODELS or name in RECORD_MODELS or name.split(":", 1)[0] in RECORD_MODELS
+    return False
+
+
+def _get(obj: Any, name: str) -> Any:
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def chunk_to_record(chunk: Any, offset: float) -> Dict[str, Any]:
+    """Flatten a LiteLLM streaming chunk into one recording line"""
+    record: Dict[str, Any] = {"t": round(offset, 4), "content": None, "tool_calls": None,
+                              "finish_reason": None, "usage": None}
+    choices = _get(chunk, "choices") or []
+    if choices:
+        delta = _get(choices[0], "delta")
+        if delta is not None:
+            record["content"] = _get(delta, "content")
+            tool_calls = _get(delta, "tool_calls")
+            if tool_calls:
+                record["tool_calls"] = [{
+                    "index": _get(call, "index"),
+                    "id": _get(call, "id"),
+                    "name": _get(_get(call, "function"), "name"),
+                    "arguments": _get(_get(call, "function"), "arguments"),
+                } for call in tool_calls]
+        record["finish_reason"] = _get(choices[0], "finish_reason")
+    usage = _get(chunk, "usage")
+    if usage is not None and _get(usage, "prompt_tokens") is not None:
+        record["usage"] = {"prompt_tokens": _get(usage, "prompt_tokens"),
+                           "completion_tokens": _get(usage, "completion_tokens")}
+    return record
+
+
+def record_to_chunk(record: Dict[str, Any]) -> Any:
+    """Rebuild a LiteLLM-shaped streaming chunk from a recording line"""
+    tool_calls = None
+    if record.get("tool_calls"):
+        tool_calls = [SimpleNamespace(
+            index=call["index"], id=call["id"], type="function",
+            function=SimpleNamespace(name=call["name"], arguments=call["arguments"])
+        ) for call in record["tool_calls"]]
+    usage = SimpleNamespace(**record["usage"]) if record.get("usage") else None
+    return SimpleNamespace(
+        choices=[SimpleNamespace(delta=SimpleNamespace(content=record.get("content"), tool_calls=tool_calls),
+                                 finish_reason=record.get("finish_reason"))],
+        usage=usage,
+    )
+
+
+class RecordingStream:
+    """
+    Passes an upstream stream through unchanged while recording every chunk.
+
+    The recording is written when the stream ends or is closed, off the event loop.
+    """
+
+    def __init__(self, stream: Any, model: str, api_base: str, request: Dict[str, Any],
+                 directory: str = RECORD_DIR):
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.jsonl")
+        self.header = {
+            "type": "header", "model": model, "api_base": api_base,
+            "request_hash": request_hash(request.get("messages", [])),
+            "request": {key: value for key, value in request.items() if key != "api_key"},
+        }
+        self.records: List[Dict[str, Any]] = []
+        self.saved = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        try:
+            chunk = await self.stream.__anext__()
+        except StopAsyncIteration:
+            await self._save()
+            raise
+        self.records.append(chunk_to_record(chunk, time.perf_counter() - self.started))
+        return chunk
+
+    async def aclose(self) -> None:
+        await self._save()
+        aclose = getattr(self.stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    async def _save(self) -> None:
+        if self.saved:
+            return
+        self.saved = True
+        end = {"type": "end", "duration": round(time.perf_counter() - self.started, 4),
+               "chunks": len(self.records)}
+        lines = [self.header] + self.records + [end]
+        try:
+            await asyncio.to_thread(_write_jsonl, self.path, lines)
+        except OSError as e:
+            logger.warning(f"Could not write upstream recording {self.path}: {e}")
+            return
+        metrics.increment("recording.saved")
+        logger.info(f"Recorded {len(self.records)} upstream chunks to {self.path}")
+
+
+async def open_recorded_stream(open_call: Awaitable[Any], model: str, api_base: str,
+                               request: Dict[str, Any]) -> RecordingStream:
+    """Open an upstream stream and record it; offsets include the time to open it"""
+    started = time.perf_counter()
+    stream = await open_call
+    recording = RecordingStream(stream, model, api_base, request)
+    recording.started = started
+    return recording
+
+
+def _write_jsonl(path: str, lines: List[Dict[str, Any]]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        for line in lines:
+            f.write(json.dumps(line, default=str, ensure_ascii=False))
+            f.write("\n")
+
+
+class Recording:
+    """One loaded recording: header, chunk records and end marker"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path) as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        self.header = lines[0] if lines and lines[0].get("type") == "header" else {}
+        self.records = [line for line in lines if "t" in line and line.get("type") is None]
+
+
+def parse_speed(value: str) -> float:
+    """Replay speed as a time multiplier: original=1, max=0, "2" = twice as fast"""
+    value = str(value).strip().lower()
+    if value in ("", "original", "1", "1x"):
+        return 1.0
+    if value in ("max", "maximum", "0"):
+        return 0.0
+    try:
+        factor = float(value.rstrip("x"))
+    except ValueError:
+        logger.warning(f"Unknown replay speed '{value}', using original speed")
+        return 1.0
+    return 1.0 / factor if factor > 0 else 0.0
+
+
+class ReplayBackend:
+    """
+    Serves recorded upstream streams in place of LiteLLM.
+
+    A request whose messages match a recording's request hash gets that recording;
+    any other request gets the next recording in turn. Chunks are released at their
+    recorded offsets multiplied by `time_scale` (1 = original speed, 0 = no delay).
+    """
+
+    def __init__(self, path: str, time_scale: float = 1.0):
+        paths = sorted(glob.glob(os.path.join(path, "*.jsonl"))) if os.path.isdir(path) else [path]
+        self.recordings = [Recording(p) for p in paths]
+        if not self.recordings:
+            raise ValueError(f"No recordings found at {path}")
+        self.by_hash = {r.header.get("request_hash"): r for r in self.recordings if r.header.get("request_hash")}
+        self.time_scale = time_scale
+        self._next = 0
+
+    def pick(self, messages: Optional[List[Dict[str, Any]]]) -> Recording:
+        if messages is not None:
+            recording = self.by_hash.get(request_hash(messages))
+            if recording is not None:
+                return recording
+        recording = self.recordings[self._next % len(self.recordings)]
+        self._next += 1
+        return recording
+
+    async def stream(self, recording: Recording) -> AsyncIterator[Any]:
+        started = time.perf_counter()
+        for record in recording.records:
+            if self.time_scale > 0:
+                wait = record["t"] * self.time_scale - (time.perf_counter() - started)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            yield record_to_chunk(record)
+
+    async def acompletion(self, **kwargs: Any) -> Any:
+        """Drop-in for litellm.acompletion; non-streaming calls get the recorded text joined up"""
+        recording = self.pick(kwargs.get("messages"))
+        if kwargs.get("stream"):
+            return self.stream(recording)
+        text = "".join(record.get("content") or "" for record in recording.records)
+        finish_reason = next((r["finish_reason"] for r in reversed(recording.records) if r.get("finish_reason")), "stop")
+        usage = next((r["usage"] for r in reversed(recording.records) if r.get("usage")), None) or {}
+        return {
+            "id": f"msg_replay_{uuid.uuid4().hex[:12]}",
+            "choices": [{"message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": usage.get("prompt_tokens", 0),
+                      "completion_tokens": usage.get("completion_tokens", 0)},
+        }
+
+
+_replay_backend: Optional[ReplayBackend] = None
+
+
+def get_replay_backend() -> Optional[ReplayBackend]:
+    """The configured replay backend, or None when REPLAY_PATH is not set"""
+    global _replay_backend
+    if REPLAY_PATH and _replay_backend is None:
+        _replay_backend = ReplayBackend(REPLAY_PATH, parse_speed(REPLAY_SPEED))
+        logger.info(f"Replaying {len(_replay_backend.recordings)} upstream recordings from {REPLAY_PATH} "
+                    f"(speed {REPLAY_SPEED})")
+    return _replay_backend
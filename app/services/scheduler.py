@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Tuple
+from app.config.settings import (
+    SCHEDULER_MAX_CONCURRENCY, SCHEDULER_BACKGROUND_MODELS,
+    SCHEDULER_AGING_SECONDS, SCHEDULER_PROMOTE_SECONDS
+)
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+# Lower ranks are served first
+CLASS_RANKS = {INTERACTIVE: 0, BACKGROUND: 1}
+
+# Routes whose requests never block a person waiting at a terminal
+BACKGROUND_ROUTES = ("/v1/messages/batches",)
+
+
+def priority_class(model: str, route: str) -> str:
+    """Priority class of a request from its requested model and route"""
+    if route.startswith(BACKGROUND_ROUTES):
+        return BACKGROUND
+    name = model.lower()
+    if any(pattern in name for pattern in SCHEDULER_BACKGROUND_MODELS):
+        # Titles, summaries and quota probes from Claude Code use the small model
+        return BACKGROUND
+    return INTERACTIVE
+
+
+class _Waiter:
+    __slots__ = ("priority_class", "cost", "enqueued", "future")
+
+    def __init__(self, priority_class: str, cost: int, enqueued: float, future: asyncio.Future):
+        self.priority_class = priority_class
+        self.cost = cost
+        self.enqueued = enqueued
+        self.future = future
+
+
+class Slot:
+    """A granted upstream slot; release it when the request (or its stream) is done"""
+
+    def __init__(self, scheduler: "Scheduler"):
+        self._scheduler = scheduler
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._scheduler._release()
+
+
+class Scheduler:
+    """
+    Limits concurrent upstream requests and decides who goes next.
+
+    Waiting requests are ordered by class (interactive before background) and,
+    within a class, shortest estimated job first (prompt tokens + max_tokens).
+    Waiting ages a job: its cost shrinks over time, and a background job that
+    has waited SCHEDULER_PROMOTE_SECONDS competes as interactive, so nothing
+    starves. Priorities change while jobs wait, so the next job is picked by
+    scanning the queue, which stays short (it is bounded by client concurrency).
+    """
+
+    def __init__(self, max_concurrency: int = SCHEDULER_MAX_CONCURRENCY,
+                 aging_seconds: float = SCHEDULER_AGING_SECONDS,
+                 promote_seconds: float = SCHEDULER_PROMOTE_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_concurrency = max_concurrency
+        self.aging_seconds = aging_seconds
+        self.promote_seconds = promote_seconds
+        self.clock = clock
+        self.active = 0
+        self.waiting: List[_Waiter] = []
+
+    def _rank(self, waiter: _Waiter, now: float) -> Tuple[int, float, float]:
+        waited = now - waiter.enqueued
+        rank = CLASS_RANKS[waiter.priority_class]
+        if self.promote_seconds > 0:
+            rank = max(0, rank - int(waited // self.promote_seconds))
+        cost = waiter.cost
+        if self.aging_seconds > 0:
+            cost = cost / (1.0 + waited / self.aging_seconds)
+        return rank, cost, waiter.enqueued
+
+    async def acquire(self, priority_class: str, estimated_tokens: int) -> Slot:
+        """Wait for an upstream slot"""
+        started = self.clock()
+        if self.max_concurrency <= 0 or (self.active < self.max_concurrency and not self.waiting):
+            self.active += 1
+            self._dispatched(priority_class, 0.0)
+            return Slot(self)
+        waiter = _Waiter(priority_class, estimated_tokens, started, asyncio.get_running_loop().create_future())
+        self.waiting.append(waiter)
+        metrics.increment(f"scheduler.queued.{priority_class}")
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as the request was cancelled; hand the slot on
+                self._release()
+            elif waiter in self.waiting:
+                # _release may already have dropped the cancelled waiter from the queue
+                self.waiting.remove(waiter)
+            raise
+        self._dispatched(priority_class, self.clock() - started)
+        return Slot(self)
+
+    def _release(self) -> None:
+        self.active -= 1
+        while self.waiting and self.active < self.max_concurrency:
+            now = self.clock()
+            waiter = min(self.waiting, key=lambda w: self._rank(w, now))
+            self.waiting.remove(waiter)
+            if waiter.future.done():
+                continue  # Cancelled while queued
+            self.active += 1
+            waiter.future.set_result(None)
+
+    def _dispatched(self, priority_class: str, waited: float) -> None:
+        metrics.increment(f"scheduler.dispatched.{priority_class}")
+        metrics.observe(f"scheduler.queue_wait_seconds.{priority_class}", waited)
+        if waited > 1:
+            logger.debug(f"{priority_class} request waited {waited:.2f}s for an upstream slot")
+
+    def state(self) -> Dict[str, object]:
+        queued: Dict[str, int] = {name: 0 for name in CLASS_RANKS}
+        for waiter in self.waiting:
+            queued[waiter.priority_class] += 1
+        return {"active": self.active, "max_concurrency": self.max_concurrency, "queued": queued}
+
@@ -0,0 +1,116 @@
+"""
+Compressed request bodies.
+
+Clients far from the proxy can send /v1/messages bodies with
+Content-Encoding gzip, deflate or zstd. Bodies are decompressed as they
+arrive and rejected as soon as they would exceed the size limit, so an
+oversized or malicious body never has to be held in memory in full.
+"""
+import zlib
+from typing import Optional
+
+from fastapi import Request
+
+from app.config.settings import MAX_REQUEST_BODY_BYTES
+from app.services import metrics
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+# Compressed input fed to zstd at a time; its output can't be capped like zlib's,
+# so small slices keep the overshoot past the limit bounded
+_ZSTD_SLICE = 4096
+
+
+class RequestBodyError(Exception):
+    """A request body that can't be accepted, with its Anthropic-style error"""
+
+    def __init__(self, status_code: int, error_type: str, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.error_type = error_type
+
+
+def _too_large(limit: int) -> RequestBodyError:
+    return RequestBodyError(413, "request_too_large", f"Request body exceeds the {limit} byte limit")
+
+
+def supported_encodings() -> tuple:
+    encodings = ("identity", "gzip", "deflate")
+    return encodings + ("zstd",) if zstandard is not None else encodings
+
+
+class _Decoder:
+    """Decompresses one Content-Encoding incrementally, refusing output beyond `limit` bytes"""
+
+    def __init__(self, encoding: str, limit: int):
+        self.limit = limit
+        self.size = 0
+        if encoding == "gzip":
+            self._zlib = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        elif encoding == "deflate":
+            self._zlib = zlib.decompressobj()
+        else:
+            self._zlib = None
+            self._zstd = zstandard.ZstdDecompressor().decompressobj()
+
+    def _count(self, output: bytes) -> bytes:
+        self.size += len(output)
+        if 0 < self.limit < self.size:
+            raise _too_large(self.limit)
+        return output
+
+    def decode(self, data: bytes) -> bytes:
+        try:
+            if self._zlib is not None:
+                # One byte over the remaining allowance is enough to know the body is too big
+                max_length = self.limit - self.size + 1 if self.limit > 0 else 0
+                return self._count(self._zlib.decompress(data, max_length))
+            parts = []
+            for start in range(0, len(data), _ZSTD_SLICE):
+                parts.append(self._count(self._zstd.decompress(data[start:start + _ZSTD_SLICE])))
+            return b"".join(parts)
+        except (zlib.error, getattr(zstandard, "ZstdError", zlib.error)) as e:
+            raise RequestBodyError(400, "invalid_request_error", f"Could not decompress request body: {e}")
+
+    def finish(self) -> bytes:
+        if self._zlib is None:
+            return b""
+        if not self._zlib.eof:
+            raise RequestBodyError(400, "invalid_request_error", "Compressed request body is truncated")
+        return self._count(self._zlib.flush())
+
+
+async def read_request_body(request: Request, limit: Optional[int] = None) -> bytes:
+    """The request body, decompressed per its Content-Encoding, of at most `limit` bytes"""
+    limit = MAX_REQUEST_BODY_BYTES if limit is None else limit
+    encoding = request.headers.get("content-encoding", "identity").strip().lower() or "identity"
+    encoding = "gzip" if encoding == "x-gzip" else encoding
+    if encoding not in supported_encodings():
+        raise RequestBodyError(
+            415, "invalid_request_error",
+            f"Unsupported Content-Encoding '{encoding}', expected one of: {', '.join(supported_encodings())}"
+        )
+    content_length = request.headers.get("content-length")
+    if limit > 0 and content_length and content_length.isdigit() and int(content_length) > limit:
+        # Rejected before any of the body is read
+        raise _too_large(limit)
+
+    decoder = _Decoder(encoding, limit) if encoding != "identity" else None
+    parts = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if decoder is not None:
+            chunk = decoder.decode(chunk)
+        elif 0 < limit < size:
+            raise _too_large(limit)
+        if chunk:
+            parts.append(chunk)
+    if decoder is not None:
+        parts.append(decoder.finish())
+        metrics.increment(f"request_body.{encoding}")
+        metrics.increment("request_body.bytes_saved", max(0, decoder.size - size))
+    return b"".join(parts)
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import logging
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from app.config.settings import (
+    DEFAULT_CONTEXT_LENGTH, MODEL_CONTEXT_LENGTHS, CONTEXT_MAX_OUTPUT_SHARE,
+    CONTEXT_KEEP_LAST_TURNS, CONTEXT_PINNED_MESSAGES, NUM_CTX_BUCKETS
+)
+from app.services import metrics, model_registry
+
+logger = logging.getLogger(__name__)
+
+# Rough per-message overhead added by chat templates (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Never shrink the prompt budget below this, even for tiny context windows
+MIN_PROMPT_BUDGET = 256
+
+# Flat estimate for an image part, whatever its encoded size
+IMAGE_TOKEN_ESTIMATE = 768
+
+# Word pieces and individual punctuation marks approximate BPE tokens well
+# enough for budgeting without pulling in a tokenizer
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+_TOKEN_CACHE_SIZE = 4096
+# Keyed by a digest of the message text, so large tool outputs aren't kept alive as keys
+_token_cache: "OrderedDict[bytes, int]" = OrderedDict()
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Estimate the number of tokens in a piece of text"""
+    if not text:
+        return 0
+    # Long words are split into several tokens by real tokenizers
+    pieces = _TOKEN_PATTERN.findall(text)
+    return sum(1 + len(piece) // 8 for piece in pieces)
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    """Flatten the parts of a message that count towards the prompt"""
+    content = message.get("content")
+    if content is None:
+        text = ""
+    elif isinstance(content, str):
+        text = content
+    else:
+        # Multimodal parts: only the text counts, images are estimated separately
+        text = "\n".join(
+            part.get("text", "") for part in content
+            if isinstance(part, dict) and part.get("type") == "text"
+        )
+    tool_calls = message.get("tool_calls")
+    if tool_calls:
+        text = text + json.dumps(tool_calls)
+    return text
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    """Estimate the tokens of one LiteLLM message, cached by its content"""
+    text = _message_text(message)
+    content = message.get("content")
+    images = 0
+    if isinstance(content, list):
+        images = sum(1 for part in content if isinstance(part, dict) and part.get("type") == "image_url")
+    key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    cached = _token_cache.get(key)
+    if cached is not None:
+        _token_cache.move_to_end(key)
+        return cached + images * IMAGE_TOKEN_ESTIMATE
+    count = estimate_text_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+    _token_cache[key] = count
+    if len(_token_cache) > _TOKEN_CACHE_SIZE:
+        _token_cache.popitem(last=False)
+    return count + images * IMAGE_TOKEN_ESTIMATE
+
+
+def known_context_length(model: str) -> Optional[int]:
+    """The configured override for a model's context length, else the one the registry discovered"""
+    name = model.split("/", 1)[1] if "/" in model else model
+    if name in MODEL_CONTEXT_LENGTHS:
+        return MODEL_CONTEXT_LENGTHS[name]
+    # Fall back to the model family without the tag (e.g. "codellama")
+    family = name.split(":", 1)[0]
+    if family in MODEL_CONTEXT_LENGTHS:
+        return MODEL_CONTEXT_LENGTHS[family]
+    return model_registry.registry.context_length(model)
+
+
+def get_context_length(model: str) -> int:
+    """
+    Get the context length for a model, with or without provider prefix.
+
+    Configured overrides win, then the length the model registry discovered
+    from Ollama, then DEFAULT_CONTEXT_LENGTH.
+    """
+    return known_context_length(model) or DEFAULT_CONTEXT_LENGTH
+
+
+def should_fit_context(model: str) -> bool:
+    """
+    Whether prompts for a model are trimmed to its context window.
+
+    Ollama models are, with DEFAULT_CONTEXT_LENGTH when their length is unknown.
+    Hosted models only are when their length is configured, since the default
+    would cut a 128k window down to a few thousand tokens.
+    """
+    return model.startswith(("ollama/", "ollama_chat/")) or known_context_length(model) is not None
+
+
+def prompt_budget(model: str, max_tokens: int, reserved_tokens: int = 0) -> int:
+    """
+    Tokens the messages may use: the context window less the output and reserved tokens.
+
+    Claude Code asks for max_tokens of 32000 whatever the model, so at most
+    CONTEXT_MAX_OUTPUT_SHARE of the window is held back for the output.
+    """
+    context_length = get_context_length(model)
+    output = min(max_tokens, int(context_length * CONTEXT_MAX_OUTPUT_SHARE))
+    return max(context_length - output - reserved_tokens, MIN_PROMPT_BUDGET)
+
+
+def _split_turns(messages: List[Dict[str, Any]], start: int) -> List[List[int]]:
+    """Group message indexes into turns, each starting at a user message"""
+    turns = []
+    for idx in range(start, len(messages)):
+        if messages[idx].get("role") == "user" or not turns:
+            turns.append([idx])
+        else:
+            turns[-1].append(idx)
+    return turns
+
+
+def _elided_tool_message(message: Dict[str, Any], tokens: int) -> Dict[str, Any]:
+    elided = dict(message)
+    elided["content"] = f"[tool result elided to fit context window: ~{tokens} tokens]"
+    return elided
+
+
+def fit_messages_to_context(messages: List[Dict[str, Any]], model: str, max_tokens: int,
+                            reserved_tokens: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Trim a LiteLLM message list so the prompt fits the model's context window.
+
+    System messages, the first CONTEXT_PINNED_MESSAGES conversation messages and
+    the last CONTEXT_KEEP_LAST_TURNS turns are always kept. When the prompt is too
+    big, the oldest tool results are elided first, then whole turns are dropped
+    from the oldest end. reserved_tokens (e.g. tool definitions) share the window
+    with the messages. Returns the new message list and the dropped token count.
+    """
+    budget = prompt_budget(model, max_tokens, reserved_tokens)
+    counts = [estimate_message_tokens(message) for message in messages]
+    total = sum(counts)
+    if total <= budget:
+        return messages, 0
+
+    # Leading system messages plus pinned conversation messages
+    head = 0
+    while head < len(messages) and messages[head].get("role") == "system":
+        head += 1
+    head = min(head + CONTEXT_PINNED_MESSAGES, len(messages))
+
+    turns = _split_turns(messages, head)
+    protected_turns = CONTEXT_KEEP_LAST_TURNS if CONTEXT_KEEP_LAST_TURNS > 0 else 0
+    droppable = turns[:-protected_turns] if protected_turns else turns
+
+    result: List[Any] = list(messages)
+    dropped = 0
+
+    # Pass 1: elide the oldest tool results
+    for turn in droppable:
+        for idx in turn:
+            if total - dropped <= budget:
+                break
+            if messages[idx].get("role") != "tool":
+                continue
+            result[idx] = _elided_tool_message(messages[idx], counts[idx])
+            saved = counts[idx] - estimate_message_tokens(result[idx])
+            if saved > 0:
+                dropped += saved
+
+    # Pass 2: drop whole turns, oldest first
+    for turn in droppable:
+        if total - dropped <= budget:
+            break
+        for idx in turn:
+            if result[idx] is None:
+                continue
+            dropped += estimate_message_tokens(result[idx])
+            result[idx] = None
+
+    fitted = [message for message in result if message is not None]
+    if total - dropped > budget:
+        logger.warning(
+            f"Prompt for '{model}' still exceeds context budget after trimming: "
+            f"{total - dropped} > {budget} tokens"
+        )
+    logger.info(
+        f"Context fit for '{model}': dropped ~{dropped} of {total} prompt tokens "
+        f"({len(messages) - len(fitted)} messages removed, budget {budget})"
+    )
+    return fitted, dropped
+
+
+def choose_num_ctx(model: str, prompt_tokens: int, max_tokens: int,
+                   buckets: Optional[List[int]] = None) -> int:
+    """
+    Pick an Ollama num_ctx for a request: prompt plus max_tokens, rounded up to
+    the next bucket and capped at the model's context length.
+    """
+    buckets = buckets if buckets is not None else NUM_CTX_BUCKETS
+    needed = prompt_tokens + max_tokens
+    num_ctx = next((bucket for bucket in buckets if bucket >= needed), buckets[-1] if buckets else needed)
+    return min(num_ctx, get_context_length(model))
+
+
+class NumCtxTracker:
+    """
+    Remembers the num_ctx last sent for each model on each Ollama host.
+
+    Ollama reloads a model whenever num_ctx changes, so every change is logged
+    and counted.
+    """
+
+    def __init__(self):
+        self.last: Dict[Tuple[str, str], int] = {}
+
+    def observe(self, model: str, api_base: str, num_ctx: int) -> bool:
+        """Record a dispatch; returns True when it will make Ollama reload the model"""
+        metrics.increment(f"num_ctx.bucket.{num_ctx}")
+        previous = self.last.get((model, api_base))
+        self.last[(model, api_base)] = num_ctx
+        if previous is None or previous == num_ctx:
+            logger.debug(f"num_ctx {num_ctx} for '{model}' on {api_base}")
+            return False
+        metrics.increment("num_ctx.reloads")
+        logger.info(f"num_ctx for '{model}' on {api_base} changes {previous} -> {num_ctx}; Ollama will reload the model")
+        return True
@@ -0,0 +1,102 @@
+import base64
+import binascii
+import hashlib
+import io
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.config.settings import (
+    DEFAULT_IMAGE_MAX_DIMENSION, MODEL_IMAGE_MAX_DIMENSIONS, IMAGE_CACHE_SIZE, IMAGE_MAX_PIXELS
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, images are forwarded unresized without it
+    Image = None
+else:
+    # Pillow only warns up to twice its default limit; refuse oversized images outright
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+# Processed data URLs keyed by (content hash, max dimension)
+_image_cache: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+
+
+def get_image_max_dimension(model: str) -> int:
+    """Get the preferred longest image side for a model (0 means unlimited)"""
+    name = model.split("/", 1)[1] if "/" in model else model
+    if name in MODEL_IMAGE_MAX_DIMENSIONS:
+        return MODEL_IMAGE_MAX_DIMENSIONS[name]
+    family = name.split(":", 1)[0]
+    return MODEL_IMAGE_MAX_DIMENSIONS.get(family, DEFAULT_IMAGE_MAX_DIMENSION)
+
+
+def _downscale(raw: bytes, media_type: str, max_dimension: int) -> Tuple[bytes, str]:
+    """Shrink an image so its longest side is at most max_dimension pixels"""
+    with Image.open(io.BytesIO(raw)) as img:
+        # The header alone gives the size, so oversized images are never decoded
+        if img.size[0] * img.size[1] > IMAGE_MAX_PIXELS:
+            raise ValueError(f"image is {img.size[0]}x{img.size[1]}, over IMAGE_MAX_PIXELS")
+        if max(img.size) <= max_dimension:
+            return raw, media_type
+        img.thumbnail((max_dimension, max_dimension))
+        output = io.BytesIO()
+        if img.mode in ("RGBA", "LA", "P") or media_type == "image/png":
+            img.save(output, format="PNG", optimize=True)
+            return output.getvalue(), "image/png"
+        img.convert("RGB").save(output, format="JPEG", quality=90)
+        return output.getvalue(), "image/jpeg"
+
+
+def _process_base64(data: str, media_type: str, max_dimension: int) -> str:
+    if max_dimension <= 0 or Image is None:
+        return f"data:{media_type};base64,{data}"
+    try:
+        raw = base64.b64decode(data, validate=False)
+        resized, resized_type = _downscale(raw, media_type, max_dimension)
+    except (binascii.Error, OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not resize image, forwarding original: {e}")
+        return f"data:{media_type};base64,{data}"
+    if resized is raw:
+        return f"data:{media_type};base64,{data}"
+    return f"data:{resized_type};base64,{base64.b64encode(resized).decode('ascii')}"
+
+
+def image_source_to_url(source: Dict[str, Any], model: str) -> Optional[str]:
+    """
+    Convert an Anthropic image source into a URL for an OpenAI-style image part.
+
+    Base64 images are decoded and downscaled at most once per content hash and
+    target size; later turns that repeat the same image hit the cache.
+    """
+    source_type = source.get("type")
+    if source_type == "url":
+        return source.get("url")
+    if source_type != "base64" or not source.get("data"):
+        logger.warning(f"Unsupported image source type: {source_type}")
+        return None
+
+    data = source["data"]
+    media_type = source.get("media_type", "image/png")
+    max_dimension = get_image_max_dimension(model)
+    key = (hashlib.sha256(data.encode("ascii", "ignore")).hexdigest(), max_dimension)
+    cached = _image_cache.get(key)
+    if cached is not None:
+        _image_cache.move_to_end(key)
+        return cached
+
+    url = _process_base64(data, media_type, max_dimension)
+    _image_cache[key] = url
+    if len(_image_cache) > IMAGE_CACHE_SIZE:
+        _image_cache.popitem(last=False)
+    return url
+
+
+def image_block_to_part(block: Any, model: str) -> Optional[Dict[str, Any]]:
+    """Convert a pydantic or dict image block into an OpenAI image_url part"""
+    source = block.get("source", {}) if isinstance(block, dict) else block.source
+    url = image_source_to_url(source, model)
+    if url is None:
+        return None
+    return {"type": "image_url", "image_url": {"url": url}}
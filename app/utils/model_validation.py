@@ -4,6 +4,7 @@ from app.config.settings import (
     BIG_MODEL, SMALL_MODEL, PREFERRED_PROVIDER,
     OPENAI_MODELS, GEMINI_MODELS, OLLAMA_MODELS
 )
+from app.services.model_registry import registry
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +56,7 @@ def validate_and_map_model(model_name: str, info: Dict[str, Any]) -> str:
         elif clean_v in OPENAI_MODELS and not model_name.startswith('openai/'):
             new_model = f"openai/{clean_v}"
             mapped = True
-        elif clean_v in OLLAMA_MODELS and not model_name.startswith('ollama/'):
+        elif (registry.lookup(clean_v) is not None or clean_v in OLLAMA_MODELS) and not model_name.startswith('ollama/'):
             new_model = f"ollama/{clean_v}"
             mapped = True
     # --- Mapping Logic --- END ---
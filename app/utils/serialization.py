@@ -0,0 +1,62 @@
+"""
+Direct JSON serialization for non-streaming responses.
+
+Responses are built as plain dicts already in the Anthropic shape and written
+straight to bytes, instead of being wrapped in pydantic models that FastAPI
+then encodes again. The shapes match MessagesResponse and TokenCountResponse;
+test_serialization.py validates them against those models so requests don't
+pay for it.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON, with orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(content)
+        except TypeError:
+            pass  # Integers over 64 bits or non-string keys
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode("utf-8")
+
+
+class AnthropicJSONResponse(Response):
+    """JSON response for pre-shaped dicts; skips FastAPI's encoding pass"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return content if isinstance(content, bytes) else dumps(content)
+
+
+def usage_dict(input_tokens: int, output_tokens: int, cache_creation_input_tokens: int = 0,
+               cache_read_input_tokens: int = 0) -> Dict[str, int]:
+    """Usage in the shape of the Usage model"""
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cache_creation_input_tokens": cache_creation_input_tokens,
+        "cache_read_input_tokens": cache_read_input_tokens,
+    }
+
+
+def message_dict(id: str, model: str, content: List[Dict[str, Any]], stop_reason: Optional[str],
+                 usage: Dict[str, int], stop_sequence: Optional[str] = None) -> Dict[str, Any]:
+    """A message in the shape of the MessagesResponse model"""
+    return {
+        "id": id,
+        "type": "message",
+        "role": "assistant",
+        "model": model,
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": stop_sequence,
+        "usage": usage,
+    }
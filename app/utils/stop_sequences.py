@@ -0,0 +1,69 @@
+from typing import List, Optional, Tuple
+
+
+def find_stop_sequence(text: str, stop_sequences: List[str]) -> Optional[Tuple[int, str]]:
+    """
+    First stop sequence a model generating text would have produced, as (index, sequence).
+
+    That is the match that ends first (the longer one when two end together),
+    which does not depend on how the text was split into chunks.
+    """
+    best = None
+    best_end = 0
+    for sequence in stop_sequences:
+        if not sequence:
+            continue
+        index = text.find(sequence)
+        if index == -1:
+            continue
+        end = index + len(sequence)
+        if best is None or end < best_end or (end == best_end and index < best[0]):
+            best, best_end = (index, sequence), end
+    return best
+
+
+def partial_match_length(text: str, sequences: List[str]) -> int:
+    """Length of the longest suffix of text that is a proper prefix of one of the sequences"""
+    longest = 0
+    for sequence in sequences:
+        for length in range(min(len(sequence) - 1, len(text)), longest, -1):
+            if text.endswith(sequence[:length]):
+                longest = length
+                break
+    return longest
+
+
+class StopSequenceScanner:
+    """
+    Finds stop sequences in streamed text, including matches split across chunks.
+
+    Text that could be the start of a stop sequence is held back until the next
+    chunk shows whether it matches, so a stop string is never partly sent to the
+    client. Only the held-back tail (shorter than the longest stop sequence) and
+    the new chunk are searched, so each character is scanned a bounded number of
+    times however long the stream runs.
+    """
+
+    def __init__(self, stop_sequences: List[str]):
+        self.stop_sequences = [s for s in stop_sequences if s]
+        self.matched: Optional[str] = None
+        self._held = ""
+
+    def feed(self, text: str) -> str:
+        """Add a chunk and return the text that can be sent; after a match returns ''"""
+        if self.matched is not None:
+            return ""
+        window = self._held + text
+        match = find_stop_sequence(window, self.stop_sequences)
+        if match is not None:
+            index, self.matched = match
+            self._held = ""
+            return window[:index]
+        keep = partial_match_length(window, self.stop_sequences)
+        self._held = window[len(window) - keep:] if keep else ""
+        return window[:len(window) - keep]
+
+    def flush(self) -> str:
+        """Release the held-back text once the stream has ended without a match"""
+        held, self._held = self._held, ""
+        return held
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from app.config.settings import SYSTEM_PROMPT_RULES_FILE, SYSTEM_PROMPT_CACHE_SIZE
+from app.services import metrics
+from app.utils.context_window import estimate_text_tokens
+
+logger = logging.getLogger(__name__)
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_PLACEHOLDER = re.compile(r"\{(system|tag:[\w-]+)\}")
+
+
+class SystemPromptRule(NamedTuple):
+    strip_sections: List[str]                    # Markdown headings whose sections are removed (lowercase)
+    strip_patterns: List["re.Pattern"]           # Removed wherever they match
+    replacements: List[Tuple["re.Pattern", str]]
+    template: Optional[str]                      # With {system} and {tag:name} placeholders
+    max_tokens: int                              # Cap on {system}, 0 means none
+
+
+def parse_rule(data: Dict[str, Any]) -> SystemPromptRule:
+    """A rule from its JSON form (see system_prompt_rules.example.json)"""
+    return SystemPromptRule(
+        strip_sections=[heading.strip().lstrip("#").strip().lower() for heading in data.get("strip_sections", [])],
+        strip_patterns=[re.compile(pattern, re.DOTALL) for pattern in data.get("strip_patterns", [])],
+        replacements=[(re.compile(pattern), replacement) for pattern, replacement in data.get("replace", {}).items()],
+        template=data.get("template"),
+        max_tokens=int(data.get("max_tokens", 0)),
+    )
+
+
+def load_rules(path: str) -> Dict[str, SystemPromptRule]:
+    """Rules keyed by model name, model family or "*"; an unreadable file means no rules"""
+    if not path:
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {model: parse_rule(rule) for model, rule in json.load(f).items()}
+    except (OSError, ValueError, TypeError, AttributeError, re.error) as e:
+        logger.error(f"Ignoring system prompt rules in {path}: {e}")
+        return {}
+
+
+_rules: Optional[Dict[str, SystemPromptRule]] = None
+# Transformed prompts and their token savings keyed by (prompt hash, rule key)
+_transform_cache: "OrderedDict[Tuple[str, str], Tuple[str, int]]" = OrderedDict()
+
+
+def get_rules() -> Dict[str, SystemPromptRule]:
+    global _rules
+    if _rules is None:
+        _rules = load_rules(SYSTEM_PROMPT_RULES_FILE)
+        if _rules:
+            logger.info(f"Loaded system prompt rules for: {', '.join(_rules)}")
+    return _rules
+
+
+def rule_for(model: str, rules: Dict[str, SystemPromptRule]) -> Optional[str]:
+    """Key of the rule for a model: its exact name, then its family, then "*" """
+    name = model.split("/", 1)[1] if "/" in model else model
+    for key in (name, name.split(":", 1)[0], "*"):
+        if key in rules:
+            return key
+    return None
+
+
+def strip_sections(text: str, headings: List[str]) -> str:
+    """Remove markdown sections (heading up to the next heading of the same or a higher level)"""
+    if not headings:
+        return text
+    kept = []
+    skipping_level = 0
+    for line in text.split("\n"):
+        match = _HEADING.match(line)
+        if match:
+            level = len(match.group(1))
+            if skipping_level and level > skipping_level:
+                continue
+            skipping_level = level if match.group(2).lower() in headings else 0
+        if not skipping_level:
+            kept.append(line)
+    return "\n".join(kept)
+
+
+def _sections(text: str) -> List[str]:
+    """Text split before each markdown heading; the first piece is the preamble"""
+    sections = [[]]
+    for line in text.split("\n"):
+        if _HEADING.match(line) and sections[-1]:
+            sections.append([])
+        sections[-1].append(line)
+    return ["\n".join(section) for section in sections]
+
+
+def cap_tokens(text: str, max_tokens: int) -> str:
+    """Drop the largest sections (never the preamble) until text fits, then cut at a paragraph"""
+    if max_tokens <= 0 or estimate_text_tokens(text) <= max_tokens:
+        return text
+    sections = _sections(text)
+    sizes = [estimate_text_tokens(section) for section in sections]
+    total = sum(sizes)
+    dropped = set()
+    for index in sorted(range(1, len(sections)), key=lambda i: -sizes[i]):
+        if total <= max_tokens:
+            break
+        dropped.add(index)
+        total -= sizes[index]
+    text = "\n".join(section for index, section in enumerate(sections) if index not in dropped)
+    if total <= max_tokens:
+        return text
+    kept = []
+    total = 0
+    for paragraph in text.split("\n\n"):
+        total += estimate_text_tokens(paragraph)
+        if total > max_tokens and kept:
+            break
+        kept.append(paragraph)
+    return "\n\n".join(kept)
+
+
+def _render(template: str, system: str, original: str) -> str:
+    def placeholder(match: "re.Match") -> str:
+        name = match.group(1)
+        if name == "system":
+            return system
+        tag = re.escape(name[len("tag:"):])
+        found = re.search(rf"<{tag}>.*?</{tag}>", original, re.DOTALL)
+        return found.group(0) if found else ""
+    return _PLACEHOLDER.sub(placeholder, template)
+
+
+def apply_rule(text: str, rule: SystemPromptRule) -> str:
+    transformed = strip_sections(text, rule.strip_sections)
+    for pattern in rule.strip_patterns:
+        transformed = pattern.sub("", transformed)
+    for pattern, replacement in rule.replacements:
+        transformed = pattern.sub(replacement, transformed)
+    transformed = re.sub(r"\n{3,}", "\n\n", transformed).strip()
+    # Capped before templating, so what the template adds (e.g. the <env> block) is kept
+    transformed = cap_tokens(transformed, rule.max_tokens)
+    if rule.template is not None:
+        transformed = _render(rule.template, transformed, text).strip()
+    return transformed
+
+
+def transform_system_prompt(text: str, model: str) -> str:
+    """
+    Rewrite a system prompt with the rules for the model it is sent to.
+
+    Claude Code's system prompt is long and written for Claude; small local
+    models answer sooner with less of it to prefill. Results are cached by a
+    hash of the prompt, so repeat turns only pay for the hash.
+    """
+    rules = get_rules()
+    key = rule_for(model, rules) if rules else None
+    if key is None:
+        return text
+    cache_key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), key)
+    cached = _transform_cache.get(cache_key)
+    if cached is not None:
+        _transform_cache.move_to_end(cache_key)
+        transformed, saved = cached
+    else:
+        transformed = apply_rule(text, rules[key])
+        saved = estimate_text_tokens(text) - estimate_text_tokens(transformed)
+        _transform_cache[cache_key] = (transformed, saved)
+        if len(_transform_cache) > SYSTEM_PROMPT_CACHE_SIZE:
+            _transform_cache.popitem(last=False)
+    metrics.increment("system_prompt.tokens_saved", saved)
+    metrics.observe("system_prompt.tokens_saved_per_request", saved)
+    logger.debug(f"System prompt for {model} rewritten with rule '{key}': ~{saved} tokens saved")
+    return transformed
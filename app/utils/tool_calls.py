@@ -0,0 +1,295 @@
+import json
+import re
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+from app.config.settings import TOOL_CALL_FORMATS
+from app.utils.stop_sequences import find_stop_sequence, partial_match_length
+
+
+class ParsedToolCall(NamedTuple):
+    id: str
+    name: str
+    input: Dict[str, Any]
+
+
+# ToolCallParser output: plain text, or a complete tool call
+ParsedEvent = Union[str, ParsedToolCall]
+
+
+def _tool_call(name: Any, arguments: Any) -> Optional[ParsedToolCall]:
+    if isinstance(arguments, str):
+        try:
+            arguments = json.loads(arguments) if arguments.strip() else {}
+        except json.JSONDecodeError:
+            return None
+    if not isinstance(name, str) or not name or not isinstance(arguments, dict):
+        return None
+    return ParsedToolCall(f"toolu_{uuid.uuid4().hex[:24]}", name, arguments)
+
+
+def _parse_json_calls(body: str) -> Optional[List[ParsedToolCall]]:
+    """{"name": ..., "arguments"|"parameters": {...}}, a list of those, or OpenAI's {"function": {...}}"""
+    try:
+        value = json.loads(body)
+    except json.JSONDecodeError:
+        return None
+    calls = []
+    for item in value if isinstance(value, list) else [value]:
+        if not isinstance(item, dict):
+            return None
+        if isinstance(item.get("function"), dict):
+            item = item["function"]
+        arguments = item.get("arguments", item.get("parameters"))
+        call = _tool_call(item.get("name"), {} if arguments is None else arguments)
+        if call is None:
+            return None
+        calls.append(call)
+    return calls or None
+
+
+def _parameter_value(value: str) -> Any:
+    value = value.strip("\n")
+    if value[:1] in ("{", "["):
+        # Structured arguments; everything else stays a string as the schema isn't known here
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            pass
+    return value
+
+
+_QWEN_FUNCTION = re.compile(r"<function=([^>\n]+)>(.*?)</function>", re.DOTALL)
+_QWEN_PARAMETER = re.compile(r"<parameter=([^>\n]+)>(.*?)</parameter>", re.DOTALL)
+_INVOKE = re.compile(r"<invoke name=\"([^\"]+)\">(.*?)</invoke>", re.DOTALL)
+_INVOKE_PARAMETER = re.compile(r"<parameter name=\"([^\"]+)\">(.*?)</parameter>", re.DOTALL)
+
+
+def _parse_xml_calls(body: str, function: "re.Pattern", parameter: "re.Pattern") -> Optional[List[ParsedToolCall]]:
+    calls = []
+    for match in function.finditer(body):
+        arguments = {name.strip(): _parameter_value(value) for name, value in parameter.findall(match.group(2))}
+        calls.append(_tool_call(match.group(1).strip(), arguments))
+    if not calls or None in calls:
+        return None
+    return calls
+
+
+def _parse_hermes(body: str) -> Optional[List[ParsedToolCall]]:
+    """Hermes/Qwen <tool_call> body: JSON, or Qwen3-Coder's <function=name><parameter=key> form"""
+    body = body.strip()
+    if body.startswith("<function="):
+        return _parse_xml_calls(body, _QWEN_FUNCTION, _QWEN_PARAMETER)
+    return _parse_json_calls(body)
+
+
+def _parse_invokes(body: str) -> Optional[List[ParsedToolCall]]:
+    """<invoke name="..."><parameter name="...">value</parameter></invoke> blocks"""
+    return _parse_xml_calls(body, _INVOKE, _INVOKE_PARAMETER)
+
+
+class _Format(NamedTuple):
+    start: str
+    end: Optional[str]  # Closing tag, or None when the call ends with its JSON value
+    parse: Callable[[str], Optional[List[ParsedToolCall]]]
+
+
+FORMATS: Dict[str, List[_Format]] = {
+    "hermes": [_Format("<tool_call>", "</tool_call>", _parse_hermes)],
+    "xml": [_Format("<function_calls>", "</function_calls>", _parse_invokes)],
+    "mistral": [_Format("[TOOL_CALLS]", None, _parse_json_calls)],
+    # Llama 3.x: after <|python_tag|>, or a JSON object making up the whole reply
+    "json": [_Format("<|python_tag|>", None, _parse_json_calls)],
+}
+
+# Formats tried for every Ollama model; the tags are distinctive enough not to misfire
+COMMON_FORMATS = ["hermes", "xml"]
+FAMILY_FORMATS = {
+    "mistral": ["mistral"], "mixtral": ["mistral"], "codestral": ["mistral"], "devstral": ["mistral"],
+    "llama3": ["json"], "llama-3": ["json"],
+}
+
+
+def tool_call_formats(model: str) -> List[str]:
+    """Text tool call formats to look for in a model's output (none for non-Ollama providers)"""
+    name = (model.split("/", 1)[1] if "/" in model else model).lower()
+    for pattern, formats in TOOL_CALL_FORMATS.items():
+        if pattern in name:
+            # Unknown names are reported by validate_configuration
+            return [f for f in formats if f in FORMATS]
+    if not model.startswith(("ollama/", "ollama_chat/")):
+        return []
+    formats = list(COMMON_FORMATS)
+    for pattern, family in FAMILY_FORMATS.items():
+        if pattern in name:
+            formats.extend(f for f in family if f not in formats)
+    return formats
+
+
+_JSON_TOKENS = re.compile(r"[\[\]{}\"\\]")
+
+
+class _JsonEnd:
+    """Finds where a streamed JSON object or array ends, looking at each character once"""
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.offset = 0    # Characters fed before the current chunk
+        self.escaped = -1  # Absolute position of a character escaped by a backslash
+
+    def feed(self, text: str) -> int:
+        """Index in text just past the end of the value, -1 if it continues, -2 if it isn't JSON"""
+        start = 0
+        if not self.started:
+            start = len(text) - len(text.lstrip())
+            if start == len(text):
+                self.offset += len(text)
+                return -1
+            if text[start] not in "{[":
+                return -2
+            self.started = True
+        for match in _JSON_TOKENS.finditer(text, start):
+            position = self.offset + match.start()
+            if position == self.escaped:
+                continue
+            token = match.group()
+            if self.in_string:
+                if token == "\\":
+                    self.escaped = position + 1
+                elif token == '"':
+                    self.in_string = False
+            elif token == '"':
+                self.in_string = True
+            elif token in "{[":
+                self.depth += 1
+            elif token in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    return match.end()
+        self.offset += len(text)
+        return -1
+
+
+class ToolCallParser:
+    """
+    Extracts tool calls that a model wrote into its text output.
+
+    Chunks are fed as they stream in. Text outside tool calls is passed through
+    as soon as it can't be the start of one; a call is emitted once it is
+    complete and parses. Tagged calls end at their closing tag, which is looked
+    for only in new text (plus a tag-length overlap), and untagged JSON calls are
+    tracked with a bracket counter, so the accumulated output is never rescanned.
+    A call that doesn't parse, or names a tool the request didn't declare, is
+    passed through as the text it was.
+    """
+
+    def __init__(self, formats: List[str], tool_names: Optional[Iterable[str]] = None):
+        self.formats = [f for name in formats for f in FORMATS[name]]
+        self.tool_names = set(tool_names) if tool_names is not None else None
+        self.markers = [f.start for f in self.formats]
+        self.leading_json = "json" in formats
+        self.found = 0
+        self._held = ""              # Text that may be the start of a marker
+        self._call: Optional[_Format] = None
+        self._body: List[str] = []   # Chunks of the open call
+        self._tail = ""              # End of the open call's body, to find a split closing tag
+        self._json: Optional[_JsonEnd] = None
+        self._at_start = self.leading_json  # Only whitespace seen so far
+
+    def feed(self, text: str) -> List[ParsedEvent]:
+        events: List[ParsedEvent] = []
+        while text:
+            if self._call is None:
+                text = self._feed_text(text, events)
+            else:
+                text = self._feed_call(text, events)
+        return events
+
+    def flush(self) -> List[ParsedEvent]:
+        """End of output: release held text, and an unfinished call as text"""
+        events: List[ParsedEvent] = []
+        if self._call is not None:
+            events.append(self._call.start + "".join(self._body))
+            self._call = None
+        elif self._held:
+            events.append(self._held)
+        self._held = ""
+        self._body = []
+        return events
+
+    def _feed_text(self, text: str, events: List[ParsedEvent]) -> str:
+        window = self._held + text
+        self._held = ""
+        if self._at_start:
+            stripped = window.lstrip()
+            if not stripped:
+                self._held = window
+                return ""
+            self._at_start = False
+            if self.leading_json and stripped[0] == "{":
+                if len(stripped) < len(window):
+                    events.append(window[:len(window) - len(stripped)])
+                self._open(_Format("", None, _parse_json_calls))
+                return stripped
+        match = find_stop_sequence(window, self.markers)
+        if match is not None:
+            index, marker = match
+            if index:
+                events.append(window[:index])
+            self._open(self.formats[self.markers.index(marker)])
+            return window[index + len(marker):]
+        keep = partial_match_length(window, self.markers)
+        if keep < len(window):
+            events.append(window[:len(window) - keep])
+        self._held = window[len(window) - keep:] if keep else ""
+        return ""
+
+    def _open(self, call: _Format) -> None:
+        self._call = call
+        self._body = []
+        self._tail = ""
+        self._json = _JsonEnd() if call.end is None else None
+
+    def _feed_call(self, text: str, events: List[ParsedEvent]) -> str:
+        call = self._call
+        if call.end is None:
+            end = self._json.feed(text)
+            if end == -2:
+                # Not a JSON call after all
+                events.append(call.start + "".join(self._body))
+                self._call = None
+                return text
+            if end == -1:
+                self._body.append(text)
+                return ""
+            self._body.append(text[:end])
+            rest, closing = text[end:], ""
+        else:
+            window = self._tail + text
+            index = window.find(call.end)
+            if index == -1:
+                self._body.append(text)
+                self._tail = window[-(len(call.end) - 1):]
+                return ""
+            # The closing tag may have started in the previous chunk
+            overlap = len(self._tail) - index
+            if overlap > 0:
+                body = "".join(self._body)
+                self._body = [body[:len(body) - overlap]]
+            else:
+                self._body.append(window[len(self._tail):index])
+            rest, closing = window[index + len(call.end):], call.end
+        body = "".join(self._body)
+        self._call = None
+        self._body = []
+        calls = call.parse(body)
+        if calls is not None and self.tool_names is not None and any(c.name not in self.tool_names for c in calls):
+            # e.g. a reply that is just a JSON object with a "name" key
+            calls = None
+        if calls is None:
+            events.append(call.start + body + closing)
+        else:
+            self.found += len(calls)
+            events.extend(calls)
+        return rest
@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
+from app.config.settings import (
+    TOOL_DEFINITION_CACHE_SIZE, TOOL_PRUNING, TOOL_PRUNING_MAX_PARAMETERS_B,
+    TOOL_DESCRIPTION_MAX_CHARS, TOOL_PRUNING_WINDOW, TOOL_PRUNING_MIN_SHARE
+)
+from app.services import metrics, model_registry
+from app.utils.context_window import estimate_text_tokens
+from app.utils.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class ToolDefinitions(NamedTuple):
+    tools: List[Dict[str, Any]]  # OpenAI function format, in request order
+    tokens: List[int]            # Estimated prompt tokens of each tool
+
+
+# Converted tool lists keyed by (hash of the Anthropic definitions, shortened)
+_definitions_cache: "OrderedDict[Tuple[str, bool], ToolDefinitions]" = OrderedDict()
+
+
+def _field(tool: Any, name: str) -> Any:
+    return tool.get(name) if isinstance(tool, dict) else getattr(tool, name, None)
+
+
+def shorten_description(text: Optional[str], limit: int = TOOL_DESCRIPTION_MAX_CHARS) -> Optional[str]:
+    """First paragraph of a description, cut at a sentence end to fit within limit characters"""
+    if not text:
+        return text
+    text = text.strip().split("\n\n", 1)[0].strip()
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(". ", 0, limit)
+    return text[:cut + 1] if cut > 0 else text[:limit].rstrip() + "..."
+
+
+def _shorten_schema(schema: Any) -> Any:
+    """Copy of a JSON schema with its property descriptions shortened"""
+    if isinstance(schema, list):
+        return [_shorten_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    shortened = {key: _shorten_schema(value) for key, value in schema.items() if key != "$schema"}
+    if isinstance(schema.get("description"), str):
+        shortened["description"] = shorten_description(schema["description"])
+    if isinstance(schema.get("properties"), dict):
+        shortened["properties"] = {name: _shorten_schema(value) for name, value in schema["properties"].items()}
+    return shortened
+
+
+def _convert(tools: Iterable[Any], shorten: bool) -> ToolDefinitions:
+    converted = []
+    tokens = []
+    for tool in tools:
+        description = _field(tool, "description")
+        parameters = _field(tool, "input_schema") or {"type": "object", "properties": {}}
+        if shorten:
+            description = shorten_description(description)
+            parameters = _shorten_schema(parameters)
+        else:
+            parameters = {key: value for key, value in parameters.items() if key != "$schema"}
+        function = {"name": _field(tool, "name"), "parameters": parameters}
+        if description:
+            function["description"] = description
+        converted.append({"type": "function", "function": function})
+        tokens.append(estimate_text_tokens(dumps(function).decode("utf-8")))
+    return ToolDefinitions(converted, tokens)
+
+
+def convert_tools(tools: List[Any], shorten: bool = False) -> ToolDefinitions:
+    """
+    Anthropic tool definitions in OpenAI function format, memoized.
+
+    Claude Code sends the same large schemas on every turn, so conversions are
+    cached by a hash of the definitions. Callers must not modify the result.
+    """
+    digest = hashlib.sha256(dumps([
+        (_field(tool, "name"), _field(tool, "description"), _field(tool, "input_schema")) for tool in tools
+    ])).hexdigest()
+    key = (digest, shorten)
+    cached = _definitions_cache.get(key)
+    if cached is not None:
+        _definitions_cache.move_to_end(key)
+        metrics.increment("tool_definitions.cache_hits")
+        return cached
+    metrics.increment("tool_definitions.cache_misses")
+    definitions = _convert(tools, shorten)
+    _definitions_cache[key] = definitions
+    if len(_definitions_cache) > TOOL_DEFINITION_CACHE_SIZE:
+        _definitions_cache.popitem(last=False)
+    return definitions
+
+
+def convert_tool_choice(tool_choice: Optional[Dict[str, Any]]) -> Tuple[Optional[Union[str, Dict[str, Any]]], Optional[bool]]:
+    """Anthropic tool_choice as OpenAI (tool_choice, parallel_tool_calls)"""
+    if not tool_choice:
+        return None, None
+    choice_type = tool_choice.get("type")
+    parallel = False if tool_choice.get("disable_parallel_tool_use") else None
+    if choice_type == "any":
+        return "required", parallel
+    if choice_type == "tool" and tool_choice.get("name"):
+        return {"type": "function", "function": {"name": tool_choice["name"]}}, parallel
+    if choice_type == "none":
+        return "none", None
+    return "auto", parallel
+
+
+def conversation_tool_names(messages: List[Any]) -> Tuple[Set[str], Set[str]]:
+    """Names of the tools used anywhere in a conversation, and in its last assistant turn"""
+    used: Set[str] = set()
+    latest: Set[str] = set()
+    for message in messages:
+        content = _field(message, "content")
+        if isinstance(content, str) or not content:
+            continue
+        names = {_field(block, "name") for block in content if _field(block, "type") == "tool_use"}
+        if _field(message, "role") == "assistant":
+            latest = names
+        used |= names
+    return used, latest
+
+
+def last_turn_digest(messages: List[Any]) -> Optional[str]:
+    """Digest identifying the last assistant turn of a conversation, None before the first one"""
+    for index in range(len(messages) - 1, -1, -1):
+        if _field(messages[index], "role") != "assistant":
+            continue
+        content = _field(messages[index], "content")
+        if not isinstance(content, str):
+            # tool_use ids are unique per call, text tells tool-less turns apart
+            content = [(_field(block, "type"), _field(block, "id"), _field(block, "name"), _field(block, "text"))
+                       for block in content or []]
+        return hashlib.sha256(dumps([index, content])).hexdigest()
+    return None
+
+
+class ToolUsage:
+    """
+    How often each tool is called, over roughly the last `window` assistant turns.
+
+    Counts are halved whenever the window fills up, so tools that fall out of
+    use eventually count as rarely used and tools that come back recover.
+    Every request resends the whole history, so a turn is only counted the
+    first time its digest is seen.
+    """
+
+    def __init__(self, window: int = TOOL_PRUNING_WINDOW, min_share: float = TOOL_PRUNING_MIN_SHARE):
+        self.window = window
+        self.min_share = min_share
+        self.turns = 0.0
+        self.counts: Dict[str, float] = {}
+        self._recorded: "OrderedDict[str, None]" = OrderedDict()
+
+    def record(self, turn: str, names: Iterable[str]) -> None:
+        """Count the tools called in one assistant turn, once per turn digest"""
+        if turn in self._recorded:
+            self._recorded.move_to_end(turn)
+            return
+        self._recorded[turn] = None
+        if len(self._recorded) > 4 * max(1, self.window):
+            self._recorded.popitem(last=False)
+        self.turns += 1
+        for name in names:
+            self.counts[name] = self.counts.get(name, 0.0) + 1
+        if self.turns >= 2 * self.window:
+            self.turns /= 2
+            self.counts = {name: count / 2 for name, count in self.counts.items() if count >= 0.5}
+
+    def rarely_used(self, name: str) -> bool:
+        """Only once enough turns were seen to tell"""
+        return self.turns >= self.window and self.counts.get(name, 0.0) < self.min_share * self.turns
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"turns": self.turns, "counts": dict(self.counts)}
+
+
+tool_usage = ToolUsage()
+
+
+def _parameters_b(parameter_size: Optional[str]) -> Optional[float]:
+    """Billions of parameters from an Ollama parameter_size such as "7.6B" or "135M" """
+    match = re.fullmatch(r"([\d.]+)\s*([KMBT])", (parameter_size or "").strip().upper())
+    if not match:
+        return None
+    scale = {"K": 1e-6, "M": 1e-3, "B": 1.0, "T": 1e3}[match.group(2)]
+    return float(match.group(1)) * scale
+
+
+def should_trim(model: str) -> bool:
+    """Whether tool definitions sent to this model are trimmed (TOOL_PRUNING)"""
+    if TOOL_PRUNING not in ("descriptions", "prune"):
+        return False
+    if TOOL_PRUNING_MAX_PARAMETERS_B <= 0:
+        return True
+    capabilities = model_registry.registry.lookup(model)
+    size = _parameters_b(capabilities.parameter_size) if capabilities is not None else None
+    return size is not None and size <= TOOL_PRUNING_MAX_PARAMETERS_B
+
+
+def prepare_tools(tools: List[Any], tool_choice: Optional[Dict[str, Any]], model: str,
+                  messages: List[Any], record_usage: bool = True) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Tool definitions for one request to `model`, and their estimated prompt tokens.
+
+    With TOOL_PRUNING, small models get shortened descriptions ("descriptions"),
+    and also lose tools that are rarely called ("prune"). Tools used in this
+    conversation or named by tool_choice are always kept. record_usage=False
+    leaves tool_usage alone, for requests that are never sent (count_tokens).
+    """
+    full = convert_tools(tools)
+    if not should_trim(model):
+        return full.tools, sum(full.tokens)
+    definitions = convert_tools(tools, shorten=True)
+    keep = list(range(len(tools)))
+    if TOOL_PRUNING == "prune":
+        used, latest = conversation_tool_names(messages)
+        turn = last_turn_digest(messages)
+        if record_usage and turn is not None:
+            tool_usage.record(turn, latest)
+        if (tool_choice or {}).get("name"):
+            used.add(tool_choice["name"])
+        keep = [i for i in keep if _field(tools[i], "name") in used or not tool_usage.rarely_used(_field(tools[i], "name"))]
+    kept_tools = [definitions.tools[i] for i in keep]
+    tokens = sum(definitions.tokens[i] for i in keep)
+    saved = sum(full.tokens) - tokens
+    if saved > 0:
+        metrics.increment("tool_definitions.tokens_saved", saved)
+        logger.debug(f"Trimmed tools for {model}: kept {len(kept_tools)} of {len(tools)}, ~{saved} tokens saved")
+    return kept_tools, tokens
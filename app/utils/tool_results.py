@@ -0,0 +1,102 @@
+import json
+import logging
+from typing import Any, Dict, Optional
+from app.config.settings import (
+    TOOL_RESULT_HEAD_CHARS, TOOL_RESULT_TAIL_CHARS, TOOL_RESULT_DEDUPE
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _item_to_text(item: Any) -> str:
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        if item.get("type") == "text" or "text" in item:
+            return item.get("text", "")
+        try:
+            return json.dumps(item)
+        except (TypeError, ValueError):
+            return str(item)
+    try:
+        return str(item)
+    except Exception:
+        return "Unparseable content"
+
+
+def parse_tool_result_content(content):
+    """Helper function to properly parse and normalize tool result content."""
+    if content is None:
+        return "No content provided"
+
+    if isinstance(content, str):
+        return content
+
+    if isinstance(content, list):
+        # Collect the parts and join once so multi-megabyte results stay linear
+        return "\n".join(_item_to_text(item) for item in content).strip()
+
+    if isinstance(content, dict):
+        if content.get("type") == "text":
+            return content.get("text", "")
+        try:
+            return json.dumps(content)
+        except (TypeError, ValueError):
+            return str(content)
+
+    # Fallback for any other type
+    try:
+        return str(content)
+    except Exception:
+        return "Unparseable content"
+
+
+def truncate_tool_output(text: str, head_chars: int = None, tail_chars: int = None) -> str:
+    """Keep only the head and tail of an oversized tool output"""
+    head_chars = TOOL_RESULT_HEAD_CHARS if head_chars is None else head_chars
+    tail_chars = TOOL_RESULT_TAIL_CHARS if tail_chars is None else tail_chars
+    limit = head_chars + tail_chars
+    if limit <= 0 or len(text) <= limit:
+        return text
+    omitted = len(text) - limit
+    tail = text[len(text) - tail_chars:] if tail_chars > 0 else ""
+    return f"{text[:head_chars]}\n\n[... {omitted} characters truncated ...]\n\n{tail}"
+
+
+class ToolResultConverter:
+    """
+    Converts Anthropic tool_result blocks into OpenAI-style tool messages.
+
+    One converter is used per request so that outputs repeated across turns
+    (e.g. the same file read twice) can be replaced by a short reference to
+    the first occurrence.
+    """
+
+    def __init__(self, dedupe: Optional[bool] = None):
+        self.dedupe = TOOL_RESULT_DEDUPE if dedupe is None else dedupe
+        self._seen: Dict[str, str] = {}
+        self.saved_chars = 0
+
+    def convert(self, tool_use_id: str, content: Any, is_error: bool = False) -> Dict[str, Any]:
+        text = parse_tool_result_content(content)
+        if self.dedupe and len(text) > 0:
+            first_id = self._seen.get(text)
+            if first_id is not None and first_id != tool_use_id:
+                self.saved_chars += len(text)
+                text = f"[Output identical to the result of tool call {first_id}]"
+            else:
+                self._seen.setdefault(text, tool_use_id)
+        truncated = truncate_tool_output(text)
+        self.saved_chars += len(text) - len(truncated)
+        if is_error:
+            truncated = f"Error: {truncated}"
+        return {"role": "tool", "tool_call_id": tool_use_id, "content": truncated}
+
+    def convert_block(self, block: Any) -> Dict[str, Any]:
+        """Convert a pydantic or dict tool_result block"""
+        if isinstance(block, dict):
+            return self.convert(block.get("tool_use_id", ""), block.get("content"),
+                                bool(block.get("is_error")))
+        return self.convert(block.tool_use_id, block.content,
+                            bool(getattr(block, "is_error", False)))
+
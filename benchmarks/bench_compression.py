@@ -0,0 +1,96 @@
+"""
+Bandwidth saved against CPU spent by compressing request bodies, for a
+synthetic Claude Code conversation whose tool results are this repo's own
+source files.
+
+    python benchmarks/bench_compression.py --size-mb 2
+
+The break-even link speed is where sending the compressed body, plus the
+time to compress and decompress it, takes as long as sending it as is.
+Compression pays off on links slower than that.
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.utils import compression
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def build_body(size_mb):
+    """A long agentic conversation reading real source files"""
+    sources = [open(path, encoding="utf-8").read() for path in sorted(glob.glob(os.path.join(ROOT, "**", "*.py"), recursive=True))]
+    messages = [{"role": "user", "content": "Refactor the request handling."}]
+    turn = 0
+    while len(json.dumps(messages)) < size_mb * 1024 * 1024:
+        source = sources[turn % len(sources)]
+        messages.append({"role": "assistant", "content": [
+            {"type": "text", "text": f"Let me read file {turn}."},
+            {"type": "tool_use", "id": f"toolu_{turn}", "name": "Read", "input": {"file_path": f"/work/file_{turn}.py"}},
+        ]})
+        messages.append({"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": f"toolu_{turn}", "content": source},
+        ]})
+        turn += 1
+    return json.dumps({
+        "model": "claude-sonnet-4-20250514", "max_tokens": 8192, "stream": True,
+        "system": "You are a coding agent.", "messages": messages,
+    }).encode("utf-8")
+
+
+def median_ms(function, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def decompress(encoding, compressed):
+    decoder = compression._Decoder(encoding, 0)
+    return decoder.decode(compressed) + decoder.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request body compression")
+    parser.add_argument("--size-mb", type=float, default=2.0)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    body = build_body(args.size_mb)
+    print(f"request body: {len(body) / 1024 / 1024:.2f} MB")
+    codecs = [(f"gzip -{level}", "gzip", lambda data, level=level: gzip.compress(data, level)) for level in (1, 6, 9)]
+    if zstandard is not None:
+        codecs += [(f"zstd -{level}", "zstd", lambda data, level=level: zstandard.ZstdCompressor(level).compress(data))
+                   for level in (1, 3, 9)]
+    else:
+        print("zstandard is not installed, skipping zstd")
+
+    print(f"{'codec':<9} {'size':>9} {'ratio':>6} {'compress':>10} {'decompress':>11} {'break-even':>12}")
+    for name, encoding, compress in codecs:
+        compressed = compress(body)
+        assert decompress(encoding, compressed) == body
+        compress_ms = median_ms(lambda: compress(body), args.rounds)
+        decompress_ms = median_ms(lambda: decompress(encoding, compressed), args.rounds)
+        saved_bits = (len(body) - len(compressed)) * 8
+        break_even = saved_bits / ((compress_ms + decompress_ms) / 1000) / 1e6
+        print(f"{name:<9} {len(compressed) / 1024:>7.0f}KB {len(body) / len(compressed):>5.1f}x "
+              f"{compress_ms:>8.1f}ms {decompress_ms:>9.1f}ms {break_even:>7.0f} Mbit/s")
+
+
+if __name__ == "__main__":
+    main()
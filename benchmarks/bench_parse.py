@@ -0,0 +1,68 @@
+"""
+Compare request parsing and conversion time for the pydantic models and the
+fast-path records on a large synthetic Claude Code request.
+
+    python benchmarks/bench_parse.py --size-mb 2
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import server
+from app.models.fast_request import parse_messages_request
+
+
+def build_body(size_mb):
+    """A long agentic conversation: tool calls, large tool results and tool schemas"""
+    tools = [{"name": f"tool_{i}", "description": "Does something useful. " * 20,
+              "input_schema": {"type": "object", "properties": {"path": {"type": "string"}}}} for i in range(20)]
+    messages = [{"role": "user", "content": "Refactor the parser."}]
+    turn = 0
+    while len(json.dumps(messages)) < size_mb * 1024 * 1024:
+        messages.append({"role": "assistant", "content": [
+            {"type": "text", "text": "Let me read the file."},
+            {"type": "tool_use", "id": f"toolu_{turn}", "name": "Read", "input": {"path": f"src/file_{turn}.py"}},
+        ]})
+        messages.append({"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": f"toolu_{turn}",
+             "content": [{"type": "text", "text": "def f(x):\n    return x\n" * 200}]},
+        ]})
+        turn += 1
+    return json.dumps({
+        "model": "claude-sonnet-4-20250514", "max_tokens": 8192, "stream": True,
+        "system": [{"type": "text", "text": "You are a coding agent.", "cache_control": {"type": "ephemeral"}}],
+        "messages": messages, "tools": tools,
+    }).encode("utf-8")
+
+
+def time_it(parse, body, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        server.convert_anthropic_to_litellm(parse(body))
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request parsing")
+    parser.add_argument("--size-mb", type=float, default=2.0)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    body = build_body(args.size_mb)
+    print(f"request body: {len(body) / 1024 / 1024:.2f} MB")
+    slow = time_it(lambda b: server.MessagesRequest.model_validate(json.loads(b)), body, args.rounds)
+    fast = time_it(parse_messages_request, body, args.rounds)
+    print(f"pydantic parse + convert: {slow:.2f} ms")
+    print(f"fast path parse + convert: {fast:.2f} ms ({slow / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
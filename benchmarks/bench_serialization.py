@@ -0,0 +1,73 @@
+"""
+Compare non-streaming response serialization: pydantic models encoded by
+FastAPI against pre-shaped dicts written straight to bytes.
+
+    python benchmarks/bench_serialization.py --tool-calls 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import server
+from app.models.anthropic_models import MessagesResponse
+from app.utils.serialization import AnthropicJSONResponse
+
+REQUEST = server.MessagesRequest(model="claude-sonnet-4-20250514", max_tokens=8192,
+                                 messages=[{"role": "user", "content": "go"}])
+
+
+def litellm_response(tool_calls):
+    calls = [{"id": f"call_{i}", "type": "function", "function": {
+        "name": "Edit", "arguments": json.dumps({"path": f"src/module_{i}.py", "old": "x = 1\n" * 20,
+                                                 "new": "x = 2\n" * 20, "replace_all": False})}}
+             for i in range(tool_calls)]
+    return {"id": "chatcmpl-bench", "choices": [{"message": {"content": "Applying the edits.", "tool_calls": calls},
+                                                 "finish_reason": "tool_calls" if calls else "stop"}],
+            "usage": {"prompt_tokens": 1200, "completion_tokens": 300}}
+
+
+def pydantic_path(response):
+    # What the proxy did before: models built, then validated and encoded again by FastAPI
+    model = MessagesResponse(**response)
+    return JSONResponse(jsonable_encoder(model)).body
+
+
+def direct_path(response):
+    return AnthropicJSONResponse(response).body
+
+
+def bench(render, response, rounds):
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        render(response)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response serialization")
+    parser.add_argument("--tool-calls", type=int, default=200, help="tool_use blocks in the large response")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    for label, calls in (("small", 0), ("large", args.tool_calls)):
+        response = server.convert_litellm_to_anthropic(litellm_response(calls), REQUEST)
+        size = len(direct_path(response))
+        slow = bench(pydantic_path, response, args.rounds)
+        fast = bench(direct_path, response, args.rounds)
+        print(f"{label} ({len(response['content'])} blocks, {size / 1024:.1f} KB): "
+              f"pydantic {slow:.1f} us, direct {fast:.1f} us ({slow / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
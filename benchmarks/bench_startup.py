@@ -0,0 +1,76 @@
+"""
+Cold-start benchmark: time from a fresh interpreter to the first served request.
+
+Each phase runs in a new Python process so nothing is already imported:
+
+    python benchmarks/bench_startup.py [--runs 5]
+
+The upstream call is replaced with a canned response, but LiteLLM is still
+loaded on the first /v1/messages request, exactly as in production.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, %(root)r)
+import server
+imported = time.perf_counter()
+litellm_at_import = "litellm" in sys.modules
+from fastapi.testclient import TestClient
+from app.services import llm
+
+async def fake_acompletion(**kwargs):
+    llm.get_litellm()  # pay the lazy import like a real first request
+    return {"id": "msg_bench", "choices": [{"message": {"role": "assistant", "content": "ok"},
+            "finish_reason": "stop"}], "usage": {"prompt_tokens": 1, "completion_tokens": 1}}
+
+llm.acompletion = fake_acompletion
+with TestClient(server.app) as client:
+    ready = time.perf_counter()
+    client.get("/")
+    first_get = time.perf_counter()
+    client.post("/v1/messages", json={"model": "claude-3-haiku-20240307", "max_tokens": 8,
+                                      "messages": [{"role": "user", "content": "hi"}]})
+    first_message = time.perf_counter()
+print(json.dumps({
+    "import_server": imported - started,
+    "ready": ready - started,
+    "first_get": first_get - started,
+    "first_message": first_message - started,
+    "litellm_loaded_at_import": litellm_at_import,
+}))
+"""
+
+
+def run_once() -> dict:
+    code = _PROBE % {"root": ROOT}
+    env = dict(os.environ, LOG_LEVEL="WARNING", BATCH_ENABLED="false")
+    output = subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    if any(result["litellm_loaded_at_import"] for result in results):
+        print("warning: LiteLLM was imported by `import server`")
+    for phase in ("import_server", "ready", "first_get", "first_message"):
+        values = [result[phase] for result in results]
+        print(f"{phase:>15}: median {statistics.median(values) * 1000:8.1f} ms  "
+              f"max {max(values) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
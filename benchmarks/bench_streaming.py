@@ -0,0 +1,97 @@
+"""
+Benchmark the streaming path on recorded upstream traffic, without Ollama.
+
+Record some traffic first (RECORD_UPSTREAM=all or the x-record-upstream header),
+then:
+
+    python benchmarks/bench_streaming.py recordings/ --speed max
+    python benchmarks/bench_streaming.py recordings/ --speed original --pipeline
+
+By default only handle_streaming is measured. --pipeline sends the recorded
+requests through the whole app (validation, conversion, failover, deadlines,
+SSE encoding) with the replay backend standing in for the upstream.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BATCH_ENABLED", "false")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx
+import server
+from app.client.streaming import BridgeClient
+from app.services import llm
+from app.services.recording import ReplayBackend, parse_speed
+
+
+async def bench_handle_streaming(backend, rounds):
+    timings = []
+    events = 0
+    request = server.MessagesRequest(model="claude-3-haiku-20240307", max_tokens=1024,
+                                     messages=[{"role": "user", "content": "replay"}], stream=True)
+    for _ in range(rounds):
+        for recording in backend.recordings:
+            started = time.perf_counter()
+            async for _event in server.handle_streaming(backend.stream(recording), request):
+                events += 1
+            timings.append(time.perf_counter() - started)
+    return timings, events
+
+
+async def bench_pipeline(backend, rounds, concurrency):
+    llm.acompletion = backend.acompletion
+    timings = []
+    events = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=server.app)
+    async with BridgeClient("http://bench", transport=transport) as client:
+        async def one(recording):
+            nonlocal events
+            request = dict(recording.header.get("request") or {})
+            body = {
+                "model": "claude-3-haiku-20240307",
+                "max_tokens": request.get("max_tokens") or 1024,
+                "messages": [{"role": "user", "content": "replay"}],
+            }
+            async with semaphore:
+                result = await client.collect(body)
+            timings.append(result.duration)
+            events += len(result.events)
+
+        await asyncio.gather(*(one(r) for _ in range(rounds) for r in backend.recordings))
+    return timings, events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded upstream streams through the proxy")
+    parser.add_argument("path", help="recording file or directory")
+    parser.add_argument("--speed", default="max", help="original, max, or a multiplier like 2")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--pipeline", action="store_true", help="measure the whole app, not just handle_streaming")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    backend = ReplayBackend(args.path, parse_speed(args.speed))
+    chunks = sum(len(r.records) for r in backend.recordings)
+    print(f"{len(backend.recordings)} recordings, {chunks} chunks, speed {args.speed}")
+
+    started = time.perf_counter()
+    if args.pipeline:
+        timings, events = asyncio.run(bench_pipeline(backend, args.rounds, args.concurrency))
+    else:
+        timings, events = asyncio.run(bench_handle_streaming(backend, args.rounds))
+    elapsed = time.perf_counter() - started
+
+    print(f"{len(timings)} streams, {events} events in {elapsed:.3f}s ({events / elapsed:.0f} events/s)")
+    print(f"per stream: median {statistics.median(timings) * 1000:.2f} ms, max {max(timings) * 1000:.2f} ms")
+    if backend.time_scale == 0:
+        print(f"per upstream chunk: {elapsed / (chunks * args.rounds) * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
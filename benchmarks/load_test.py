@@ -0,0 +1,89 @@
+"""
+Load test for a running proxy using concurrent streaming conversations.
+
+    python benchmarks/load_test.py --conversations 16 --turns 3 --model claude-3-haiku-20240307
+    python benchmarks/load_test.py --uds /tmp/llmbridge.sock
+
+Every conversation keeps its own history and all of them share one pooled
+client, like many Claude Code sessions talking to the same proxy.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.client.streaming import BridgeClient, Conversation
+
+PROMPTS = [
+    "Write a Python function that reverses a linked list.",
+    "Explain what this regex matches: ^[a-z0-9_-]{3,16}$",
+    "Now add type hints and a docstring.",
+    "Summarise the previous answer in one sentence.",
+]
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+async def run_conversation(client, model, turns, max_tokens, results):
+    conversation = Conversation(client, model, max_tokens=max_tokens)
+    for turn in range(turns):
+        started = time.perf_counter()
+        first_token = None
+        chars = 0
+        try:
+            async for event in conversation.send(PROMPTS[turn % len(PROMPTS)]):
+                if event.text:
+                    if first_token is None:
+                        first_token = event.elapsed
+                    chars += len(event.text)
+        except Exception as e:
+            results["errors"].append(str(e))
+            return
+        results["ttft"].append(first_token if first_token is not None else time.perf_counter() - started)
+        results["latency"].append(time.perf_counter() - started)
+        results["chars"] += chars
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Concurrent streaming load test")
+    parser.add_argument("--url", default=os.environ.get("PROXY_URL", "http://localhost:8083"))
+    parser.add_argument("--uds", default=os.environ.get("PROXY_UDS"))
+    parser.add_argument("--model", default=os.environ.get("TEST_MODEL", "claude-3-haiku-20240307"))
+    parser.add_argument("--conversations", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    args = parser.parse_args()
+
+    results = {"ttft": [], "latency": [], "chars": 0, "errors": []}
+    started = time.perf_counter()
+    async with BridgeClient(args.url, uds=args.uds, max_connections=args.conversations) as client:
+        await asyncio.gather(*(
+            run_conversation(client, args.model, args.turns, args.max_tokens, results)
+            for _ in range(args.conversations)
+        ))
+    elapsed = time.perf_counter() - started
+
+    completed = len(results["latency"])
+    print(f"Completed {completed} turns in {elapsed:.2f}s ({completed / elapsed:.2f} turns/s), "
+          f"{len(results['errors'])} errors")
+    for name in ("ttft", "latency"):
+        values = results[name]
+        if values:
+            print(f"{name:>8}: p50 {_percentile(values, 50):.3f}s  p95 {_percentile(values, 95):.3f}s  "
+                  f"mean {statistics.mean(values):.3f}s")
+    print(f"  output: {results['chars'] / elapsed:.0f} chars/s")
+    for error in results["errors"][:5]:
+        print(f"  error: {error}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,43 +1,123 @@
 import logging
+from app.config.settings import LOG_LEVEL
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=getattr(logging, LOG_LEVEL.upper(), logging.INFO))
 logger = logging.getLogger(__name__)
 
 from fastapi import FastAPI, Request, HTTPException
-import uvicorn
+from fastapi.exceptions import RequestValidationError
 import json
-from typing import List, Dict, Any, Optional, Union, Literal
-from pydantic import BaseModel, field_validator
+from typing import List, Dict, Any, Optional, Tuple, Union, Literal
+from pydantic import BaseModel, ValidationError, field_validator
 from app.models.anthropic_models import (
     Message, SystemContent, Tool, ThinkingConfig, ContentBlockText, 
-    ContentBlockToolUse, TokenCountResponse, Usage, MessagesResponse
+    ContentBlockToolUse, CreateMessageBatchRequest
 )
-import httpx
+from app.models.fast_request import MessagesRequestRecord, parse_messages_request
 import os
 from fastapi.responses import JSONResponse, StreamingResponse
-import litellm
 import uuid
 import time
+import hashlib
+import math
+import asyncio
+from contextlib import asynccontextmanager
 
 import re
 from datetime import datetime
 import sys
 
-litellm.set_verbose = True # Set LiteLLM to verbose mode
-
 from app.config.settings import (
-    OLLAMA_API_BASE, ANTHROPIC_API_KEY, OPENAI_API_KEY, GEMINI_API_KEY,
+    ANTHROPIC_API_KEY, OPENAI_API_KEY, GEMINI_API_KEY,
     PREFERRED_PROVIDER, BIG_MODEL, SMALL_MODEL, MODEL_ALIAS_MAP,
-    validate_configuration
+    CONTEXT_FIT_ENABLED, BATCH_ENABLED, BATCH_MAX_REQUESTS,
+    PROMPT_CACHE_ENABLED, PROMPT_CACHE_KEEP_ALIVE, RATE_LIMIT_ENABLED, NUM_CTX_ENABLED,
+    MODEL_REGISTRY_ENABLED, STOP_SEQUENCES_ENFORCED, TOOL_CALL_PARSING_ENABLED, TOOL_FORWARDING_ENABLED,
+    RESPONSE_COMPRESSION_ENABLED, RESPONSE_COMPRESSION_MIN_BYTES, RESPONSE_COMPRESSION_LEVEL, DRAIN_TIMEOUT_SECONDS,
+    LITELLM_WARM_UP, validate_configuration
 )
-
-# Set LiteLLM configuration
-litellm.ollama_api_base = OLLAMA_API_BASE
+from app.utils.context_window import (
+    NumCtxTracker, choose_num_ctx, estimate_message_tokens, estimate_text_tokens,
+    fit_messages_to_context, get_context_length, should_fit_context
+)
+from app.utils.tool_results import ToolResultConverter
+from app.utils.images import image_block_to_part
+from app.utils.serialization import AnthropicJSONResponse, message_dict, usage_dict
+from app.utils.stop_sequences import StopSequenceScanner, find_stop_sequence
+from app.utils.tool_calls import ParsedEvent, ToolCallParser, tool_call_formats
+from app.utils.tool_definitions import convert_tool_choice, prepare_tools
+from app.utils.system_prompt import transform_system_prompt
+from app.utils.compression import RequestBodyError, read_request_body
+from app.services import hedging, llm, metrics
+from app.services.hedging import open_hedged_stream
+from app.services.failover import Backend, UpstreamUnavailableError, breaker_states, call_with_failover
+from app.services.deadlines import (
+    DeadlineExceeded, get_deadlines, open_stream_with_deadlines, run_with_deadline
+)
+from app.services.batches import (
+    BatchProcessor, BatchStore, interactive_finished, interactive_started
+)
+from app.services.prompt_cache import CachePlan, PromptCacheTracker, cache_usage
+from app.services.recording import open_recorded_stream, should_record
+from app.services.rate_limits import RateLimiter, RateLimitExceeded, estimate_body_tokens
+from app.services.scheduler import BACKGROUND, Scheduler, Slot, priority_class
+from app.services.model_registry import registry as model_registry
+from app.services.lifecycle import lifecycle
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+
+# Created in lifespan when BATCH_ENABLED is set
+batch_processor: Optional[BatchProcessor] = None
+
+# Created in lifespan when RATE_LIMIT_ENABLED is set
+rate_limiter: Optional[RateLimiter] = None
+# Rate limit ledger entry shared by requests with no identifiable client
+ANONYMOUS_CLIENT = "anonymous"
+
+prompt_cache = PromptCacheTracker()
 
-app = FastAPI()
+scheduler = Scheduler()
+
+num_ctx_tracker = NumCtxTracker()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global batch_processor, rate_limiter
+    # Validate configuration on startup
+    config_issues = validate_configuration()
+    if config_issues:
+        logger.warning("Configuration issues found:")
+        for issue in config_issues:
+            logger.warning(f"  - {issue}")
+    else:
+        logger.info("Configuration validation passed")
+    logger.debug(f"Model Alias Map: {MODEL_ALIAS_MAP}")
+    if BATCH_ENABLED:
+        batch_processor = BatchProcessor(BatchStore(), run_batch_request, batch_error_type)
+        await batch_processor.start()
+    if RATE_LIMIT_ENABLED:
+        rate_limiter = RateLimiter()
+        await rate_limiter.start()
+    if MODEL_REGISTRY_ENABLED:
+        await model_registry.start()
+    # Loads LiteLLM while the server already accepts connections; the lazy import stays the fallback
+    warm_up = asyncio.create_task(llm.warm_up()) if LITELLM_WARM_UP else None
+    yield
+    if warm_up is not None and not warm_up.done():
+        warm_up.cancel()
+    # Under uvicorn connections are already drained by now; other servers may get here sooner
+    await lifecycle.wait_idle(DRAIN_TIMEOUT_SECONDS)
+    await model_registry.stop()
+    if batch_processor is not None:
+        await batch_processor.stop()
+        batch_processor = None
+    if rate_limiter is not None:
+        await rate_limiter.stop()
+        rate_limiter = None
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware to allow all origins for local development
 app.add_middleware(
@@ -48,21 +128,13 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# Validate configuration on startup
-config_issues = validate_configuration()
-if config_issues:
-    logger.warning("Configuration issues found:")
-    for issue in config_issues:
-        logger.warning(f"  - {issue}")
-else:
-    logger.info("Configuration validation passed")
-
-logger.debug(f"Model Alias Map: {MODEL_ALIAS_MAP}")
-
-
-
-
-
+if RESPONSE_COMPRESSION_ENABLED:
+    # Only for clients sending Accept-Encoding: gzip; event streams are left uncompressed
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=RESPONSE_COMPRESSION_MIN_BYTES,
+        compresslevel=RESPONSE_COMPRESSION_LEVEL,
+    )
 
 class MessagesRequest(BaseModel):
     model: str
@@ -90,10 +162,6 @@ class TokenCountRequest(BaseModel):
     thinking: Optional[ThinkingConfig] = None
     tool_choice: Optional[Dict[str, Any]] = None
     original_model: Optional[str] = None  # Will store the original model name
-    
-    
-
-
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -111,77 +179,85 @@ async def log_requests(request: Request, call_next):
 
 # Not using validation function as we're using the environment API key
 
-def parse_tool_result_content(content):
-    """Helper function to properly parse and normalize tool result content."""
-    if content is None:
-        return "No content provided"
-        
-    if isinstance(content, str):
-        return content
-        
-    if isinstance(content, list):
-        result = ""
-        for item in content:
-            if isinstance(item, dict) and item.get("type") == "text":
-                result += item.get("text", "") + "\n"
-            elif isinstance(item, str):
-                result += item + "\n"
-            elif isinstance(item, dict):
-                if "text" in item:
-                    result += item.get("text", "") + "\n"
-                else:
-                    try:
-                        result += json.dumps(item) + "\n"
-                    except:
-                        result += str(item) + "\n"
-            else:
-                try:
-                    result += str(item) + "\n"
-                except:
-                    result += "Unparseable content\n"
-        return result.strip()
-        
-    if isinstance(content, dict):
-        if content.get("type") == "text":
-            return content.get("text", "")
-        try:
-            return json.dumps(content)
-        except:
-            return str(content)
-            
-    # Fallback for any other type
-    try:
-        return str(content)
-    except:
-        return "Unparseable content"
+def resolve_target_model(requested_model: str) -> str:
+    """Map an Anthropic model name to the provider-prefixed model that serves it."""
+    if requested_model in MODEL_ALIAS_MAP:
+        target_model = f"ollama/{MODEL_ALIAS_MAP[requested_model]}"
+        logger.debug(f"Mapped Anthropic model '{requested_model}' to model '{target_model}'")
+        return target_model
+    if not requested_model.startswith("ollama/") and not requested_model.startswith("openai/") and not requested_model.startswith("gemini/"):
+        # Fallback for models not explicitly mapped, prefix with ollama/
+        if model_registry.models and model_registry.lookup(requested_model) is None:
+            logger.warning(f"Model '{requested_model}' is not installed on any known Ollama host")
+        logger.debug(f"Prefixed model '{requested_model}' with 'ollama/' as no explicit mapping or provider prefix was found.")
+        return f"ollama/{requested_model}"
+    return requested_model
+
+def has_cache_control(block: Any) -> bool:
+    """Check whether a pydantic or dict content block carries a cache_control breakpoint"""
+    if isinstance(block, dict):
+        return bool(block.get("cache_control"))
+    return bool(getattr(block, "cache_control", None))
+
+def convert_anthropic_to_litellm(anthropic_request: MessagesRequest, record_usage: bool = True) -> Dict[str, Any]:
+    """
+    Convert Anthropic API request format to LiteLLM format (which follows OpenAI).
 
-def convert_anthropic_to_litellm(anthropic_request: MessagesRequest) -> Dict[str, Any]:
-    """Convert Anthropic API request format to LiteLLM format (which follows OpenAI)."""
+    record_usage=False is for requests that are only counted, never sent, so
+    they don't feed the tool usage statistics behind TOOL_PRUNING.
+    """
     messages = []
+    # Converted messages that end at a cache_control breakpoint
+    cache_breakpoints = []
+    target_model = resolve_target_model(anthropic_request.model)
     if anthropic_request.system:
         if isinstance(anthropic_request.system, str):
-            messages.append({"role": "system", "content": anthropic_request.system})
+            messages.append({"role": "system", "content": transform_system_prompt(anthropic_request.system, target_model)})
         elif isinstance(anthropic_request.system, list):
-            system_text = ""
+            system_parts = []
             for block in anthropic_request.system:
                 if hasattr(block, 'type') and block.type == "text":
-                    system_text += block.text + "\n\n" # Use \n\n for system messages
+                    system_parts.append(block.text)
                 elif isinstance(block, dict) and block.get("type") == "text":
-                    system_text += block.get("text", "") + "\n\n"
+                    system_parts.append(block.get("text", ""))
+            system_text = "\n\n".join(system_parts).strip() # Use \n\n for system messages
             if system_text:
-                messages.append({"role": "system", "content": system_text.strip()})
+                system_text = transform_system_prompt(system_text, target_model)
+                messages.append({"role": "system", "content": system_text})
+                if any(has_cache_control(block) for block in anthropic_request.system):
+                    cache_breakpoints.append(messages[-1])
 
+    tool_result_converter = ToolResultConverter()
     for msg in anthropic_request.messages:
         litellm_message = {"role": msg.role}
+        tool_messages = []
         if isinstance(msg.content, str):
             litellm_message["content"] = msg.content
         else:
             # Handle list of content blocks
             content_parts = []
             tool_calls = []
+            # Ordered text and image parts, only used when the message has images
+            multimodal_parts = []
+            has_images = False
             for block in msg.content:
-                if hasattr(block, 'type') and block.type == "text":
+                if getattr(block, 'type', None) == "tool_result" or (isinstance(block, dict) and block.get("type") == "tool_result"):
+                    # Anthropic tool results become OpenAI-style tool messages
+                    tool_messages.append(tool_result_converter.convert_block(block))
+                elif getattr(block, 'type', None) == "image" or (isinstance(block, dict) and block.get("type") == "image"):
+                    if model_registry.supports_vision(target_model) is False:
+                        # Ollama rejects image parts for text-only models
+                        placeholder = f"[image omitted: {target_model} does not accept images]"
+                        content_parts.append(placeholder)
+                        multimodal_parts.append({"type": "text", "text": placeholder})
+                        continue
+                    image_part = image_block_to_part(block, target_model)
+                    if image_part:
+                        multimodal_parts.append(image_part)
+                        has_images = True
+                elif hasattr(block, 'type') and block.type == "text":
                     content_parts.append(block.text)
+                    multimodal_parts.append({"type": "text", "text": block.text})
                 elif hasattr(block, 'type') and block.type == "tool_use":
                     # Convert Anthropic tool_use to LiteLLM (OpenAI) tool_calls format
                     tool_calls.append({
@@ -194,6 +270,7 @@ def convert_anthropic_to_litellm(anthropic_request: MessagesRequest) -> Dict[str
                     })
                 elif isinstance(block, dict) and block.get("type") == "text":
                     content_parts.append(block.get("text", ""))
+                    multimodal_parts.append({"type": "text", "text": block.get("text", "")})
                 elif isinstance(block, dict) and block.get("type") == "tool_use":
                     tool_calls.append({
                         "id": block.get("id"),
@@ -204,7 +281,9 @@ def convert_anthropic_to_litellm(anthropic_request: MessagesRequest) -> Dict[str
                         }
                     })
 
-            if content_parts:
+            if has_images:
+                litellm_message["content"] = multimodal_parts # Keep images in order with the text
+            elif content_parts:
                 litellm_message["content"] = "\n".join(content_parts).strip() # Join with newline, then strip
             else:
                 litellm_message["content"] = None # No text content
@@ -222,7 +301,19 @@ def convert_anthropic_to_litellm(anthropic_request: MessagesRequest) -> Dict[str
                     # For other roles with tool_use blocks, this is an unexpected scenario
                     logger.warning(f"Unexpected tool_use block in message with role: {msg.role}")
 
+        # Tool messages must directly follow the assistant message that made the calls
+        messages.extend(tool_messages)
+        marked = not isinstance(msg.content, str) and any(has_cache_control(block) for block in msg.content)
+        if tool_messages and litellm_message.get("content") is None and not litellm_message.get("tool_calls"):
+            if marked:
+                cache_breakpoints.append(messages[-1])
+            continue # Message carried only tool results
         messages.append(litellm_message)
+        if marked:
+            cache_breakpoints.append(litellm_message)
+
+    if tool_result_converter.saved_chars:
+        logger.debug(f"Tool result policy removed {tool_result_converter.saved_chars} characters from the prompt")
 
     litellm_request = {
         "model": anthropic_request.model,
@@ -237,12 +328,25 @@ def convert_anthropic_to_litellm(anthropic_request: MessagesRequest) -> Dict[str
         litellm_request["top_p"] = anthropic_request.top_p
     if anthropic_request.top_k:
         litellm_request["top_k"] = anthropic_request.top_k
+    if TOOL_FORWARDING_ENABLED and anthropic_request.tools:
+        litellm_request["tools"], litellm_request["tool_tokens"] = prepare_tools(
+            anthropic_request.tools, anthropic_request.tool_choice, target_model, anthropic_request.messages,
+            record_usage
+        )
+        tool_choice, parallel_tool_calls = convert_tool_choice(anthropic_request.tool_choice)
+        if tool_choice is not None:
+            litellm_request["tool_choice"] = tool_choice
+        if parallel_tool_calls is not None:
+            litellm_request["parallel_tool_calls"] = parallel_tool_calls
+    if cache_breakpoints:
+        litellm_request["cache_breakpoints"] = cache_breakpoints
     return litellm_request
 
 
 def convert_litellm_to_anthropic(litellm_response: Union[Dict[str, Any], Any], 
-                                 original_request: MessagesRequest) -> MessagesResponse:
-    """Convert LiteLLM (OpenAI format) response to Anthropic API response format."""
+                                 original_request: MessagesRequest,
+                                 cache_plan: Optional[CachePlan] = None) -> Dict[str, Any]:
+    """Convert LiteLLM (OpenAI format) response to an Anthropic API response dict (MessagesResponse shape)."""
     
     # Enhanced response extraction with better error handling
     try:
@@ -253,8 +357,10 @@ def convert_litellm_to_anthropic(litellm_response: Union[Dict[str, Any], Any],
         elif clean_model.startswith("openai/"):
             clean_model = clean_model[len("openai/"):]
         
-        # Check if this is a Claude model (which supports content blocks)
-        is_claude_model = clean_model.startswith("claude-")
+        # Tool calls become tool_use blocks when the served model supports tools; for
+        # models the registry hasn't discovered, go by the requested model's name
+        supports_tools = model_registry.supports_tools(resolve_target_model(original_request.model))
+        use_tool_blocks = supports_tools if supports_tools is not None else clean_model.startswith("claude-")
         
         # Handle ModelResponse object from LiteLLM
         if hasattr(litellm_response, 'choices') and hasattr(litellm_response, 'usage'):
@@ -292,15 +398,43 @@ def convert_litellm_to_anthropic(litellm_response: Union[Dict[str, Any], Any],
             usage_info = response_dict.get("usage", {})
             response_id = response_dict.get("id", f"msg_{uuid.uuid4()}")
         
+        # Backends that ignore "stop" keep generating past the stop sequence
+        stop_sequence = None
+        if STOP_SEQUENCES_ENFORCED and original_request.stop_sequences and content_text:
+            match = find_stop_sequence(content_text, original_request.stop_sequences)
+            if match is not None:
+                index, stop_sequence = match
+                content_text = content_text[:index]
+                tool_calls = None
+                metrics.increment("stop_sequences.enforced")
+
         # Create content list for Anthropic format
         content = []
         
+        # Models without native tool calling may write their tool calls into the text
+        parsed_tool_calls = 0
+        if TOOL_CALL_PARSING_ENABLED and original_request.tools and content_text and not tool_calls:
+            formats = tool_call_formats(resolve_target_model(original_request.model))
+            if formats:
+                parser = ToolCallParser(formats, [tool.name for tool in original_request.tools])
+                for event in parser.feed(content_text) + parser.flush():
+                    if not isinstance(event, str):
+                        content.append({"type": "tool_use", "id": event.id, "name": event.name, "input": event.input})
+                    elif content and content[-1]["type"] == "text":
+                        content[-1]["text"] += event
+                    else:
+                        content.append({"type": "text", "text": event})
+                parsed_tool_calls = parser.found
+                if parsed_tool_calls:
+                    metrics.increment("tool_calls.parsed", parsed_tool_calls)
+                content_text = None
+        
         # Add text content block if present (text might be None or empty for pure tool call responses)
         if content_text is not None and content_text != "":
             content.append({"type": "text", "text": content_text})
         
-        # Add tool calls if present (tool_use in Anthropic format) - only for Claude models
-        if tool_calls and is_claude_model:
+        # Add tool calls if present (tool_use in Anthropic format)
+        if tool_calls and use_tool_blocks:
             logger.debug(f"Processing tool calls: {tool_calls}")
             
             # Convert to list if it's not already
@@ -338,9 +472,9 @@ def convert_litellm_to_anthropic(litellm_response: Union[Dict[str, Any], Any],
                     "name": name,
                     "input": arguments
                 })
-        elif tool_calls and not is_claude_model:
-            # For non-Claude models, convert tool calls to text format
-            logger.debug(f"Converting tool calls to text for non-Claude model: {clean_model}")
+        elif tool_calls and not use_tool_blocks:
+            # Otherwise describe the tool calls in the text
+            logger.debug(f"Converting tool calls to text for model without tool support: {clean_model}")
             
             # We'll append tool info to the text content
             tool_text = "\n\nTool usage:\n"
@@ -398,27 +532,28 @@ def convert_litellm_to_anthropic(litellm_response: Union[Dict[str, Any], Any],
             stop_reason = "tool_use"
         else:
             stop_reason = "end_turn"  # Default
+        if parsed_tool_calls and stop_reason == "end_turn":
+            stop_reason = "tool_use"
+        if stop_sequence is not None:
+            stop_reason = "stop_sequence"
         
         # Make sure content is never empty
         if not content:
             content.append({"type": "text", "text": ""})
         
-        # Create Anthropic-style response
-        anthropic_response = MessagesResponse(
+        # Create Anthropic-style response, already shaped for serialization
+        return message_dict(
             id=response_id,
             model=original_request.model,
-            role="assistant",
             content=content,
             stop_reason=stop_reason,
-            stop_sequence=None,
-            usage=Usage(
-                input_tokens=prompt_tokens,
-                output_tokens=completion_tokens
-            )
+            usage=usage_dict(
+                output_tokens=completion_tokens,
+                **cache_usage(cache_plan, prompt_tokens)
+            ),
+            stop_sequence=stop_sequence
         )
         
-        return anthropic_response
-        
     except Exception as e:
         import traceback
         error_traceback = traceback.format_exc()
@@ -426,17 +561,91 @@ def convert_litellm_to_anthropic(litellm_response: Union[Dict[str, Any], Any],
         logger.error(error_message)
         
         # In case of any error, create a fallback response
-        return MessagesResponse(
+        return message_dict(
             id=f"msg_{uuid.uuid4()}",
             model=original_request.model,
-            role="assistant",
             content=[{"type": "text", "text": f"Error converting response: {str(e)}. Please check server logs."}],
             stop_reason="end_turn",
-            usage=Usage(input_tokens=0, output_tokens=0)
+            usage=usage_dict(input_tokens=0, output_tokens=0)
         )
 
-async def handle_streaming(response_generator, original_request: MessagesRequest):
+def sse_event(event_type: str, data: Dict[str, Any]) -> str:
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+class StreamContentBlocks:
+    """Opens and closes the content blocks of a streamed message and renders their events."""
+
+    def __init__(self):
+        self.index = -1
+        self.open_type: Optional[str] = None
+        self.tool_uses = 0
+        # Upstream tool_calls index -> content block index
+        self.native_tools: Dict[int, int] = {}
+
+    def _start(self, block: Dict[str, Any]) -> List[str]:
+        events = self.close()
+        self.index += 1
+        self.open_type = block["type"]
+        events.append(sse_event("content_block_start", {
+            "type": "content_block_start", "index": self.index, "content_block": block
+        }))
+        return events
+
+    def close(self) -> List[str]:
+        if self.open_type is None:
+            return []
+        self.open_type = None
+        return [sse_event("content_block_stop", {"type": "content_block_stop", "index": self.index})]
+
+    def start_text(self) -> List[str]:
+        return self._start({"type": "text", "text": ""})
+
+    def text(self, text: str) -> List[str]:
+        events = self.start_text() if self.open_type != "text" else []
+        events.append(sse_event("content_block_delta", {
+            "type": "content_block_delta", "index": self.index, "delta": {"type": "text_delta", "text": text}
+        }))
+        return events
+
+    def tool_use(self, tool_id: str, name: str) -> List[str]:
+        self.tool_uses += 1
+        return self._start({"type": "tool_use", "id": tool_id, "name": name, "input": {}})
+
+    def input_json(self, partial_json: str) -> List[str]:
+        return [sse_event("content_block_delta", {
+            "type": "content_block_delta", "index": self.index,
+            "delta": {"type": "input_json_delta", "partial_json": partial_json}
+        })]
+
+    def native_tool_call(self, tool_call: Any) -> List[str]:
+        """A tool_calls delta from an upstream with native tool calling"""
+        events = []
+        position = getattr(tool_call, "index", 0) or 0
+        function = getattr(tool_call, "function", None)
+        if position not in self.native_tools:
+            tool_id = getattr(tool_call, "id", None) or f"toolu_{uuid.uuid4().hex[:24]}"
+            events += self.tool_use(tool_id, getattr(function, "name", None) or "")
+            self.native_tools[position] = self.index
+        arguments = getattr(function, "arguments", None)
+        if arguments and self.native_tools[position] == self.index:
+            events += self.input_json(arguments if isinstance(arguments, str) else json.dumps(arguments))
+        return events
+
+    def parsed(self, events: List[ParsedEvent]) -> List[str]:
+        """Text and tool calls from a ToolCallParser"""
+        rendered = []
+        for event in events:
+            if isinstance(event, str):
+                rendered += self.text(event)
+            else:
+                rendered += self.tool_use(event.id, event.name)
+                rendered += self.input_json(json.dumps(event.input))
+        return rendered
+
+async def handle_streaming(response_generator, original_request: MessagesRequest,
+                           cache_plan: Optional[CachePlan] = None):
     """Handle streaming responses from LiteLLM and convert to a compliant Anthropic format."""
+    blocks = StreamContentBlocks()
     try:
         # 1. Send message_start
         message_id = f"msg_{uuid.uuid4()}"
@@ -456,29 +665,38 @@ async def handle_streaming(response_generator, original_request: MessagesRequest
         yield f"event: message_start\ndata: {json.dumps(message_start_event)}\n\n"
 
         # 2. Send content_block_start
-        content_block_start_event = {
-            "type": "content_block_start",
-            "index": 0,
-            "content_block": {"type": "text", "text": ""}
-        }
-        yield f"event: content_block_start\ndata: {json.dumps(content_block_start_event)}\n\n"
+        for event in blocks.start_text():
+            yield event
 
         # 3. Stream content_block_delta
         finish_reason = None
         output_tokens = 0
         input_tokens = 0
+        # Text that may begin a stop sequence is held back until the next chunk
+        scanner = None
+        if STOP_SEQUENCES_ENFORCED and original_request.stop_sequences:
+            scanner = StopSequenceScanner(original_request.stop_sequences)
+        # Tool calls written into the text by models without native tool calling
+        parser = None
+        if TOOL_CALL_PARSING_ENABLED and original_request.tools:
+            formats = tool_call_formats(resolve_target_model(original_request.model))
+            parser = ToolCallParser(formats, [tool.name for tool in original_request.tools]) if formats else None
 
         async for chunk in response_generator:
             if hasattr(chunk, 'choices') and len(chunk.choices) > 0:
                 choice = chunk.choices[0]
                 if hasattr(choice, 'delta') and getattr(choice.delta, 'content', None):
                     delta_content = choice.delta.content
-                    text_delta_event = {
-                        'type': 'content_block_delta',
-                        'index': 0,
-                        'delta': {'type': 'text_delta', 'text': delta_content}
-                    }
-                    yield f"event: content_block_delta\ndata: {json.dumps(text_delta_event)}\n\n"
+                    if scanner is not None:
+                        delta_content = scanner.feed(delta_content)
+                    if delta_content:
+                        events = blocks.parsed(parser.feed(delta_content)) if parser else blocks.text(delta_content)
+                        for event in events:
+                            yield event
+
+                for tool_call in getattr(getattr(choice, 'delta', None), 'tool_calls', None) or []:
+                    for event in blocks.native_tool_call(tool_call):
+                        yield event
 
                 if getattr(choice, 'finish_reason', None):
                     finish_reason = choice.finish_reason
@@ -489,6 +707,31 @@ async def handle_streaming(response_generator, original_request: MessagesRequest
                 if hasattr(chunk.usage, 'completion_tokens'):
                     output_tokens = chunk.usage.completion_tokens
 
+            if scanner is not None and scanner.matched is not None:
+                # Stop the upstream now rather than letting it generate to max_tokens
+                metrics.increment("stop_sequences.enforced")
+                logger.debug(f"Stop sequence {scanner.matched!r} matched, cancelling upstream")
+                finish_reason = "stop_sequence"
+                await response_generator.aclose()
+                break
+
+        held = scanner.flush() if scanner is not None and scanner.matched is None else ""
+        if parser is not None:
+            events = blocks.parsed(parser.feed(held) + parser.flush())
+            if parser.found:
+                metrics.increment("tool_calls.parsed", parser.found)
+        else:
+            events = blocks.text(held) if held else []
+        for event in events:
+            yield event
+
+    except DeadlineExceeded as e:
+        # Upstream already cancelled by the deadline; end the stream with a clean error
+        logger.error(f"Stream deadline exceeded: {e}")
+        error_event = {"type": "error", "error": {"type": "timeout_error", "message": str(e)}}
+        yield f"event: error\ndata: {json.dumps(error_event)}\n\n"
+        await response_generator.aclose()
+        return
     except Exception as e:
         logger.error(f"Error during stream processing: {e}")
         error_event = {"type": "error", "error": {"type": "internal_server_error", "message": str(e)}}
@@ -496,17 +739,21 @@ async def handle_streaming(response_generator, original_request: MessagesRequest
         finish_reason = "error"
 
     # 4. Send content_block_stop
-    content_block_stop_event = {"type": "content_block_stop", "index": 0}
-    yield f"event: content_block_stop\ndata: {json.dumps(content_block_stop_event)}\n\n"
+    for event in blocks.close():
+        yield event
 
     # 5. Send message_delta
-    stop_reason_map = {"length": "max_tokens", "tool_calls": "tool_use", "stop": "end_turn"}
+    stop_reason_map = {"length": "max_tokens", "tool_calls": "tool_use", "stop": "end_turn",
+                       "stop_sequence": "stop_sequence"}
     stop_reason = stop_reason_map.get(finish_reason, "end_turn")
+    if blocks.tool_uses and stop_reason == "end_turn":
+        stop_reason = "tool_use"
+    stop_sequence = scanner.matched if finish_reason == "stop_sequence" else None
 
     message_delta_event = {
         "type": "message_delta",
-        "delta": {"stop_reason": stop_reason, "stop_sequence": None},
-        "usage": {"output_tokens": output_tokens}
+        "delta": {"stop_reason": stop_reason, "stop_sequence": stop_sequence},
+        "usage": {"output_tokens": output_tokens, **cache_usage(cache_plan, input_tokens)}
     }
     yield f"event: message_delta\ndata: {json.dumps(message_delta_event)}\n\n"
 
@@ -517,48 +764,259 @@ async def handle_streaming(response_generator, original_request: MessagesRequest
     # LiteLLM proxy client expects a [DONE] message to terminate.
     yield "data: [DONE]\n\n"
 
-@app.post("/v1/messages")
-async def create_message(
-    request: MessagesRequest,
-    raw_request: Request
-):
+def prepare_litellm_request(request: MessagesRequest,
+                            session: Optional[str] = None) -> Tuple[Dict[str, Any], Optional[CachePlan]]:
+    """Convert a request, fit it to the model that will serve it and plan prompt caching."""
+    litellm_request = convert_anthropic_to_litellm(request)
+    cache_breakpoints = litellm_request.pop("cache_breakpoints", [])
+    # Tool definitions share the context window with the messages
+    tool_tokens = litellm_request.pop("tool_tokens", 0)
+    
+    logger.debug(f"LiteLLM Request: {litellm_request}")
+    
+    # Map Anthropic model names to configured models
+    litellm_request["model"] = resolve_target_model(litellm_request["model"])
+
+    # Trim the history so the prompt fits the target model's context window
+    if CONTEXT_FIT_ENABLED and should_fit_context(litellm_request["model"]):
+        litellm_request["messages"], _ = fit_messages_to_context(
+            litellm_request["messages"],
+            litellm_request["model"],
+            litellm_request["max_tokens"],
+            tool_tokens
+        )
+
+    if NUM_CTX_ENABLED and litellm_request["model"].startswith(("ollama/", "ollama_chat/")):
+        # Big enough for this prompt, without paying for a huge fixed context on small requests
+        prompt_tokens = sum(estimate_message_tokens(message) for message in litellm_request["messages"]) + tool_tokens
+        litellm_request["num_ctx"] = choose_num_ctx(
+            litellm_request["model"], prompt_tokens, litellm_request["max_tokens"]
+        )
+
+    cache_plan = None
+    if PROMPT_CACHE_ENABLED and session and cache_breakpoints:
+        cache_plan = prompt_cache.plan(
+            session, litellm_request["model"], litellm_request["messages"], cache_breakpoints
+        )
+        if litellm_request["model"].startswith(("ollama/", "ollama_chat/")):
+            # Keep the model loaded so its KV cache survives until the next turn
+            litellm_request["keep_alive"] = PROMPT_CACHE_KEEP_ALIVE
+        logger.debug(
+            f"Prompt cache plan for session {session}: {len(cache_plan.breakpoints)} breakpoints, "
+            f"~{cache_plan.warm_tokens} warm tokens on {cache_plan.api_base}"
+        )
+    return litellm_request, cache_plan
+
+def upstream_params(litellm_request: Dict[str, Any], backend: Backend) -> Dict[str, Any]:
+    """The request as sent to one backend of the failover chain."""
+    params = {**litellm_request, "model": backend.model}
+    if "tools" in params:
+        if model_registry.supports_tools(backend.model) is False:
+            # Ollama rejects tools for models without tool support; ToolCallParser still reads their text
+            for key in ("tools", "tool_choice", "parallel_tool_calls"):
+                params.pop(key, None)
+        elif backend.model.startswith("ollama/"):
+            # Only Ollama's chat API takes tools natively; LiteLLM's generate path would force JSON output
+            params["model"] = "ollama_chat/" + backend.model[len("ollama/"):]
+    if "num_ctx" in params:
+        # A failover model may have a smaller context window than the requested one
+        params["num_ctx"] = min(params["num_ctx"], get_context_length(backend.model))
+        num_ctx_tracker.observe(backend.model, backend.api_base, params["num_ctx"])
+    return params
+
+def client_identity(request: MessagesRequest, raw_request: Request) -> Optional[str]:
+    """Identify the client behind a request, for prompt cache sessions and rate limits."""
+    user_id = (request.metadata or {}).get("user_id")
+    if user_id:
+        return f"user:{user_id}"
+    api_key = raw_request.headers.get("x-api-key")
+    if api_key:
+        return f"key:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]}"
+    return f"client:{raw_request.client.host}" if raw_request.client else None
+
+async def complete_message(request: MessagesRequest, session: Optional[str] = None) -> Dict[str, Any]:
+    """Run a non-streaming request through failover and convert the response."""
+    litellm_request, cache_plan = prepare_litellm_request(request, session)
+    return await complete_prepared(request, litellm_request, cache_plan)
+
+async def complete_prepared(request: MessagesRequest, litellm_request: Dict[str, Any],
+                            cache_plan: Optional[CachePlan]) -> Dict[str, Any]:
+    """Run an already prepared non-streaming request."""
+    async def complete(backend: Backend, alternates: List[Backend]):
+        response = await run_with_deadline(llm.acompletion(
+            **upstream_params(litellm_request, backend),
+            api_base=backend.api_base, # Explicitly pass api_base
+            api_key="EMPTY" # Explicitly pass api_key
+        ), "total", get_deadlines(backend.model).total, backend.model)
+        if cache_plan:
+            prompt_cache.record(cache_plan, backend.model, backend.api_base)
+        return response
+
+    litellm_response = await call_with_failover(
+        litellm_request["model"], complete, cache_plan.api_base if cache_plan else None
+    )
+    return convert_litellm_to_anthropic(litellm_response, request, cache_plan)
+
+async def track_interactive_stream(generator, slot: Optional[Slot] = None):
+    """Keep a stream counted as interactive and in-flight traffic, and its upstream slot held, until it finishes."""
     try:
-        litellm_request = convert_anthropic_to_litellm(request)
-        
-        logger.debug(f"LiteLLM Request: {litellm_request}")
-        
-        # Map Anthropic model names to configured models
-        requested_model = litellm_request["model"]
-        if requested_model in MODEL_ALIAS_MAP:
-            litellm_request["model"] = f"ollama/{MODEL_ALIAS_MAP[requested_model]}"
-            logger.debug(f"Mapped Anthropic model '{requested_model}' to model '{litellm_request['model']}'")
-        elif not requested_model.startswith("ollama/") and not requested_model.startswith("openai/") and not requested_model.startswith("gemini/"):
-            # Fallback for models not explicitly mapped, prefix with ollama/
-            litellm_request["model"] = f"ollama/{requested_model}"
-            logger.debug(f"Prefixed model '{requested_model}' with 'ollama/' as no explicit mapping or provider prefix was found.")
+        async for event in generator:
+            yield event
+    finally:
+        interactive_finished()
+        lifecycle.request_finished()
+        if slot is not None:
+            slot.release()
+
+async def meter_output_tokens(stream, client: str):
+    """Pass upstream chunks through and charge the client's output tokens when the stream ends."""
+    output_tokens = 0
+    estimated_tokens = 0
+    try:
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None)
+            if getattr(usage, "completion_tokens", None):
+                output_tokens = usage.completion_tokens
+            choices = getattr(chunk, "choices", None)
+            content = getattr(getattr(choices[0], "delta", None), "content", None) if choices else None
+            if content:
+                # Ollama streams often carry no usage, so fall back to an estimate
+                estimated_tokens += estimate_text_tokens(content)
+            yield chunk
+    finally:
+        if rate_limiter is not None:
+            rate_limiter.record_output(client, output_tokens or estimated_tokens)
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+def rate_limit_response(error: RateLimitExceeded) -> AnthropicJSONResponse:
+    """Anthropic-style 429 for a client over its limits."""
+    return AnthropicJSONResponse(
+        {"type": "error", "error": {"type": "rate_limit_error", "message": str(error)}},
+        status_code=429,
+        headers={"retry-after": str(max(1, math.ceil(error.retry_after)))}
+    )
 
+def request_body_error_response(error: RequestBodyError) -> AnthropicJSONResponse:
+    """Anthropic-style error for a body that is too large, corrupt or in an unknown encoding."""
+    return AnthropicJSONResponse(
+        {"type": "error", "error": {"type": error.error_type, "message": str(error)}},
+        status_code=error.status_code
+    )
+
+async def read_messages_request(raw_request: Request) -> Tuple[Union[MessagesRequest, MessagesRequestRecord], int]:
+    """
+    Parse a /v1/messages body, through the fast path when it can.
+
+    Returns the request and the size of its decompressed body. Compressed
+    bodies are decompressed first. Bodies the fast path does not handle are
+    validated with MessagesRequest and rejected with the same 422 errors
+    FastAPI would produce.
+    """
+    body = await read_request_body(raw_request)
+    request = parse_messages_request(body)
+    if request is not None:
+        metrics.increment("request_parse.fast")
+        return request, len(body)
+    metrics.increment("request_parse.validated")
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([{
+            "type": "json_invalid", "loc": ("body", e.pos), "msg": "JSON decode error",
+            "input": {}, "ctx": {"error": e.msg},
+        }], body=e.doc)
+    try:
+        return MessagesRequest.model_validate(data), len(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)],
+            body=data
+        )
+
+@app.post("/v1/messages")
+async def create_message(raw_request: Request):
+    try:
+        request, body_bytes = await read_messages_request(raw_request)
+    except RequestBodyError as e:
+        metrics.increment(f"request_body.rejected.{e.status_code}")
+        logger.warning(f"Rejected request body: {e}")
+        return request_body_error_response(e)
+    interactive_started()
+    lifecycle.request_started()
+    handed_off = False
+    slot = None
+    try:
+        client = client_identity(request, raw_request)
+        if rate_limiter is not None:
+            # Checked before the request is converted, so rejecting a client costs next to nothing
+            rate_limiter.acquire(client or ANONYMOUS_CLIENT, estimate_body_tokens(body_bytes))
+        litellm_request, cache_plan = prepare_litellm_request(request, client)
+        prompt_tokens = sum(estimate_message_tokens(message) for message in litellm_request["messages"])
+        # Waits for an upstream slot; shorter interactive jobs go first
+        slot = await scheduler.acquire(
+            priority_class(request.model, raw_request.url.path), prompt_tokens + request.max_tokens
+        )
         # Separate logic for streaming and non-streaming
         if request.stream:
-            response_generator = await litellm.acompletion(
-                **litellm_request,
-                api_base=OLLAMA_API_BASE, # Explicitly pass api_base
-                api_key="EMPTY" # Explicitly pass api_key (Ollama doesn't use it, but LiteLLM might expect it)
+            record = should_record(litellm_request["model"], raw_request.headers)
+
+            async def open_stream(backend: Backend):
+                open_call = llm.acompletion(
+                    **upstream_params(litellm_request, backend),
+                    api_base=backend.api_base, # Explicitly pass api_base
+                    api_key="EMPTY" # Explicitly pass api_key (Ollama doesn't use it, but LiteLLM might expect it)
+                )
+                if record:
+                    # Raw upstream chunks and their timing, for offline replay
+                    open_call = open_recorded_stream(open_call, backend.model, backend.api_base, litellm_request)
+                # Connect, first-token, idle and total deadlines are enforced on the returned stream
+                return await open_stream_with_deadlines(open_call, backend.model)
+
+            async def start_stream(backend: Backend, alternates: List[Backend]):
+                # Waits for the first chunk, hedging to another host with the same model if it is late
+                hedge_backends = [backend] + [b for b in alternates if b.model == backend.model]
+                stream = await open_hedged_stream(backend.model, open_stream, hedge_backends)
+                if cache_plan:
+                    prompt_cache.record(cache_plan, backend.model, backend.api_base)
+                return stream
+
+            # Retries and failover only happen here, before the first byte reaches the client
+            hedging.on_request()
+            response_generator = await call_with_failover(
+                litellm_request["model"], start_stream, cache_plan.api_base if cache_plan else None
             )
+            if rate_limiter is not None:
+                response_generator = meter_output_tokens(response_generator, client or ANONYMOUS_CLIENT)
+            handed_off = True
             return StreamingResponse(
-                handle_streaming(response_generator, request),
+                track_interactive_stream(handle_streaming(response_generator, request, cache_plan), slot),
                 media_type="text/event-stream"
             )
         else:
-            litellm_response = await litellm.acompletion(
-                **litellm_request,
-                api_base=OLLAMA_API_BASE, # Explicitly pass api_base
-                api_key="EMPTY" # Explicitly pass api_key
-            )
-            anthropic_response = convert_litellm_to_anthropic(litellm_response, request)
-            return anthropic_response
+            response = await complete_prepared(request, litellm_request, cache_plan)
+            if rate_limiter is not None:
+                rate_limiter.record_output(client or ANONYMOUS_CLIENT, response["usage"]["output_tokens"])
+            return AnthropicJSONResponse(response)
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited {e.client}: {e}")
+        return rate_limit_response(e)
+    except UpstreamUnavailableError as e:
+        logger.error(f"No upstream available: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except DeadlineExceeded as e:
+        logger.error(f"Upstream deadline exceeded: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing request: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not handed_off:
+            interactive_finished()
+            lifecycle.request_finished()
+            if slot is not None:
+                slot.release()
 
 @app.post("/v1/messages/count_tokens")
 async def count_tokens(
@@ -586,25 +1044,21 @@ async def count_tokens(
                 tools=request.tools,
                 tool_choice=request.tool_choice,
                 thinking=request.thinking
-            )
+            ),
+            record_usage=False
         )
         
         # Use LiteLLM's token_counter function
         try:
-            # Import token_counter function
-            from litellm import token_counter
+            # Import token_counter function (loads LiteLLM on first use)
+            token_counter = llm.token_counter
             
-            # Log the request beautifully
+            # Log the request
             num_tools = len(request.tools) if request.tools else 0
             
-            log_request_beautifully(
-                "POST",
-                raw_request.url.path,
-                display_model,
-                converted_request.get('model'),
-                len(converted_request['messages']),
-                num_tools,
-                200  # Assuming success at this point
+            logger.info(
+                f"POST {raw_request.url.path} {display_model} -> {converted_request.get('model')} "
+                f"({len(converted_request['messages'])} messages, {num_tools} tools)"
             )
             
             # Count tokens
@@ -614,12 +1068,12 @@ async def count_tokens(
             )
             
             # Return Anthropic-style response
-            return TokenCountResponse(input_tokens=token_count)
+            return AnthropicJSONResponse({"input_tokens": token_count})
             
         except ImportError:
             logger.error("Could not import token_counter from litellm")
             # Fallback to a simple approximation
-            return TokenCountResponse(input_tokens=1000)  # Default fallback
+            return AnthropicJSONResponse({"input_tokens": 1000})  # Default fallback
             
     except Exception as e:
         import traceback
@@ -627,10 +1081,129 @@ async def count_tokens(
         logger.error(f"Error counting tokens: {str(e)}\n{error_traceback}")
         raise HTTPException(status_code=500, detail=f"Error counting tokens: {str(e)}")
 
+def batch_error_type(error: Exception) -> str:
+    """Anthropic error type recorded for a failed batch request."""
+    if isinstance(error, UpstreamUnavailableError):
+        return "overloaded_error"
+    if isinstance(error, DeadlineExceeded):
+        return "timeout_error"
+    if isinstance(error, ValidationError):
+        return "invalid_request_error"
+    return "api_error"
+
+async def run_batch_request(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one batch request as a non-streaming message."""
+    request = MessagesRequest(**{**params, "stream": False})
+    estimated_tokens = estimate_text_tokens(json.dumps(params.get("messages", []))) + request.max_tokens
+    slot = await scheduler.acquire(BACKGROUND, estimated_tokens)
+    try:
+        return await complete_message(request)
+    finally:
+        slot.release()
+
+def get_batch_processor() -> BatchProcessor:
+    if batch_processor is None:
+        raise HTTPException(status_code=404, detail="Message batches are disabled")
+    return batch_processor
+
+@app.post("/v1/messages/batches")
+async def create_message_batch(request: CreateMessageBatchRequest):
+    processor = get_batch_processor()
+    if not request.requests:
+        raise HTTPException(status_code=400, detail="A batch needs at least one request")
+    if len(request.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=413, detail=f"A batch can hold at most {BATCH_MAX_REQUESTS} requests")
+    custom_ids = set()
+    entries = []
+    for item in request.requests:
+        if item.custom_id in custom_ids:
+            raise HTTPException(status_code=400, detail=f"Duplicate custom_id: {item.custom_id}")
+        custom_ids.add(item.custom_id)
+        try:
+            params = MessagesRequest(**item.params)
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid params for {item.custom_id}: {e}")
+        # Per-model concurrency is keyed by the model that will actually serve the request
+        entries.append((item.custom_id, resolve_target_model(params.model), item.params))
+    batch = await asyncio.to_thread(processor.store.create_batch, entries)
+    processor.notify()
+    return batch
+
+@app.get("/v1/messages/batches")
+async def list_message_batches(limit: int = 20, after_id: Optional[str] = None):
+    processor = get_batch_processor()
+    batches, has_more = await asyncio.to_thread(processor.store.list_batches, min(max(limit, 1), 1000), after_id)
+    return {
+        "data": batches,
+        "has_more": has_more,
+        "first_id": batches[0]["id"] if batches else None,
+        "last_id": batches[-1]["id"] if batches else None,
+    }
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def get_message_batch(batch_id: str):
+    batch = await asyncio.to_thread(get_batch_processor().store.get_batch, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch not found: {batch_id}")
+    return batch
+
+@app.post("/v1/messages/batches/{batch_id}/cancel")
+async def cancel_message_batch(batch_id: str):
+    batch = await asyncio.to_thread(get_batch_processor().store.cancel_batch, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch not found: {batch_id}")
+    return batch
+
+@app.delete("/v1/messages/batches/{batch_id}")
+async def delete_message_batch(batch_id: str):
+    deleted = await asyncio.to_thread(get_batch_processor().store.delete_batch, batch_id)
+    if deleted is None:
+        raise HTTPException(status_code=404, detail=f"Batch not found: {batch_id}")
+    if not deleted:
+        raise HTTPException(status_code=400, detail="Only ended batches can be deleted; cancel it first")
+    return {"id": batch_id, "type": "message_batch_deleted"}
+
+@app.get("/v1/messages/batches/{batch_id}/results")
+async def get_message_batch_results(batch_id: str):
+    store = get_batch_processor().store
+    batch = await asyncio.to_thread(store.get_batch, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch not found: {batch_id}")
+    if batch["processing_status"] != "ended":
+        raise HTTPException(status_code=400, detail="Batch results are available once the batch has ended")
+
+    async def stream_results():
+        pages = store.iter_results_jsonl(batch_id)
+        while True:
+            page = await asyncio.to_thread(next, pages, None)
+            if page is None:
+                return
+            yield page
+
+    return StreamingResponse(stream_results(), media_type="application/x-jsonl")
+
 @app.get("/")
 async def root():
     return {"message": "Anthropic Proxy for LiteLLM"}
 
+@app.get("/health")
+async def health():
+    # 503 while draining, so load balancers stop sending traffic here
+    state = lifecycle.state()
+    return AnthropicJSONResponse({"status": "draining" if state["draining"] else "ok", **state},
+                                 status_code=503 if state["draining"] else 200)
+
+@app.get("/metrics")
+async def get_metrics():
+    snapshot = metrics.snapshot()
+    snapshot["lifecycle"] = lifecycle.state()
+    snapshot["circuit_breakers"] = breaker_states()
+    snapshot["scheduler"] = scheduler.state()
+    snapshot["models"] = model_registry.snapshot()
+    if rate_limiter is not None:
+        snapshot["rate_limits"] = rate_limiter.snapshot()["clients"]
+    return snapshot
+
 
 
 if __name__ == "__main__":
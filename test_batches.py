@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for the Message Batches API and its persistent job queue.
+"""
+
+import json
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+import server
+from app.models.anthropic_models import MessagesResponse
+from app.services import batches
+from app.services.batches import BatchStore
+
+
+def _client(monkeypatch, tmp_path):
+    db_path = str(tmp_path / "batches.db")
+    monkeypatch.setattr(server, "BATCH_ENABLED", True)
+    monkeypatch.setattr(server, "BatchStore", lambda: BatchStore(db_path))
+    monkeypatch.setattr(batches, "BATCH_INTERACTIVE_GRACE_SECONDS", 0)
+    monkeypatch.setattr(batches.BatchProcessor, "POLL_SECONDS", 0.05)
+
+    async def fake_complete(request):
+        if "fail" in request.messages[0].content:
+            raise ValueError("boom")
+        return MessagesResponse(
+            id="msg_test", model=request.model, content=[{"type": "text", "text": "done"}],
+            stop_reason="end_turn", usage={"input_tokens": 1, "output_tokens": 1}
+        ).model_dump()
+
+    monkeypatch.setattr(server, "complete_message", fake_complete)
+    return TestClient(server.app)
+
+
+def _params(text):
+    return {"model": "claude-3-haiku-20240307", "max_tokens": 10,
+            "messages": [{"role": "user", "content": text}]}
+
+
+def test_batch_lifecycle(monkeypatch, tmp_path):
+    with _client(monkeypatch, tmp_path) as client:
+        created = client.post("/v1/messages/batches", json={"requests": [
+            {"custom_id": "a", "params": _params("hello")},
+            {"custom_id": "b", "params": _params("please fail")},
+        ]}).json()
+        assert created["type"] == "message_batch"
+        assert created["processing_status"] == "in_progress"
+
+        for _ in range(100):
+            batch = client.get(f"/v1/messages/batches/{created['id']}").json()
+            if batch["processing_status"] == "ended":
+                break
+            time.sleep(0.05)
+        assert batch["request_counts"]["succeeded"] == 1
+        assert batch["request_counts"]["errored"] == 1
+
+        lines = client.get(batch["results_url"]).text.splitlines()
+        results = {r["custom_id"]: r["result"] for r in map(json.loads, lines)}
+        assert results["a"]["type"] == "succeeded"
+        assert results["a"]["message"]["content"][0]["text"] == "done"
+        assert results["b"]["error"]["error"]["type"] == "api_error"
+
+        assert client.delete(f"/v1/messages/batches/{created['id']}").json()["type"] == "message_batch_deleted"
+
+
+def test_duplicate_custom_ids_are_rejected(monkeypatch, tmp_path):
+    with _client(monkeypatch, tmp_path) as client:
+        response = client.post("/v1/messages/batches", json={"requests": [
+            {"custom_id": "a", "params": _params("x")},
+            {"custom_id": "a", "params": _params("y")},
+        ]})
+        assert response.status_code == 400
+
+
+def test_running_requests_are_leased_to_their_process(tmp_path):
+    db_path = str(tmp_path / "batches.db")
+    store = BatchStore(db_path)
+    batch = store.create_batch([("a", "ollama/m", _params("x")), ("b", "ollama/m", _params("y"))])
+    assert store.claim_next([], "old-worker", lease_seconds=60)[1] == 0
+
+    # A new process starting alongside (a reload, another worker) leaves the live lease alone
+    other = BatchStore(db_path)
+    assert other.requeue_expired() == 0
+    assert other.claim_next([], "new-worker", lease_seconds=60)[1] == 1
+    assert other.claim_next([], "new-worker") is None
+    assert store.renew_leases("old-worker", lease_seconds=-1) == 1
+
+    # Once the old worker stops renewing, its request goes back to the queue
+    assert other.requeue_expired() == 1
+    batch_id, idx, model, params = other.claim_next([], "new-worker")
+    assert (batch_id, idx, params) == (batch["id"], 0, _params("x"))
+    assert other.claim_next(["ollama/m"]) is None
+    assert other.release("new-worker") == 2
+
+
+def test_canceled_batch_ends_when_its_running_request_is_given_up(tmp_path):
+    store = BatchStore(str(tmp_path / "batches.db"))
+    batch = store.create_batch([("a", "ollama/m", _params("x")), ("b", "ollama/m", _params("y"))])
+    store.claim_next([], "w1")
+    assert store.cancel_batch(batch["id"])["processing_status"] == "canceling"
+    assert store.release("w1") == 0
+    store.expire_batches()
+    assert store.claim_next([], "w2") is None
+    ended = store.get_batch(batch["id"])
+    assert ended["processing_status"] == "ended"
+    assert ended["request_counts"]["processing"] == 0 and ended["request_counts"]["canceled"] == 2
+
+    # Same when the lease runs out instead
+    batch = store.create_batch([("a", "ollama/m", _params("x"))])
+    store.claim_next([], "w3", lease_seconds=-1)
+    store.cancel_batch(batch["id"])
+    assert store.requeue_expired() == 0
+    assert store.get_batch(batch["id"])["processing_status"] == "ended"
+
+
+def test_concurrent_claims_never_share_a_request(tmp_path):
+    db_path = str(tmp_path / "batches.db")
+    BatchStore(db_path).create_batch([(str(i), "ollama/m", _params("x")) for i in range(40)])
+    stores = [BatchStore(db_path) for _ in range(4)]
+    claimed = []
+
+    def claim(store, owner):
+        while True:
+            row = store.claim_next([], owner)
+            if row is None:
+                return
+            claimed.append(row[1])
+
+    threads = [threading.Thread(target=claim, args=(store, f"w{i}")) for i, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == list(range(40))
@@ -0,0 +1,65 @@
+"""
+Tests for the `cled serve` tuning profile
+"""
+import os
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "CLED"))
+import cled_serve
+
+
+def test_profile_defaults_and_uds():
+    profile = cled_serve.build_profile(cled_serve.parse_args(["--workers", "0", "--loop", "asyncio"]))
+    assert profile["workers"] == 1
+    assert profile["loop"] == "asyncio"
+    assert profile["listen"].endswith(":8083") or "PORT" in os.environ
+
+    profile = cled_serve.build_profile(cled_serve.parse_args(["--uds", "/tmp/bridge.sock"]))
+    assert profile["listen"] == "unix:/tmp/bridge.sock"
+    # A Unix socket is shared by the workers, never bound per worker
+    assert profile["reuse_port"] is False
+
+
+def test_drain_timeout_reaches_uvicorn():
+    profile = cled_serve.build_profile(cled_serve.parse_args(["--drain-timeout", "45"]))
+    assert profile["drain_timeout"] == 45
+    server = cled_serve.make_server(profile)
+    assert server.config.timeout_graceful_shutdown == 45
+
+
+@pytest.mark.skipif(not hasattr(socket, "SO_REUSEPORT"), reason="SO_REUSEPORT not available")
+def test_reuse_port_sockets_share_a_port():
+    first = cled_serve.bind_reuse_port_socket("127.0.0.1", 0, 16)
+    try:
+        port = first.getsockname()[1]
+        second = cled_serve.bind_reuse_port_socket("127.0.0.1", port, 16)
+        second.close()
+    finally:
+        first.close()
+
+
+def _short_lived_worker(profile, sock, ready):
+    if ready is not None:
+        ready.set()
+
+
+def test_dead_workers_are_restarted_on_their_socket(monkeypatch):
+    monkeypatch.setattr(cled_serve, "RESTART_DELAY", 0)
+    sockets = ["slot-0", "slot-1"]
+    supervisor = cled_serve.Supervisor({}, sockets, target=_short_lived_worker)
+    supervisor.workers = supervisor.start_generation()
+    first = [worker.pid for worker in supervisor.workers]
+    for worker in supervisor.workers:
+        worker.join()
+
+    spawned = []
+    spawn = supervisor._spawn
+    monkeypatch.setattr(supervisor, "_spawn", lambda sock, wait_ready=True: spawned.append(sock) or spawn(sock, wait_ready))
+    supervisor.respawn_dead()
+    assert spawned == sockets
+    assert all(worker.pid not in first for worker in supervisor.workers)
+    for worker in supervisor.workers:
+        worker.join()
@@ -0,0 +1,86 @@
+"""
+Tests for the async streaming client
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+
+import server
+from app.client.streaming import BridgeClient, Conversation, SSEParser
+from app.services import llm
+
+STREAM = (
+    'event: message_start\ndata: {"type": "message_start", "message": {"usage": {"input_tokens": 3}}}\n\n'
+    ': keep-alive comment\n\n'
+    'event: content_block_delta\r\ndata: {"type": "content_block_delta", "index": 0, '
+    '"delta": {"type": "text_delta", "text": "héllo 世界"}}\r\n\r\n'
+    'data: [DONE]\n\n'
+).encode("utf-8")
+
+
+def test_parser_handles_any_chunk_boundary():
+    expected = SSEParser().feed(STREAM)
+    assert [message.event for message in expected] == ["message_start", "content_block_delta", None]
+    assert json.loads(expected[1].data)["delta"]["text"] == "héllo 世界"
+    for size in range(1, 12):
+        parser = SSEParser()
+        messages = []
+        for start in range(0, len(STREAM), size):
+            messages.extend(parser.feed(STREAM[start:start + size]))
+        messages.extend(parser.flush())
+        assert messages == expected
+
+
+def test_parser_flushes_unterminated_event():
+    parser = SSEParser()
+    assert parser.feed(b'data: {"type": "ping"}') == []
+    assert [message.data for message in parser.flush()] == [b'{"type": "ping"}']
+
+
+class _FakeStream:
+    def __init__(self, texts):
+        self.texts = list(texts)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.texts:
+            raise StopAsyncIteration
+        text = self.texts.pop(0)
+        await asyncio.sleep(0)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(delta=SimpleNamespace(content=text),
+                                     finish_reason=None if self.texts else "stop")],
+            usage=None
+        )
+
+    async def aclose(self):
+        pass
+
+
+def test_concurrent_conversations_share_one_client(monkeypatch):
+    async def fake_acompletion(**kwargs):
+        last = kwargs["messages"][-1]["content"]
+        return _FakeStream(["echo: ", last])
+
+    monkeypatch.setattr(llm, "acompletion", fake_acompletion)
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with BridgeClient("http://proxy", transport=transport) as client:
+            conversations = [Conversation(client, "claude-3-haiku-20240307") for _ in range(5)]
+            replies = await asyncio.gather(*(
+                conversation.ask(f"message {i}") for i, conversation in enumerate(conversations)
+            ))
+            result = await client.collect(conversations[0].request())
+        return conversations, replies, result
+
+    conversations, replies, result = asyncio.run(run())
+    assert replies == [f"echo: message {i}" for i in range(5)]
+    assert conversations[3].messages[-1] == {"role": "assistant", "content": "echo: message 3"}
+    assert result.stop_reason == "end_turn"
+    assert result.time_to_first_token is not None
+    assert [event.type for event in result.events][0] == "message_start"
@@ -0,0 +1,75 @@
+"""
+Tests for compressed request bodies and response compression
+"""
+import gzip
+import json
+import zlib
+from types import SimpleNamespace
+
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.testclient import TestClient
+
+import server
+from app.utils import compression
+
+BODY = {"model": "ollama/llama3", "max_tokens": 10, "messages": [{"role": "user", "content": "hi " * 2000}]}
+
+
+def fake_completion(monkeypatch, seen):
+    async def fake_acompletion(**kwargs):
+        seen.update(kwargs)
+        return {"id": "r", "choices": [{"message": {"content": "ok " * 1000}, "finish_reason": "stop"}], "usage": {}}
+    monkeypatch.setattr(server.llm, "acompletion", fake_acompletion)
+
+
+def post(content, encoding):
+    return TestClient(server.app).post("/v1/messages", content=content,
+                                       headers={"content-type": "application/json", "content-encoding": encoding})
+
+
+def test_compressed_bodies_are_accepted(monkeypatch):
+    seen = {}
+    fake_completion(monkeypatch, seen)
+    raw = json.dumps(BODY).encode()
+    assert post(gzip.compress(raw), "gzip").status_code == 200
+    assert seen["messages"][-1]["content"] == BODY["messages"][0]["content"]
+    assert post(zlib.compress(raw), "deflate").status_code == 200
+
+
+def test_rejected_bodies(monkeypatch):
+    fake_completion(monkeypatch, {})
+    monkeypatch.setattr(compression, "MAX_REQUEST_BODY_BYTES", 10_000)
+    raw = json.dumps(BODY).encode()
+    too_large = json.dumps({**BODY, "system": "x" * 20_000}).encode()
+    response = post(too_large, "identity")
+    assert response.status_code == 413
+    assert response.json()["error"]["type"] == "request_too_large"
+
+    # A small gzip body that expands past the limit is stopped while decompressing
+    bomb = gzip.compress(b"0" * 1_000_000)
+    assert len(bomb) < 10_000
+    assert post(bomb, "gzip").status_code == 413
+
+    assert post(gzip.compress(raw)[:-20], "gzip").status_code == 400
+    response = post(raw, "br")
+    assert response.status_code == 415
+    assert response.json()["type"] == "error"
+
+
+def test_only_non_streaming_responses_are_compressed(monkeypatch):
+    # As installed when RESPONSE_COMPRESSION_ENABLED is set
+    fake_completion(monkeypatch, {})
+    client = TestClient(GZipMiddleware(server.app, minimum_size=1024, compresslevel=6))
+    response = client.post("/v1/messages", json=BODY, headers={"accept-encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()["content"][0]["text"].startswith("ok")
+
+    async def fake_stream(**kwargs):
+        async def chunks():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="ok " * 1000), finish_reason="stop")])
+        return chunks()
+    monkeypatch.setattr(server.llm, "acompletion", fake_stream)
+    response = client.post("/v1/messages", json={**BODY, "stream": True}, headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert "event: message_stop" in response.text
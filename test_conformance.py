@@ -0,0 +1,32 @@
+"""
+Tests for the offline conformance mode of tests.py
+"""
+import asyncio
+import copy
+
+import tests as suite
+
+
+def _reference():
+    return [event["data"] for event in suite.load_fixture("simple_stream")["events"]]
+
+
+def test_reference_fixture_conforms_to_itself():
+    assert suite.check_conformance(_reference(), _reference()) == []
+
+
+def test_conformance_detects_broken_sequences():
+    events = _reference()
+    missing_stop = [event for event in events if event["type"] != "content_block_stop"]
+    assert any("not allowed" in problem for problem in suite.check_conformance(events, missing_stop))
+
+    wrong_text = copy.deepcopy(events)
+    next(event for event in wrong_text if event["type"] == "content_block_delta")["delta"]["text"] = "x"
+    assert "block 0: text differs from reference" in suite.check_conformance(events, wrong_text)
+
+    truncated = events[:-1]
+    assert any("without message_stop" in problem for problem in suite.check_conformance(events, truncated))
+
+
+def test_offline_run_passes_for_text_scenario():
+    assert asyncio.run(suite.run_offline(["simple_stream"], repeat=2, tolerance=10.0))
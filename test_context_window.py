@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the context window fitting stage.
+"""
+
+from app.utils import context_window
+from app.utils.context_window import (
+    NumCtxTracker, choose_num_ctx, estimate_message_tokens, fit_messages_to_context, get_context_length
+)
+
+
+def _conversation(turns, tool_payload):
+    messages = [
+        {"role": "system", "content": "You are a coding assistant."},
+        {"role": "user", "content": "Fix the failing build."},
+    ]
+    for i in range(turns):
+        messages.append({
+            "role": "assistant", "content": None,
+            "tool_calls": [{"id": f"call_{i}", "type": "function",
+                            "function": {"name": "read", "arguments": "{}"}}]
+        })
+        messages.append({"role": "tool", "tool_call_id": f"call_{i}", "content": tool_payload})
+        messages.append({"role": "user", "content": f"Continue with step {i}."})
+    return messages
+
+
+def test_small_prompt_is_untouched():
+    """A prompt that fits is returned as-is"""
+    messages = _conversation(2, "short output")
+    fitted, dropped = fit_messages_to_context(messages, "ollama/unknown-model", 512)
+    assert fitted is messages
+    assert dropped == 0
+
+
+def test_oversized_prompt_keeps_system_pinned_and_recent_turns(monkeypatch):
+    """Old tool results are elided while the protected messages survive"""
+    monkeypatch.setattr(context_window, "MODEL_CONTEXT_LENGTHS", {"tiny": 2048})
+    monkeypatch.setattr(context_window, "CONTEXT_KEEP_LAST_TURNS", 2)
+    messages = _conversation(12, "word " * 400)
+
+    fitted, dropped = fit_messages_to_context(messages, "ollama/tiny:latest", 256)
+
+    assert dropped > 0
+    assert fitted[0] == messages[0]
+    assert fitted[1] == messages[1]
+    assert fitted[-1] == messages[-1]
+    assert fitted[-2] == messages[-2]
+    assert sum(estimate_message_tokens(m) for m in fitted) <= 2048 - 256
+    assert get_context_length("ollama/tiny:latest") == 2048
+
+
+def test_max_tokens_larger_than_the_window_keeps_the_history(monkeypatch):
+    """Claude Code's max_tokens=32000 on an 8k model must not leave a 256 token budget"""
+    monkeypatch.setattr(context_window, "MODEL_CONTEXT_LENGTHS", {})
+    messages = _conversation(3, "word " * 200)
+    assert sum(estimate_message_tokens(m) for m in messages) < 8192 * 0.75
+    fitted, dropped = fit_messages_to_context(messages, "ollama/unknown-model", 32000)
+    assert fitted is messages and dropped == 0
+    assert context_window.prompt_budget("ollama/unknown-model", 32000, reserved_tokens=1000) == 8192 - 2048 - 1000
+
+
+def test_hosted_models_are_fitted_only_with_a_known_length(monkeypatch):
+    monkeypatch.setattr(context_window, "MODEL_CONTEXT_LENGTHS", {"gpt-4o-mini": 16384})
+    assert context_window.should_fit_context("ollama/unknown-model")
+    assert not context_window.should_fit_context("openai/gpt-4o")
+    assert context_window.should_fit_context("openai/gpt-4o-mini")
+
+
+def test_num_ctx_rounds_up_to_bucket_and_caps(monkeypatch):
+    monkeypatch.setattr(context_window, "MODEL_CONTEXT_LENGTHS", {"qwen2.5-coder": 32768})
+    buckets = [4096, 8192, 16384, 32768, 65536]
+    assert choose_num_ctx("ollama/qwen2.5-coder:7b", 1000, 1024, buckets) == 4096
+    assert choose_num_ctx("ollama/qwen2.5-coder:7b", 5000, 4096, buckets) == 16384
+    # Never above the model's own maximum
+    assert choose_num_ctx("ollama/qwen2.5-coder:7b", 50000, 4096, buckets) == 32768
+
+
+def test_num_ctx_tracker_reports_reloads():
+    tracker = NumCtxTracker()
+    assert not tracker.observe("ollama/llama3", "http://a", 8192)
+    assert not tracker.observe("ollama/llama3", "http://a", 8192)
+    assert not tracker.observe("ollama/llama3", "http://b", 4096)
+    assert tracker.observe("ollama/llama3", "http://a", 16384)
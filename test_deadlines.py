@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for connect, first-token, idle and total deadlines.
+"""
+
+import asyncio
+
+import pytest
+
+from app.services import deadlines
+from app.services.deadlines import DeadlineExceeded, Deadlines, open_stream_with_deadlines
+
+
+class StallingStream:
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.delays:
+            raise StopAsyncIteration
+        await asyncio.sleep(self.delays.pop(0))
+        return "chunk"
+
+    async def aclose(self):
+        self.closed = True
+
+
+async def _consume(stream_delays, limits, open_delay=0.0):
+    upstream = StallingStream(stream_delays)
+
+    async def open_call():
+        await asyncio.sleep(open_delay)
+        return upstream
+
+    deadlines._DEFAULT_DEADLINES = Deadlines(*limits)
+    stream = await open_stream_with_deadlines(open_call(), "ollama/test")
+    received = [chunk async for chunk in stream]
+    return received, upstream
+
+
+@pytest.fixture(autouse=True)
+def restore_defaults(monkeypatch):
+    monkeypatch.setattr(deadlines, "_DEFAULT_DEADLINES", deadlines._DEFAULT_DEADLINES)
+
+
+@pytest.mark.parametrize("delays,limits,open_delay,cause", [
+    ([0.0], (0.05, 0, 0, 0), 1.0, "connect"),
+    ([1.0], (0, 0.05, 0, 0), 0.0, "first_token"),
+    ([0.0, 0.0, 1.0], (0, 0, 0.05, 0), 0.0, "idle"),
+    ([0.03, 0.03, 0.03, 0.03], (0, 1, 1, 0.08), 0.0, "total"),
+])
+def test_deadline_causes(delays, limits, open_delay, cause):
+    with pytest.raises(DeadlineExceeded) as excinfo:
+        asyncio.run(_consume(delays, limits, open_delay))
+    assert excinfo.value.cause == cause
+    assert excinfo.value.retryable == (cause in ("connect", "first_token"))
+
+
+def test_stream_within_deadlines_completes():
+    received, upstream = asyncio.run(_consume([0.0, 0.0], (1, 1, 1, 5)))
+    assert received == ["chunk", "chunk"]
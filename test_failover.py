@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Tests for circuit breakers, retries and the failover chain.
+"""
+
+import asyncio
+
+import pytest
+
+from app.services import failover
+from app.services.failover import CircuitBreaker, UpstreamUnavailableError
+
+
+class UpstreamDown(Exception):
+    status_code = 503
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+def _setup(monkeypatch, hosts, fallbacks=()):
+    monkeypatch.setattr(failover, "OLLAMA_API_BASES", list(hosts))
+    monkeypatch.setattr(failover, "FAILOVER_MODELS", list(fallbacks))
+    monkeypatch.setattr(failover, "RETRY_BASE_DELAY_MS", 1)
+    monkeypatch.setattr(failover, "_breakers", {})
+
+
+def test_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker("host", failure_threshold=2, reset_seconds=0.0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow()  # reset timeout elapsed: one trial call
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failover_to_second_host_then_smaller_model(monkeypatch):
+    _setup(monkeypatch, ["http://a", "http://b"], ["small"])
+    calls = []
+
+    async def call(backend, alternates):
+        calls.append(backend)
+        if backend.model != "ollama/small":
+            raise UpstreamDown("down")
+        return "ok"
+
+    assert asyncio.run(failover.call_with_failover("ollama/big", call)) == "ok"
+    assert [(b.model, b.api_base) for b in calls] == [
+        ("ollama/big", "http://a"), ("ollama/big", "http://b"), ("ollama/small", "http://a")
+    ]
+
+
+def test_open_circuits_fail_fast(monkeypatch):
+    _setup(monkeypatch, ["http://a"])
+    monkeypatch.setattr(failover, "RETRY_MAX_ATTEMPTS", 10)
+    failover.get_breaker("http://a").failure_threshold = 1
+    calls = []
+
+    async def call(backend, alternates):
+        calls.append(backend)
+        raise UpstreamDown("down")
+
+    with pytest.raises(UpstreamUnavailableError):
+        asyncio.run(failover.call_with_failover("ollama/big", call))
+    assert len(calls) == 1
+
+
+def test_non_retryable_errors_are_raised(monkeypatch):
+    _setup(monkeypatch, ["http://a", "http://b"])
+    calls = []
+
+    async def call(backend, alternates):
+        calls.append(backend)
+        raise BadRequest("bad")
+
+    with pytest.raises(BadRequest):
+        asyncio.run(failover.call_with_failover("ollama/big", call))
+    assert len(calls) == 1
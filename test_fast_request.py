@@ -0,0 +1,184 @@
+"""
+Differential tests: the fast-path request parser against the pydantic models
+"""
+import asyncio
+import copy
+import json
+import random
+
+import httpx
+from fastapi import FastAPI
+from pydantic import ValidationError
+
+import server
+from app.models.fast_request import parse_messages_request
+
+WORDS = ["hello", "ls -la", "naïve", "世界", "", "  padded  ", "line\nbreak", "{\"json\": 1}"]
+UNUSUAL = [None, True, 0, 1.5, "x", [], {}, [1], {"a": 1}, 2 ** 70]
+
+
+def _text(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 3)))
+
+
+def _cache_control(rng):
+    return rng.choice([None, None, {"type": "ephemeral"}])
+
+
+def _block(rng, role):
+    kind = rng.choice(["text", "text", "image", "tool_use", "tool_result"] if role == "user"
+                      else ["text", "tool_use"])
+    block = {"type": kind}
+    if kind == "text":
+        block["text"] = _text(rng)
+    elif kind == "image":
+        block["source"] = rng.choice([
+            {"type": "url", "url": "https://example.com/a.png"},
+            {"type": "base64", "media_type": "image/png", "data": "iVBORw0KGgo="},
+        ])
+    elif kind == "tool_use":
+        block.update(id=f"toolu_{rng.randint(0, 99)}", name=rng.choice(["Bash", "Read"]),
+                     input={"command": _text(rng), "n": rng.randint(0, 5)})
+    else:
+        block.update(tool_use_id=f"toolu_{rng.randint(0, 99)}", content=rng.choice([
+            _text(rng), [{"type": "text", "text": _text(rng)}], {"value": 1}, 42, None,
+        ]))
+        if rng.random() < 0.3:
+            block["is_error"] = rng.choice([True, False, None])
+    if rng.random() < 0.2:
+        block["cache_control"] = _cache_control(rng)
+    if rng.random() < 0.1:
+        block["extra_field"] = "ignored"
+    return block
+
+
+def random_request(rng):
+    messages = []
+    for i in range(rng.randint(0, 5)):
+        role = "user" if i % 2 == 0 else "assistant"
+        content = _text(rng) if rng.random() < 0.3 else [_block(rng, role) for _ in range(rng.randint(0, 4))]
+        messages.append({"role": role, "content": content})
+    request = {
+        "model": rng.choice(["claude-3-haiku-20240307", "claude-sonnet-4-20250514", "ollama/llama3"]),
+        "max_tokens": rng.randint(1, 8192),
+        "messages": messages,
+    }
+    optional = {
+        "system": lambda: rng.choice([_text(rng), [{"type": "text", "text": _text(rng),
+                                                     "cache_control": _cache_control(rng)}], None]),
+        "stop_sequences": lambda: rng.choice([["\n\nHuman:"], [], None]),
+        "stream": lambda: rng.choice([True, False, None]),
+        "temperature": lambda: rng.choice([0, 0.7, 1, None]),
+        "top_p": lambda: rng.choice([0.9, 1, None]),
+        "top_k": lambda: rng.choice([40, None]),
+        "metadata": lambda: rng.choice([{"user_id": "u1"}, None]),
+        "tools": lambda: [{"name": "Bash", "description": rng.choice(["Run a command", None]),
+                           "input_schema": {"type": "object"}}],
+        "tool_choice": lambda: {"type": "auto"},
+        "thinking": lambda: {"enabled": rng.choice([True, False])},
+        "unknown_top_level": lambda: 1,
+    }
+    for name, make in optional.items():
+        if rng.random() < 0.4:
+            request[name] = make()
+    return request
+
+
+def _paths(value, path=()):
+    yield path
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _paths(item, path + (key,))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from _paths(item, path + (index,))
+
+
+def mutate(rng, request):
+    """Replace or delete one random value anywhere in the request"""
+    request = copy.deepcopy(request)
+    path = rng.choice([p for p in _paths(request) if p])
+    parent = request
+    for key in path[:-1]:
+        parent = parent[key]
+    if rng.random() < 0.3:
+        del parent[path[-1]]
+    else:
+        parent[path[-1]] = rng.choice(UNUSUAL)
+    return request
+
+
+def pydantic_parse(body):
+    try:
+        return server.MessagesRequest.model_validate(json.loads(body))
+    except ValidationError:
+        return None
+
+
+def convert(request):
+    try:
+        return server.convert_anthropic_to_litellm(request)
+    except Exception as e:
+        # Odd-but-valid content can fail conversion; both paths must fail alike
+        return type(e), str(e)
+
+
+def assert_same(fast, slow):
+    assert fast.model_dump() == slow.model_dump()
+    assert convert(fast) == convert(slow)
+
+
+def test_fast_path_matches_pydantic_on_random_requests():
+    rng = random.Random(39)
+    accepted = mutated_accepted = mutated_rejected = 0
+    for _ in range(400):
+        request = random_request(rng)
+        body = json.dumps(request).encode("utf-8")
+        fast, slow = parse_messages_request(body), pydantic_parse(body)
+        # Every well-formed request takes the fast path
+        assert fast is not None and slow is not None, request
+        assert_same(fast, slow)
+        accepted += 1
+
+        broken = mutate(rng, request)
+        body = json.dumps(broken).encode("utf-8")
+        fast, slow = parse_messages_request(body), pydantic_parse(body)
+        if fast is not None:
+            # The fast path never accepts what pydantic rejects
+            assert slow is not None, broken
+            assert_same(fast, slow)
+            mutated_accepted += 1
+        elif slow is None:
+            mutated_rejected += 1
+    assert accepted == 400 and mutated_accepted and mutated_rejected
+
+
+def test_invalid_json_falls_back():
+    assert parse_messages_request(b'{"model": ') is None
+    assert parse_messages_request(b'[]') is None
+
+
+def _post(app, content):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            return await client.post("/v1/messages", content=content, headers={"content-type": "application/json"})
+    return asyncio.run(run())
+
+
+def test_rejections_match_fastapi_validation():
+    reference = FastAPI()
+
+    @reference.post("/v1/messages")
+    async def create_message(request: server.MessagesRequest):
+        return {}
+
+    bodies = [
+        b'{"model": "claude-3-haiku-20240307", "messages": []}',
+        b'{"model": "claude-3-haiku-20240307", "max_tokens": "many", "messages": [{"role": "system", "content": "x"}]}',
+        b'{"model": "claude-3-haiku-20240307", "max_tokens": 10, "messages": [{"role": "user", "content": [{"type": "video"}]}]}',
+        b'{"model": ',
+    ]
+    for body in bodies:
+        expected, actual = _post(reference, body), _post(server.app, body)
+        assert actual.status_code == expected.status_code == 422
+        assert actual.json() == expected.json()
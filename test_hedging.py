@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Tests for hedged streaming requests.
+"""
+
+import asyncio
+
+from app.services import failover, hedging, metrics
+from app.services.failover import Backend, CircuitBreaker
+
+
+class FakeStream:
+    def __init__(self, name, first_token_delay):
+        self.name = name
+        self.first_token_delay = first_token_delay
+        self.sent = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.sent == 0:
+            await asyncio.sleep(self.first_token_delay)
+        if self.sent == 3:
+            raise StopAsyncIteration
+        self.sent += 1
+        return f"{self.name}-{self.sent}"
+
+    async def aclose(self):
+        self.closed = True
+
+
+def _backends(*hosts):
+    return [Backend("ollama/test", host) for host in hosts]
+
+
+async def _collect(delays, monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(hedging, "HEDGE_DEFAULT_DELAY_MS", 50)
+    monkeypatch.setattr(hedging, "_budget", hedging.HedgeBudget(1.0))
+    monkeypatch.setattr(failover, "_breakers", {})
+    streams = {}
+
+    async def opener(backend):
+        streams[backend.api_base] = FakeStream(backend.api_base, delays[backend.api_base])
+        return streams[backend.api_base]
+
+    chunks = await hedging.open_hedged_stream("ollama/test", opener, _backends(*delays))
+    return [chunk async for chunk in chunks], streams
+
+
+def test_slow_primary_is_hedged(monkeypatch):
+    """The second backend wins when the first one stalls, and the loser is closed"""
+    won_before = metrics.snapshot()["counters"].get("hedge.won", 0)
+    chunks, streams = asyncio.run(_collect({"a": 5.0, "b": 0.0}, monkeypatch))
+    assert chunks == ["b-1", "b-2", "b-3"]
+    assert streams["a"].closed
+    assert metrics.snapshot()["counters"]["hedge.won"] == won_before + 1
+
+
+def test_both_attempts_finishing_together_close_the_loser(monkeypatch):
+    """When primary and hedge produce a first token in the same step only one stream is kept"""
+    monkeypatch.setattr(hedging, "HEDGE_DEFAULT_DELAY_MS", 50)
+    monkeypatch.setattr(hedging, "_budget", hedging.HedgeBudget(1.0))
+    monkeypatch.setattr(failover, "_breakers", {})
+    streams = {}
+
+    async def run():
+        gate = asyncio.Event()
+
+        class GatedStream(FakeStream):
+            async def __anext__(self):
+                await gate.wait()
+                return await super().__anext__()
+
+        async def opener(backend):
+            streams[backend.api_base] = GatedStream(backend.api_base, 0.0)
+            if backend.api_base == "b":
+                gate.set()
+            return streams[backend.api_base]
+
+        return await hedging._race("ollama/test", opener, _backends("a", "b"))
+
+    stream, first_chunk = asyncio.run(run())
+    assert (stream, first_chunk) == (streams["a"], "a-1")
+    assert not streams["a"].closed
+    assert streams["b"].closed
+
+
+class HostDown(Exception):
+    status_code = 503
+
+
+def test_failed_hedges_count_against_the_host_breaker(monkeypatch):
+    monkeypatch.setattr(hedging, "hedge_delay", lambda model: 0.01)
+    monkeypatch.setattr(hedging, "_budget", hedging.HedgeBudget(1.0, burst=10))
+    monkeypatch.setattr(failover, "_breakers", {"b": CircuitBreaker("b", failure_threshold=2)})
+
+    async def opener(backend):
+        if backend.api_base == "b":
+            raise HostDown("b is down")
+        return FakeStream(backend.api_base, 0.05)
+
+    for _ in range(2):
+        stream, first_chunk = asyncio.run(hedging._race("ollama/test", opener, _backends("a", "b")))
+        assert first_chunk == "a-1"
+    assert failover.get_breaker("b").state == CircuitBreaker.OPEN
+    assert failover.get_breaker("a").state == CircuitBreaker.CLOSED
+
+
+def test_opening_a_stream_leaves_the_budget_to_the_caller(monkeypatch):
+    """Failover may reopen the stream several times; only on_request() earns budget"""
+    budget = hedging.HedgeBudget(0.5)
+    budget.tokens = 0.0
+    monkeypatch.setattr(hedging, "_budget", budget)
+
+    async def opener(backend):
+        return FakeStream(backend.api_base, 0.0)
+
+    for _ in range(3):
+        asyncio.run(hedging.open_hedged_stream("ollama/test", opener, _backends("a")))
+    assert budget.tokens == 0.0
+    hedging.on_request()
+    assert budget.tokens == 0.5
+
+
+def test_fast_primary_is_not_hedged(monkeypatch):
+    chunks, streams = asyncio.run(_collect({"a": 0.0, "b": 0.0}, monkeypatch))
+    assert chunks == ["a-1", "a-2", "a-3"]
+    assert "b" not in streams
+
+
+def test_budget_caps_hedge_rate():
+    budget = hedging.HedgeBudget(0.1, burst=1.0)
+    spent = 0
+    for _ in range(100):
+        budget.on_request()
+        spent += budget.try_spend()
+    assert spent <= 11
@@ -0,0 +1,79 @@
+"""
+Tests for image source conversion, downscaling and the processed image cache
+"""
+import base64
+import io
+from collections import OrderedDict
+
+import pytest
+
+from app.utils import images
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(images, "_image_cache", OrderedDict())
+    monkeypatch.setattr(images, "MODEL_IMAGE_MAX_DIMENSIONS", {"llava": 64})
+    monkeypatch.setattr(images, "DEFAULT_IMAGE_MAX_DIMENSION", 0)
+
+
+def _png(width, height):
+    Image = pytest.importorskip("PIL.Image")
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(output, format="PNG")
+    return base64.b64encode(output.getvalue()).decode("ascii")
+
+
+def _decoded_size(url):
+    Image = pytest.importorskip("PIL.Image")
+    data = url.split(";base64,", 1)[1]
+    with Image.open(io.BytesIO(base64.b64decode(data))) as img:
+        return img.size
+
+
+def test_url_sources_and_unsupported_types():
+    assert images.image_source_to_url({"type": "url", "url": "https://x/y.png"}, "ollama/llava") == "https://x/y.png"
+    assert images.image_source_to_url({"type": "file", "file_id": "f"}, "ollama/llava") is None
+    part = images.image_block_to_part({"source": {"type": "base64", "media_type": "image/gif", "data": "R0lG"}},
+                                      "ollama/unknown")
+    assert part == {"type": "image_url", "image_url": {"url": "data:image/gif;base64,R0lG"}}
+
+
+def test_without_pillow_images_are_forwarded_unchanged(monkeypatch):
+    monkeypatch.setattr(images, "Image", None)
+    source = {"type": "base64", "media_type": "image/png", "data": "iVBORw0KGgo="}
+    assert images.image_source_to_url(source, "ollama/llava:7b") == "data:image/png;base64,iVBORw0KGgo="
+
+
+def test_repeated_images_hit_the_cache(monkeypatch):
+    calls = []
+    monkeypatch.setattr(images, "_process_base64", lambda data, media_type, dim: calls.append(dim) or f"url-{dim}")
+    source = {"type": "base64", "media_type": "image/png", "data": "AAAA"}
+    assert images.image_source_to_url(source, "ollama/llava") == "url-64"
+    assert images.image_source_to_url(source, "ollama/llava:13b") == "url-64"
+    # A different target size is a different cache entry
+    assert images.image_source_to_url(source, "ollama/unknown") == "url-0"
+    assert calls == [64, 0]
+
+
+def test_large_images_are_downscaled_and_small_ones_kept():
+    small = _png(32, 16)
+    assert images.image_source_to_url({"type": "base64", "media_type": "image/png", "data": small},
+                                      "ollama/llava") == f"data:image/png;base64,{small}"
+
+    url = images.image_source_to_url({"type": "base64", "media_type": "image/png", "data": _png(256, 128)},
+                                     "ollama/llava")
+    assert url.startswith("data:image/png;base64,")
+    assert _decoded_size(url) == (64, 32)
+
+
+def test_undecodable_and_oversized_images_are_forwarded(monkeypatch):
+    pytest.importorskip("PIL.Image")
+    garbage = base64.b64encode(b"not an image").decode("ascii")
+    assert images.image_source_to_url({"type": "base64", "media_type": "image/png", "data": garbage},
+                                      "ollama/llava") == f"data:image/png;base64,{garbage}"
+
+    monkeypatch.setattr(images, "IMAGE_MAX_PIXELS", 1000)
+    big = _png(256, 128)
+    assert images.image_source_to_url({"type": "base64", "media_type": "image/png", "data": big},
+                                      "ollama/llava") == f"data:image/png;base64,{big}"
@@ -0,0 +1,51 @@
+"""
+Tests for draining in-flight requests before the server stops
+"""
+import asyncio
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import server
+from app.services.lifecycle import Lifecycle
+
+
+def test_streams_count_as_in_flight_until_sent(monkeypatch):
+    seen = []
+
+    async def fake_acompletion(**kwargs):
+        async def chunks():
+            seen.append(server.lifecycle.in_flight)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="hi"), finish_reason="stop")])
+        return chunks()
+
+    monkeypatch.setattr(server.llm, "acompletion", fake_acompletion)
+    before = server.lifecycle.in_flight
+    body = {"model": "ollama/llama3", "max_tokens": 10, "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+    response = TestClient(server.app).post("/v1/messages", json=body)
+    assert "event: message_stop" in response.text
+    assert seen == [before + 1]
+    assert server.lifecycle.in_flight == before
+
+
+def test_draining_fails_health_and_waits_for_requests(monkeypatch):
+    lifecycle = Lifecycle()
+    monkeypatch.setattr(server, "lifecycle", lifecycle)
+    client = TestClient(server.app)
+    assert client.get("/health").status_code == 200
+
+    lifecycle.request_started()
+    lifecycle.begin_drain()
+    response = client.get("/health")
+    assert response.status_code == 503
+    assert response.json()["status"] == "draining" and response.json()["in_flight"] == 1
+
+    # Deadline passes with the request still in flight
+    assert asyncio.run(lifecycle.wait_idle(0.05, poll=0.01)) is False
+
+    async def finish_later():
+        waiting = asyncio.create_task(lifecycle.wait_idle(5, poll=0.01))
+        await asyncio.sleep(0.05)
+        lifecycle.request_finished()
+        return await waiting
+    assert asyncio.run(finish_later()) is True
@@ -0,0 +1,131 @@
+"""
+Tests for the Ollama model capability registry
+"""
+import asyncio
+import json
+
+import httpx
+
+import server
+from app.services import model_registry
+from app.services.model_registry import ModelRegistry
+from app.utils.context_window import get_context_length
+
+TAGS = {"models": [
+    {"name": "qwen2.5-coder:7b", "size": 4683087332, "digest": "d1",
+     "details": {"parameter_size": "7.6B", "quantization_level": "Q4_K_M"}},
+    {"name": "llava:latest", "size": 4733363377, "digest": "d2", "details": {"families": ["llama", "clip"]}},
+    {"name": "tinyllama:latest", "size": 637700138, "digest": "d3", "details": {}},
+]}
+
+SHOW = {
+    "qwen2.5-coder:7b": {"capabilities": ["completion", "tools", "insert"],
+                         "model_info": {"general.architecture": "qwen2", "qwen2.context_length": 32768},
+                         "details": {"parameter_size": "7.6B", "quantization_level": "Q4_K_M"}},
+    # An older Ollama without "capabilities"
+    "llava:latest": {"template": "{{ .Prompt }}", "projector_info": {"clip.has_vision_encoder": True},
+                     "model_info": {"llama.context_length": 4096}, "details": {"families": ["llama", "clip"]}},
+    "tinyllama:latest": {"template": "{{ if .Tools }}...{{ end }}", "model_info": {"llama.context_length": 2048}},
+}
+
+
+def _registry():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json=TAGS)
+        return httpx.Response(200, json=SHOW[json.loads(request.content)["model"]])
+
+    registry = ModelRegistry(["http://ollama:11434"])
+
+    async def refresh():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await registry.refresh(client)
+
+    return registry, refresh, calls
+
+
+def test_discovers_capabilities():
+    registry, refresh, calls = _registry()
+    asyncio.run(refresh())
+    qwen = registry.lookup("ollama/qwen2.5-coder:7b")
+    assert (qwen.context_length, qwen.tools, qwen.vision, qwen.quantization) == (32768, True, False, "Q4_K_M")
+    assert registry.supports_vision("ollama_chat/llava") is True  # ":latest" is implied
+    assert registry.supports_tools("tinyllama") is True
+    assert registry.supports_tools("openai/gpt-4o") is None
+    assert registry.lookup("ollama/unknown") is None
+
+    # Unchanged digests are not inspected again
+    asyncio.run(refresh())
+    assert calls.count("/api/show") == 3 and calls.count("/api/tags") == 2
+
+
+def test_unreachable_host_leaves_registry_empty():
+    async def refresh():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(lambda r: httpx.Response(500))) as client:
+            await registry.refresh(client)
+
+    registry = ModelRegistry(["http://down:11434"])
+    asyncio.run(refresh())
+    assert registry.models == {} and registry.refreshed_at is not None
+
+
+def test_models_of_a_host_that_stops_answering_are_kept():
+    down = set()
+    calls = []
+
+    def handler(request):
+        calls.append((request.url.host, request.url.path))
+        if request.url.host in down:
+            raise httpx.ConnectTimeout("timed out", request=request)
+        if request.url.path == "/api/tags":
+            tags = TAGS["models"][:1] if request.url.host == "a" else TAGS["models"][1:]
+            return httpx.Response(200, json={"models": tags})
+        return httpx.Response(200, json=SHOW[json.loads(request.content)["model"]])
+
+    registry = ModelRegistry(["http://a:11434", "http://b:11434"])
+
+    async def refresh():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await registry.refresh(client)
+
+    asyncio.run(refresh())
+    known = dict(registry.models)
+    down.add("b")
+    asyncio.run(refresh())
+    assert registry.models == known
+    assert registry.context_length("ollama/llava") == 4096
+    down.add("a")
+    asyncio.run(refresh())
+    assert registry.models == known
+
+    # Once the hosts answer again nothing has to be inspected anew
+    down.clear()
+    asyncio.run(refresh())
+    assert registry.models == known
+    assert sum(path == "/api/show" for _, path in calls) == 3
+
+
+def test_context_fitting_and_conversion_read_the_registry(monkeypatch):
+    registry, refresh, _ = _registry()
+    asyncio.run(refresh())
+    monkeypatch.setattr(model_registry, "registry", registry)
+    monkeypatch.setattr(server, "model_registry", registry)
+    assert get_context_length("ollama/qwen2.5-coder:7b") == 32768
+
+    tool_call = {"id": "call_1", "type": "function", "function": {"name": "Bash", "arguments": '{"command": "ls"}'}}
+    response = {"choices": [{"message": {"content": None, "tool_calls": [tool_call]}, "finish_reason": "tool_calls"}],
+                "usage": {}}
+    request = server.MessagesRequest(model="ollama/qwen2.5-coder:7b", max_tokens=10,
+                                     messages=[{"role": "user", "content": "hi"}])
+    # Not a claude-* name, but the served model supports tools
+    assert server.convert_litellm_to_anthropic(response, request)["content"][0]["type"] == "tool_use"
+
+    request = server.MessagesRequest(model="ollama/qwen2.5-coder:7b", max_tokens=10, messages=[{"role": "user", "content": [
+        {"type": "image", "source": {"type": "url", "url": "https://example.com/a.png"}},
+        {"type": "text", "text": "what is this?"},
+    ]}])
+    content = server.convert_anthropic_to_litellm(request)["messages"][0]["content"]
+    assert content == "[image omitted: ollama/qwen2.5-coder:7b does not accept images]\nwhat is this?"
@@ -0,0 +1,84 @@
+"""
+Tests for cache_control breakpoint tracking and prompt-cache usage reporting
+"""
+from app.services.prompt_cache import PromptCacheTracker, cache_usage, compute_breakpoints
+from app.services.failover import failover_chain
+
+
+def _conversation():
+    system = {"role": "system", "content": "You are a careful assistant. " * 50}
+    first = {"role": "user", "content": "Summarise the design document."}
+    reply = {"role": "assistant", "content": "It describes a proxy."}
+    return [system, first, reply]
+
+
+def test_breakpoints_hash_prefixes():
+    messages = _conversation()
+    breakpoints = compute_breakpoints(messages, [messages[0], messages[2]])
+    assert len(breakpoints) == 2
+    assert breakpoints[0].tokens < breakpoints[1].tokens
+    # The same prefix hashes the same even in a copied message list
+    copied = [dict(message) for message in messages]
+    again = compute_breakpoints(copied, [copied[0]])
+    assert again[0].prefix_hash == breakpoints[0].prefix_hash
+
+
+def test_tracker_reports_warm_prefix_and_host():
+    tracker = PromptCacheTracker()
+    messages = _conversation()
+    plan = tracker.plan("user:a", "ollama/llama3", messages, [messages[0]])
+    assert plan.warm_tokens == 0 and plan.api_base is None
+    tracker.record(plan, "ollama/llama3", "http://host-b:11434")
+
+    follow_up = _conversation() + [{"role": "user", "content": "And the risks?"}]
+    plan = tracker.plan("user:a", "ollama/llama3", follow_up, [follow_up[0]])
+    assert plan.warm_tokens == plan.breakpoints[0].tokens
+    assert plan.api_base == "http://host-b:11434"
+
+    # Another model or another session does not share the KV cache
+    assert tracker.plan("user:a", "ollama/mistral", follow_up, [follow_up[0]]).warm_tokens == 0
+    assert tracker.plan("user:b", "ollama/llama3", follow_up, [follow_up[0]]).warm_tokens == 0
+
+
+def test_cache_usage_splits_prompt_tokens():
+    tracker = PromptCacheTracker()
+    messages = _conversation()
+    cold = tracker.plan("s", "ollama/llama3", messages, [messages[0]])
+    usage = cache_usage(cold, cold.prompt_tokens)
+    assert usage["cache_read_input_tokens"] == 0
+    assert usage["cache_creation_input_tokens"] == cold.breakpoints[0].tokens
+    assert usage["input_tokens"] + usage["cache_creation_input_tokens"] == cold.prompt_tokens
+
+    tracker.record(cold, "ollama/llama3", "http://localhost:11434")
+    warm = tracker.plan("s", "ollama/llama3", messages, [messages[0]])
+    # The backend only evaluated the tail after the cached system prompt
+    evaluated = warm.prompt_tokens - warm.warm_tokens
+    usage = cache_usage(warm, evaluated)
+    assert usage == {"input_tokens": evaluated, "cache_creation_input_tokens": 0,
+                     "cache_read_input_tokens": warm.warm_tokens}
+
+    assert cache_usage(None, 42) == {"input_tokens": 42, "cache_creation_input_tokens": 0,
+                                     "cache_read_input_tokens": 0}
+
+
+def test_failover_chain_prefers_cached_host(monkeypatch):
+    from app.services import failover
+    monkeypatch.setattr(failover, "OLLAMA_API_BASES", ["http://a", "http://b"])
+    chain = failover_chain("ollama/llama3", "http://b")
+    assert [backend.api_base for backend in chain] == ["http://b", "http://a"]
+    assert failover_chain("ollama/llama3", "http://unknown")[0].api_base == "http://a"
+
+
+def test_keep_alive_is_set_for_both_ollama_prefixes():
+    import server
+    from app.models.anthropic_models import MessagesRequest
+    for model in ("ollama/llama3", "ollama_chat/llama3"):
+        request = MessagesRequest(
+            model=model, max_tokens=100,
+            system=[{"type": "text", "text": "You are a careful assistant. " * 50,
+                     "cache_control": {"type": "ephemeral"}}],
+            messages=[{"role": "user", "content": "Summarise the design document."}]
+        )
+        litellm_request, plan = server.prepare_litellm_request(request, session="user:keep-alive")
+        assert plan is not None
+        assert litellm_request["keep_alive"] == server.PROMPT_CACHE_KEEP_ALIVE
@@ -0,0 +1,153 @@
+"""
+Tests for per-client rate limiting
+"""
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from app.services.rate_limits import RateLimiter, RateLimitExceeded
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _limiter(tmp_path, clock, rps=1, burst=2, input_tpm=600, output_tpm=60, idle_seconds=0):
+    return RateLimiter(rps, burst, input_tpm, output_tpm, str(tmp_path / "ledger.json"), clock, idle_seconds)
+
+
+def test_request_bucket_allows_burst_then_refills(tmp_path):
+    clock = Clock()
+    limiter = _limiter(tmp_path, clock)
+    limiter.acquire("a", 10)
+    limiter.acquire("a", 10)
+    with pytest.raises(RateLimitExceeded) as error:
+        limiter.acquire("a", 10)
+    assert error.value.limit == "requests" and error.value.retry_after == pytest.approx(1.0)
+    limiter.acquire("b", 10)  # Other clients are unaffected
+    clock.now += 1.0
+    limiter.acquire("a", 10)
+
+
+def test_token_buckets(tmp_path):
+    clock = Clock()
+    limiter = _limiter(tmp_path, clock, burst=100)
+    limiter.acquire("a", 550)
+    with pytest.raises(RateLimitExceeded) as error:
+        limiter.acquire("a", 100)
+    # 600 tokens per minute refill at 10 per second; 50 are left
+    assert error.value.limit == "input_tokens" and error.value.retry_after == pytest.approx(5.0)
+
+    # Output tokens are charged afterwards and block the client while in debt
+    limiter.record_output("b", 90)
+    with pytest.raises(RateLimitExceeded) as error:
+        limiter.acquire("b", 1)
+    assert error.value.limit == "output_tokens" and error.value.retry_after == pytest.approx(30.0)
+    clock.now += 30
+    limiter.acquire("b", 1)
+    assert limiter.clients["b"].rejected == 1
+
+
+def test_ledger_snapshot_round_trip(tmp_path):
+    clock = Clock()
+    limiter = _limiter(tmp_path, clock)
+    limiter.acquire("a", 100)
+    limiter.record_output("a", 30)
+    limiter.save()
+
+    restored = _limiter(tmp_path, Clock())
+    restored.load()
+    ledger = restored.clients["a"]
+    assert (ledger.requests, ledger.input_tokens, ledger.output_tokens) == (1, 100, 30)
+    assert ledger.buckets["input_tokens"].level == pytest.approx(500, abs=1)
+
+
+def test_workers_keep_separate_snapshots_and_adopt_exited_ones(tmp_path, monkeypatch):
+    from app.services import rate_limits
+    clock = Clock()
+    limiter = _limiter(tmp_path, clock)
+    limiter.acquire("a", 100)
+    limiter.save()
+    assert os.path.exists(tmp_path / f"ledger.{os.getpid()}.json")
+    assert not os.path.exists(tmp_path / "ledger.json")
+
+    saved = {"saved_at": 0, "clients": {"a": {"requests": 2, "input_tokens": 50, "levels": {}}}}
+    (tmp_path / "ledger.111.json").write_text(json.dumps(saved))
+    (tmp_path / "ledger.222.json").write_text(json.dumps(saved))
+    # 111 has exited, 222 is still running and keeps its file
+    monkeypatch.setattr(rate_limits, "_pid_alive", lambda pid: pid == 222)
+
+    restored = _limiter(tmp_path, Clock())
+    restored.load()
+    ledger = restored.clients["a"]
+    assert (ledger.requests, ledger.input_tokens) == (3, 150)
+    assert {path.name for path in tmp_path.iterdir()} == {"ledger.222.json", f"ledger.{os.getpid()}.json"}
+
+
+def test_idle_clients_are_evicted_once_their_buckets_refill(tmp_path):
+    clock = Clock()
+    limiter = _limiter(tmp_path, clock, idle_seconds=60)
+    limiter.acquire("a", 10)
+    limiter.record_output("b", 600)
+    clock.now += 61
+    # b still owes output tokens, so dropping it would lift its limit
+    assert limiter.evict_idle() == 1
+    assert list(limiter.clients) == ["b"]
+
+
+def test_create_message_returns_rate_limit_error(monkeypatch, tmp_path):
+    async def fake_acompletion(**kwargs):
+        return {"id": "r", "choices": [{"message": {"content": "ok"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 2}}
+
+    monkeypatch.setattr(server.llm, "acompletion", fake_acompletion)
+    monkeypatch.setattr(server, "rate_limiter", _limiter(tmp_path, Clock(), burst=1))
+    client = TestClient(server.app)
+    body = {"model": "claude-3-haiku-20240307", "max_tokens": 10, "messages": [{"role": "user", "content": "hi"}]}
+
+    assert client.post("/v1/messages", json=body, headers={"x-api-key": "one"}).status_code == 200
+    response = client.post("/v1/messages", json=body, headers={"x-api-key": "one"})
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+    assert response.json()["error"]["type"] == "rate_limit_error"
+    assert response.json()["type"] == "error"
+
+    # metadata.user_id identifies the client ahead of the key
+    body["metadata"] = {"user_id": "dev-2"}
+    assert client.post("/v1/messages", json=body, headers={"x-api-key": "one"}).status_code == 200
+    ledger = server.rate_limiter.clients["user:dev-2"]
+    assert (ledger.requests, ledger.output_tokens) == (1, 2)
+
+    # A rejected request is never converted
+    def fail_prepare(*args, **kwargs):
+        raise AssertionError("converted a rate limited request")
+    monkeypatch.setattr(server, "prepare_litellm_request", fail_prepare)
+    assert client.post("/v1/messages", json=body, headers={"x-api-key": "one"}).status_code == 429
+
+
+def test_streamed_output_tokens_are_charged(monkeypatch, tmp_path):
+    async def stream():
+        for text in ["one two", " three"]:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=None)])
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason="stop")])
+
+    async def fake_acompletion(**kwargs):
+        return stream()
+
+    monkeypatch.setattr(server.llm, "acompletion", fake_acompletion)
+    monkeypatch.setattr(server, "rate_limiter", _limiter(tmp_path, Clock()))
+    client = TestClient(server.app)
+    body = {"model": "claude-3-haiku-20240307", "max_tokens": 10, "stream": True,
+            "messages": [{"role": "user", "content": "hi"}]}
+    response = client.post("/v1/messages", json=body, headers={"x-api-key": "one"})
+    assert "three" in response.text
+    # No usage in the chunks, so the output is estimated from the text
+    assert next(iter(server.rate_limiter.clients.values())).output_tokens == 3
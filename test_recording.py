@@ -0,0 +1,98 @@
+"""
+Tests for upstream traffic recording and the replay backend
+"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from app.services.recording import (
+    RecordingStream, ReplayBackend, chunk_to_record, parse_speed, request_hash
+)
+
+
+def _chunk(content=None, tool_calls=None, finish_reason=None, usage=None):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls),
+                                 finish_reason=finish_reason)],
+        usage=usage,
+    )
+
+
+class _Upstream:
+    def __init__(self, chunks, delay):
+        self.chunks = list(chunks)
+        self.delay = delay
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.chunks:
+            raise StopAsyncIteration
+        await asyncio.sleep(self.delay)
+        return self.chunks.pop(0)
+
+
+UPSTREAM = [
+    _chunk("Let me "),
+    _chunk("check."),
+    _chunk(tool_calls=[SimpleNamespace(index=0, id="call_1", function=SimpleNamespace(name="calc", arguments='{"x"'))]),
+    _chunk(tool_calls=[SimpleNamespace(index=0, id=None, function=SimpleNamespace(name=None, arguments=': 1}'))]),
+    _chunk(finish_reason="tool_calls", usage=SimpleNamespace(prompt_tokens=12, completion_tokens=9)),
+]
+
+
+def _record(tmp_path):
+    request = {"model": "ollama/llama3", "messages": [{"role": "user", "content": "hi"}], "stream": True}
+
+    async def run():
+        stream = RecordingStream(_Upstream(UPSTREAM, 0.01), "ollama/llama3", "http://a", request, str(tmp_path))
+        return [chunk async for chunk in stream], stream.path
+
+    return request, asyncio.run(run())
+
+
+def test_recording_captures_chunks_and_timing(tmp_path):
+    request, (chunks, path) = _record(tmp_path)
+    assert len(chunks) == len(UPSTREAM)
+    with open(path) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[0]["type"] == "header" and lines[0]["request_hash"] == request_hash(request["messages"])
+    assert lines[-1] == {"type": "end", "duration": lines[-1]["duration"], "chunks": 5}
+    records = lines[1:-1]
+    assert [r["content"] for r in records[:2]] == ["Let me ", "check."]
+    assert records[2]["tool_calls"][0]["name"] == "calc"
+    assert records[4]["usage"] == {"prompt_tokens": 12, "completion_tokens": 9}
+    offsets = [r["t"] for r in records]
+    assert offsets == sorted(offsets) and offsets[-1] >= 0.04
+
+
+def test_replay_round_trips_and_respects_speed(tmp_path):
+    request, (_, path) = _record(tmp_path)
+    backend = ReplayBackend(str(tmp_path), parse_speed("max"))
+
+    async def replay(backend):
+        started = time.perf_counter()
+        stream = await backend.acompletion(messages=request["messages"], stream=True)
+        chunks = [chunk async for chunk in stream]
+        return chunks, time.perf_counter() - started
+
+    chunks, elapsed = asyncio.run(replay(backend))
+    assert [chunk_to_record(c, 0)["content"] for c in chunks] == [chunk_to_record(c, 0)["content"] for c in UPSTREAM]
+    assert chunks[3].choices[0].delta.tool_calls[0].function.arguments == ": 1}"
+    assert elapsed < 0.03
+
+    _, original = asyncio.run(replay(ReplayBackend(path, parse_speed("original"))))
+    assert original >= 0.04
+
+    response = asyncio.run(backend.acompletion(messages=[{"role": "user", "content": "other"}]))
+    assert response["choices"][0]["message"]["content"] == "Let me check."
+    assert response["choices"][0]["finish_reason"] == "tool_calls"
+
+
+def test_parse_speed():
+    assert parse_speed("original") == 1.0
+    assert parse_speed("max") == 0.0
+    assert parse_speed("4") == 0.25
+    assert parse_speed("0.5x") == 2.0
@@ -0,0 +1,132 @@
+"""
+Tests for the priority scheduler in front of upstream dispatch
+"""
+import asyncio
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import server
+from app.services import metrics
+from app.services.scheduler import BACKGROUND, INTERACTIVE, Scheduler, priority_class
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def _order(scheduler, jobs, clock=None):
+    """Queue jobs behind one held slot, then record the order they are granted in"""
+    held = await scheduler.acquire(INTERACTIVE, 0)
+    order = []
+
+    async def run(name, cls, cost, delay):
+        if clock is not None:
+            clock.now += delay
+        slot = await scheduler.acquire(cls, cost)
+        order.append(name)
+        slot.release()
+
+    tasks = []
+    for job in jobs:
+        tasks.append(asyncio.create_task(run(*job)))
+        await asyncio.sleep(0)
+    held.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_priority_class():
+    assert priority_class("claude-3-5-haiku-20241022", "/v1/messages") == BACKGROUND
+    assert priority_class("claude-sonnet-4-20250514", "/v1/messages") == INTERACTIVE
+    assert priority_class("claude-sonnet-4-20250514", "/v1/messages/batches") == BACKGROUND
+
+
+def test_interactive_first_then_shortest_job():
+    order = asyncio.run(_order(Scheduler(1, 0, 0), [
+        ("title", BACKGROUND, 50, 0),
+        ("big turn", INTERACTIVE, 90000, 0),
+        ("small turn", INTERACTIVE, 2000, 0),
+        ("summary", BACKGROUND, 20, 0),
+    ]))
+    assert order == ["small turn", "big turn", "summary", "title"]
+
+
+def test_aging_promotes_waiting_background_jobs():
+    clock = Clock()
+    jobs = [("title", BACKGROUND, 1000, 0), ("turn", INTERACTIVE, 500, 61)]
+    order = asyncio.run(_order(Scheduler(1, 30, 60, clock), jobs, clock))
+    # After 61s the title competes as interactive, and its cost has aged to ~330
+    assert order == ["title", "turn"]
+    clock = Clock()
+    order = asyncio.run(_order(Scheduler(1, 30, 0, clock), jobs, clock))
+    assert order == ["turn", "title"]
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def run():
+        scheduler = Scheduler(1)
+        held = await scheduler.acquire(INTERACTIVE, 0)
+        waiter = asyncio.create_task(scheduler.acquire(BACKGROUND, 10))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        held.release()
+        held.release()  # Releasing twice is harmless
+        slot = await asyncio.wait_for(scheduler.acquire(INTERACTIVE, 10), 1)
+        state = scheduler.state()
+        slot.release()
+        return state
+
+    assert asyncio.run(run()) == {"active": 1, "max_concurrency": 1, "queued": {INTERACTIVE: 0, BACKGROUND: 0}}
+
+
+def test_cancellation_racing_a_release_keeps_the_queue_consistent():
+    async def run():
+        scheduler = Scheduler(1)
+        held = await scheduler.acquire(INTERACTIVE, 0)
+        dropped = asyncio.create_task(scheduler.acquire(BACKGROUND, 10))
+        granted = asyncio.create_task(scheduler.acquire(BACKGROUND, 20))
+        await asyncio.sleep(0)
+        # Cancelled, then removed by the release before the task runs again
+        dropped.cancel()
+        held.release()
+        # Given the slot, then cancelled before it could use it
+        granted.cancel()
+        results = await asyncio.gather(dropped, granted, return_exceptions=True)
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+        slot = await asyncio.wait_for(scheduler.acquire(INTERACTIVE, 10), 1)
+        state = scheduler.state()
+        slot.release()
+        return state
+
+    assert asyncio.run(run()) == {"active": 1, "max_concurrency": 1, "queued": {INTERACTIVE: 0, BACKGROUND: 0}}
+
+
+def test_queue_wait_is_exported_per_class():
+    before = metrics.sample_count("scheduler.queue_wait_seconds.background")
+    asyncio.run(_order(Scheduler(1), [("title", BACKGROUND, 1, 0)]))
+    assert metrics.sample_count("scheduler.queue_wait_seconds.background") == before + 1
+
+
+def test_create_message_releases_slots(monkeypatch):
+    async def stream():
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="hi"), finish_reason="stop")])
+
+    async def fake_acompletion(**kwargs):
+        if kwargs.get("stream"):
+            return stream()
+        return {"id": "r", "choices": [{"message": {"content": "ok"}, "finish_reason": "stop"}], "usage": {}}
+
+    monkeypatch.setattr(server.llm, "acompletion", fake_acompletion)
+    monkeypatch.setattr(server, "scheduler", Scheduler(1))
+    client = TestClient(server.app)
+    body = {"model": "claude-3-haiku-20240307", "max_tokens": 10, "messages": [{"role": "user", "content": "hi"}]}
+    for stream_flag in (True, True, False, False):
+        assert client.post("/v1/messages", json={**body, "stream": stream_flag}).status_code == 200
+    assert server.scheduler.state()["active"] == 0
+    assert client.get("/metrics").json()["scheduler"]["max_concurrency"] == 1
@@ -0,0 +1,66 @@
+"""
+Schema conformance for the directly serialized non-streaming responses
+"""
+import json
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import server
+from app.models.anthropic_models import MessagesResponse, TokenCountResponse
+from app.utils.serialization import AnthropicJSONResponse, dumps
+
+REQUEST = server.MessagesRequest(model="claude-3-haiku-20240307", max_tokens=100,
+                                 messages=[{"role": "user", "content": "hi"}])
+
+
+def _tool_call(i, arguments):
+    return {"id": f"call_{i}", "type": "function", "function": {"name": "Bash", "arguments": arguments}}
+
+
+RESPONSES = [
+    {"id": "r1", "choices": [{"message": {"content": "Hello 世界"}, "finish_reason": "stop"}],
+     "usage": {"prompt_tokens": 5, "completion_tokens": 2}},
+    {"id": "r2", "choices": [{"message": {"content": None, "tool_calls": [
+        _tool_call(0, '{"command": "ls"}'), _tool_call(1, "not json")]}, "finish_reason": "tool_calls"}],
+     "usage": {"prompt_tokens": 5, "completion_tokens": 9}},
+    {"id": "r3", "choices": [{"message": {"content": ""}, "finish_reason": "length"}], "usage": {}},
+    SimpleNamespace(id="r4", choices=[SimpleNamespace(
+        message=SimpleNamespace(content="object", tool_calls=None), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1)),
+    None,  # Conversion error fallback
+]
+
+
+def test_converted_responses_conform_to_messages_response():
+    for litellm_response in RESPONSES:
+        for request in (REQUEST, REQUEST.model_copy(update={"model": "ollama/llama3"})):
+            response = server.convert_litellm_to_anthropic(litellm_response, request)
+            body = AnthropicJSONResponse(response).body
+            validated = MessagesResponse.model_validate_json(body)
+            assert validated.model_dump(exclude_none=True) == MessagesResponse.model_validate(response).model_dump(exclude_none=True)
+            assert json.loads(body) == response
+            assert set(response) == set(MessagesResponse.model_fields)
+
+
+def test_dumps_falls_back_for_values_orjson_rejects():
+    assert json.loads(dumps({"n": 2 ** 70, "t": "é"})) == {"n": 2 ** 70, "t": "é"}
+    assert dumps({"t": "é"}) == '{"t":"é"}'.encode("utf-8")
+
+
+def test_endpoints_return_conforming_bodies(monkeypatch):
+    async def fake_acompletion(**kwargs):
+        return RESPONSES[1]
+
+    monkeypatch.setattr(server.llm, "acompletion", fake_acompletion)
+    monkeypatch.setattr(server.llm, "token_counter", lambda **kwargs: 7)
+    client = TestClient(server.app)
+    response = client.post("/v1/messages", json=REQUEST.model_dump(exclude_none=True))
+    assert response.status_code == 200 and response.headers["content-type"] == "application/json"
+    message = MessagesResponse.model_validate(response.json())
+    assert [block.type for block in message.content] == ["tool_use", "tool_use"]
+    assert message.stop_reason == "tool_use"
+
+    response = client.post("/v1/messages/count_tokens", json={"model": REQUEST.model, "messages": [
+        {"role": "user", "content": "hi"}]})
+    assert TokenCountResponse.model_validate(response.json()).input_tokens == 7
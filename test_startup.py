@@ -0,0 +1,60 @@
+"""
+Tests for the lazy LiteLLM import and startup side effects
+"""
+import asyncio
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run(code):
+    env = dict(os.environ, LOG_LEVEL="WARNING")
+    env.pop("LITELLM_LOCAL_MODEL_COST_MAP", None)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_importing_server_does_not_load_litellm():
+    assert _run("import sys, server; print('litellm' in sys.modules)") == "False"
+
+
+def test_litellm_loads_on_first_use_with_local_cost_map():
+    output = _run(
+        "import os, sys\n"
+        "from app.services import llm\n"
+        "assert not llm.is_loaded()\n"
+        "module = llm.get_litellm()\n"
+        "print(llm.is_loaded(), module is sys.modules['litellm'],"
+        " os.environ['LITELLM_LOCAL_MODEL_COST_MAP'], module.set_verbose)"
+    )
+    assert output == "True True True False"
+
+
+def test_litellm_warms_up_in_the_background():
+    output = _run(
+        "import threading\n"
+        "from fastapi.testclient import TestClient\n"
+        "import server\n"
+        "from app.services import llm\n"
+        "server.LITELLM_WARM_UP = True\n"
+        "threads = []\n"
+        "llm.get_litellm = lambda: threads.append(threading.current_thread() is threading.main_thread())\n"
+        "with TestClient(server.app) as client:\n"
+        "    while not threads:\n"
+        "        client.get('/health')\n"
+        "print(threads)"
+    )
+    assert output == "[False]"
+
+
+def test_warm_up_is_skipped_when_replaying(monkeypatch):
+    from app.services import llm
+    calls = []
+    monkeypatch.setattr(llm, "REPLAY_PATH", "recordings")
+    monkeypatch.setattr(llm, "get_litellm", lambda: calls.append(True))
+    asyncio.run(llm.warm_up())
+    assert calls == []
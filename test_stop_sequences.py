@@ -0,0 +1,92 @@
+"""
+Tests for stop sequences enforced by the proxy
+"""
+import json
+import random
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import server
+from app.utils.stop_sequences import StopSequenceScanner
+
+
+def _scan(chunks, stops):
+    scanner = StopSequenceScanner(stops)
+    sent = "".join(scanner.feed(chunk) for chunk in chunks)
+    if scanner.matched is None:
+        sent += scanner.flush()
+    return sent, scanner.matched
+
+
+def test_matches_split_across_chunks():
+    assert _scan(["Hello ##", "#EN", "D## more"], ["###END###"]) == ("Hello ###END## more", None)
+    assert _scan(["Hello ##", "#EN", "D### more"], ["###END###"]) == ("Hello ", "###END###")
+    # A held-back partial match that turns out not to match is released
+    assert _scan(["a <", "/b", "r> c"], ["</stop>"]) == ("a </br> c", None)
+    # The match a model would have generated first wins
+    assert _scan(["x STOP2 y STOP1"], ["STOP1", "STOP2"]) == ("x ", "STOP2")
+    assert _scan(["abcd"], ["abcd", "bc"]) == ("a", "bc")
+
+
+def test_random_chunking_matches_whole_text_search():
+    rng = random.Random(7)
+    for _ in range(300):
+        text = "".join(rng.choice("ab\n") for _ in range(rng.randint(0, 40)))
+        stops = ["".join(rng.choice("ab\n") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 3))]
+        cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 6))))
+        chunks = [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+        found = [(text.find(s) + len(s), -len(s), s) for s in stops if s in text]
+        if found:
+            end, length, stop = min(found)
+            expected = (text[:end + length], stop)
+        else:
+            expected = (text, None)
+        assert _scan(chunks, stops) == expected, (chunks, stops)
+
+
+def _events(text):
+    return [json.loads(line[6:]) for line in text.splitlines() if line.startswith("data: {")]
+
+
+def test_stream_is_cut_and_upstream_closed(monkeypatch):
+    sent = []
+    closed = []
+
+    async def stream():
+        try:
+            for text in ["The answer", " is 4", "2.\n\nHum", "an: and then", " more", " and more"]:
+                sent.append(text)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=None)])
+        finally:
+            closed.append(True)
+
+    async def fake_acompletion(**kwargs):
+        return stream()
+
+    monkeypatch.setattr(server.llm, "acompletion", fake_acompletion)
+    client = TestClient(server.app)
+    body = {"model": "claude-3-haiku-20240307", "max_tokens": 100, "stream": True,
+            "stop_sequences": ["\n\nHuman:"], "messages": [{"role": "user", "content": "hi"}]}
+    events = _events(client.post("/v1/messages", json=body).text)
+
+    text = "".join(e["delta"]["text"] for e in events if e["type"] == "content_block_delta")
+    assert text == "The answer is 42."
+    delta = next(e for e in events if e["type"] == "message_delta")["delta"]
+    assert delta == {"stop_reason": "stop_sequence", "stop_sequence": "\n\nHuman:"}
+    # Reading stopped at the chunk that completed the match
+    assert len(sent) == 4 and closed == [True]
+
+
+def test_non_streaming_response_is_truncated(monkeypatch):
+    async def fake_acompletion(**kwargs):
+        return {"id": "r", "choices": [{"message": {"content": "1, 2, 3, 4"}, "finish_reason": "length"}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 9}}
+
+    monkeypatch.setattr(server.llm, "acompletion", fake_acompletion)
+    client = TestClient(server.app)
+    body = {"model": "claude-3-haiku-20240307", "max_tokens": 9, "stop_sequences": [", 3"],
+            "messages": [{"role": "user", "content": "count"}]}
+    response = client.post("/v1/messages", json=body).json()
+    assert response["content"] == [{"type": "text", "text": "1, 2"}]
+    assert (response["stop_reason"], response["stop_sequence"]) == ("stop_sequence", ", 3")
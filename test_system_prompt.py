@@ -0,0 +1,83 @@
+"""
+Tests for per-model system prompt rewriting
+"""
+from collections import OrderedDict
+
+import server
+from app.services import metrics
+from app.utils import system_prompt
+from app.utils.system_prompt import apply_rule, cap_tokens, load_rules, parse_rule, strip_sections
+
+PROMPT = """You are Claude Code, Anthropic's official CLI for Claude.
+
+# Tone and style
+Be concise.
+<example>user: 2 + 2
+assistant: 4</example>
+
+## Verbosity
+Very concise.
+
+# Doing tasks
+Search the codebase, then implement the change.
+
+<env>
+Working directory: /work
+</env>"""
+
+
+def test_strip_sections_removes_subsections():
+    assert strip_sections(PROMPT, ["tone and style"]) == PROMPT.replace(
+        "# Tone and style\nBe concise.\n<example>user: 2 + 2\nassistant: 4</example>\n\n## Verbosity\nVery concise.\n\n", "")
+
+
+def test_rule_with_template():
+    rule = parse_rule({
+        "strip_sections": ["# Tone and style"],
+        "strip_patterns": ["<env>.*?</env>"],
+        "replace": {"Claude Code": "a coding assistant"},
+        "template": "Be brief.\n\n{system}\n\n{tag:env}",
+    })
+    assert apply_rule(PROMPT, rule) == (
+        "Be brief.\n\nYou are a coding assistant, Anthropic's official CLI for Claude.\n\n"
+        "# Doing tasks\nSearch the codebase, then implement the change.\n\n<env>\nWorking directory: /work\n</env>"
+    )
+
+
+def test_cap_drops_largest_sections_first():
+    text = "Preamble.\n\n# Big\n" + "word " * 200 + "\n\n# Small\nkeep me"
+    capped = cap_tokens(text, 50)
+    assert capped == "Preamble.\n\n# Small\nkeep me"
+    assert cap_tokens("one\n\n" + "two " * 100, 10) == "one"
+
+
+def test_transform_is_cached_and_reports_savings(monkeypatch, tmp_path):
+    rules = tmp_path / "rules.json"
+    rules.write_text('{"qwen2.5-coder": {"strip_sections": ["Tone and style"]}, "llama3": {"max_tokens": 0}}')
+    loaded = load_rules(str(rules))
+    assert set(loaded) == {"qwen2.5-coder", "llama3"}
+    monkeypatch.setattr(system_prompt, "_rules", loaded)
+    monkeypatch.setattr(system_prompt, "_transform_cache", OrderedDict())
+    calls = []
+    monkeypatch.setattr(system_prompt, "apply_rule", lambda text, rule: calls.append(text) or text[:40])
+    saved_before = metrics.snapshot()["counters"].get("system_prompt.tokens_saved", 0)
+
+    request = server.MessagesRequest(model="ollama/qwen2.5-coder:7b", max_tokens=10, system=PROMPT,
+                                     messages=[{"role": "user", "content": "hi"}])
+    for _ in range(3):
+        converted = server.convert_anthropic_to_litellm(request)
+    assert converted["messages"][0] == {"role": "system", "content": PROMPT[:40]}
+    assert len(calls) == 1
+    assert metrics.snapshot()["counters"]["system_prompt.tokens_saved"] > saved_before
+
+    # Models without a rule get the prompt unchanged
+    request = server.MessagesRequest(model="ollama/mistral:7b", max_tokens=10, system=PROMPT,
+                                     messages=[{"role": "user", "content": "hi"}])
+    assert server.convert_anthropic_to_litellm(request)["messages"][0]["content"] == PROMPT
+
+
+def test_unreadable_rules_are_ignored(tmp_path):
+    rules = tmp_path / "rules.json"
+    rules.write_text('{"qwen": {"strip_patterns": ["("]}}')
+    assert load_rules(str(rules)) == {}
+    assert load_rules(str(tmp_path / "missing.json")) == {}
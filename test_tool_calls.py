@@ -0,0 +1,124 @@
+"""
+Tests for extracting tool calls that models write into their text
+"""
+import json
+import random
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import server
+from app.config import settings
+from app.utils import tool_calls
+from app.utils.tool_calls import ToolCallParser, tool_call_formats
+
+HERMES = 'Let me look.\n<tool_call>\n{"name": "Read", "arguments": {"file_path": "a.py"}}\n</tool_call>'
+QWEN3 = '<tool_call>\n<function=Bash>\n<parameter=command>\nls -la\n</parameter>\n</function>\n</tool_call>'
+INVOKES = ('Running both.<function_calls><invoke name="Bash"><parameter name="command">pwd</parameter></invoke>'
+           '<invoke name="Glob"><parameter name="pattern">*.py</parameter></invoke></function_calls>')
+MISTRAL = '[TOOL_CALLS] [{"name": "Edit", "arguments": {"old": "a}", "new": "\\"}]"}}]'
+LLAMA = '  {"name": "Bash", "parameters": {"command": "echo {"}}'
+
+
+def _parse(chunks, formats):
+    parser = ToolCallParser(formats)
+    events = [event for chunk in chunks for event in parser.feed(chunk)] + parser.flush()
+    merged = []
+    for event in events:
+        if isinstance(event, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += event
+        else:
+            merged.append(event)
+    return [e if isinstance(e, str) else (e.name, e.input) for e in merged if e != ""]
+
+
+def _chunked(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 12))))
+    return [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_formats():
+    assert _parse([HERMES], ["hermes"]) == ["Let me look.\n", ("Read", {"file_path": "a.py"})]
+    assert _parse([QWEN3], ["hermes"]) == [("Bash", {"command": "ls -la"})]
+    assert _parse([INVOKES], ["xml"]) == ["Running both.", ("Bash", {"command": "pwd"}), ("Glob", {"pattern": "*.py"})]
+    assert _parse([MISTRAL], ["mistral"]) == [("Edit", {"old": "a}", "new": '"}]'})]
+    assert _parse([LLAMA], ["json"]) == ["  ", ("Bash", {"command": "echo {"})]
+
+
+def test_split_chunks_give_the_same_result():
+    rng = random.Random(3)
+    for text, formats in [(HERMES, ["hermes"]), (QWEN3, ["hermes"]), (INVOKES, ["xml"]),
+                          (MISTRAL, ["mistral"]), (LLAMA, ["json"])]:
+        expected = _parse([text], formats)
+        for _ in range(50):
+            assert _parse(_chunked(text, rng), formats) == expected
+
+
+def test_malformed_or_unfinished_calls_stay_text():
+    broken = "<tool_call>{not json}</tool_call> done"
+    assert _parse([broken], ["hermes"]) == [broken]
+    assert _parse(["a <tool_call>{\"name\": \"Read\""], ["hermes"]) == ["a <tool_call>{\"name\": \"Read\""]
+    # A JSON-looking reply is only a call if it has a tool name
+    assert _parse(['{"answer": 42}'], ["json"]) == ['{"answer": 42}']
+    assert _parse(["use <tool_", "call> tags"], ["xml"]) == ["use <tool_call> tags"]
+
+
+def test_format_selection():
+    assert tool_call_formats("ollama/qwen2.5-coder:7b") == ["hermes", "xml"]
+    assert tool_call_formats("ollama_chat/devstral:24b") == ["hermes", "xml", "mistral"]
+    assert tool_call_formats("ollama/llama3.1:8b") == ["hermes", "xml", "json"]
+    assert tool_call_formats("openai/gpt-4o") == []
+    assert tool_call_formats("ollama/Llama3.1:8B") == ["hermes", "xml", "json"]
+
+
+def test_undeclared_tools_and_unknown_formats(monkeypatch):
+    parser = ToolCallParser(["json"], ["Bash"])
+    reply = '{"name": "Bob", "age": 3}'
+    assert parser.feed(reply) + parser.flush() == [reply]
+    assert parser.found == 0
+    assert _parse([LLAMA], ["json"]) == ["  ", ("Bash", {"command": "echo {"})]
+
+    monkeypatch.setattr(tool_calls, "TOOL_CALL_FORMATS", {"granite": ["json", "jsn"]})
+    monkeypatch.setattr(settings, "TOOL_CALL_FORMATS", {"granite": ["json", "jsn"]})
+    assert tool_call_formats("ollama/Granite3:8b") == ["json"]
+    assert any("jsn" in issue for issue in settings.validate_configuration())
+
+
+REQUEST = {"model": "ollama/qwen2.5-coder:7b", "max_tokens": 100, "messages": [{"role": "user", "content": "hi"}],
+           "tools": [{"name": "Read", "input_schema": {"type": "object", "properties": {"file_path": {"type": "string"}}}}]}
+
+
+def test_streamed_text_tool_call_becomes_tool_use(monkeypatch):
+    async def stream():
+        for text in _chunked(HERMES, random.Random(5)):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=None)])
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason="stop")])
+
+    async def fake_acompletion(**kwargs):
+        return stream()
+
+    monkeypatch.setattr(server.llm, "acompletion", fake_acompletion)
+    response = TestClient(server.app).post("/v1/messages", json={**REQUEST, "stream": True})
+    events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: {")]
+
+    starts = [e["content_block"] for e in events if e["type"] == "content_block_start"]
+    assert [b["type"] for b in starts] == ["text", "tool_use"] and starts[1]["name"] == "Read"
+    text = "".join(e["delta"]["text"] for e in events if e.get("delta", {}).get("type") == "text_delta")
+    partial = "".join(e["delta"]["partial_json"] for e in events if e.get("delta", {}).get("type") == "input_json_delta")
+    assert text == "Let me look.\n" and json.loads(partial) == {"file_path": "a.py"}
+    assert next(e for e in events if e["type"] == "message_delta")["delta"]["stop_reason"] == "tool_use"
+
+
+def test_non_streaming_text_tool_call_becomes_tool_use(monkeypatch):
+    async def fake_acompletion(**kwargs):
+        return {"id": "r", "choices": [{"message": {"content": HERMES}, "finish_reason": "stop"}], "usage": {}}
+
+    monkeypatch.setattr(server.llm, "acompletion", fake_acompletion)
+    response = TestClient(server.app).post("/v1/messages", json=REQUEST).json()
+    assert response["content"][0] == {"type": "text", "text": "Let me look.\n"}
+    assert response["content"][1]["type"] == "tool_use" and response["content"][1]["input"] == {"file_path": "a.py"}
+    assert response["stop_reason"] == "tool_use"
+
+    # Without tools in the request the text is left alone
+    response = TestClient(server.app).post("/v1/messages", json={**REQUEST, "tools": None}).json()
+    assert response["content"] == [{"type": "text", "text": HERMES}]
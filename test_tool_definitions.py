@@ -0,0 +1,113 @@
+"""
+Tests for forwarding tool definitions to the upstream
+"""
+from fastapi.testclient import TestClient
+
+import server
+from app.services import metrics
+from app.services.failover import Backend
+from app.utils import tool_definitions
+from app.utils.tool_definitions import (
+    ToolUsage, convert_tool_choice, convert_tools, prepare_tools, shorten_description
+)
+
+LONG = "Reads a file from the local filesystem. " + "You can read any file. " * 40 + "\n\nUsage notes: ..."
+TOOLS = [
+    {"name": "Read", "description": LONG, "input_schema": {
+        "$schema": "http://json-schema.org/draft-07/schema#", "type": "object",
+        "properties": {"file_path": {"type": "string", "description": "The absolute path. " * 30}},
+        "required": ["file_path"]}},
+    {"name": "Bash", "description": "Runs a command.", "input_schema": {"type": "object", "properties": {}}},
+    {"name": "NotebookEdit", "description": LONG, "input_schema": {"type": "object", "properties": {}}},
+]
+
+
+def test_conversion_is_memoized():
+    first = convert_tools(TOOLS)
+    hits = metrics.snapshot()["counters"].get("tool_definitions.cache_hits", 0)
+    again = convert_tools([dict(tool) for tool in TOOLS])
+    assert again is first
+    assert metrics.snapshot()["counters"]["tool_definitions.cache_hits"] == hits + 1
+    assert first.tools[1] == {"type": "function", "function": {
+        "name": "Bash", "description": "Runs a command.", "parameters": {"type": "object", "properties": {}}}}
+    assert "$schema" not in first.tools[0]["function"]["parameters"]
+
+
+def test_tool_choice():
+    assert convert_tool_choice({"type": "auto"}) == ("auto", None)
+    assert convert_tool_choice({"type": "any", "disable_parallel_tool_use": True}) == ("required", False)
+    assert convert_tool_choice({"type": "tool", "name": "Bash"}) == ({"type": "function", "function": {"name": "Bash"}}, None)
+    assert convert_tool_choice(None) == (None, None)
+
+
+def test_shorten_description():
+    assert shorten_description("Short.\n\nDetails that go on.") == "Short."
+    shortened = shorten_description(LONG, 100)
+    assert len(shortened) <= 100 and shortened.endswith(".")
+
+
+def test_pruning_for_small_models(monkeypatch):
+    monkeypatch.setattr(tool_definitions, "TOOL_PRUNING", "prune")
+    monkeypatch.setattr(tool_definitions, "TOOL_PRUNING_MAX_PARAMETERS_B", 0)
+    monkeypatch.setattr(tool_definitions, "tool_usage", ToolUsage(window=4, min_share=0.25))
+    history = []
+
+    def bash_turn(i):
+        history.append({"role": "assistant", "content": [{"type": "tool_use", "id": f"t{i}", "name": "Bash", "input": {}}]})
+        history.append({"role": "user", "content": [{"type": "tool_result", "tool_use_id": f"t{i}", "content": "ok"}]})
+
+    full_tokens = sum(convert_tools(TOOLS).tokens)
+
+    # Until enough turns were seen, every tool is kept with a shortened description
+    bash_turn(0)
+    tools, tokens = prepare_tools(TOOLS, None, "ollama/qwen2.5-coder:1.5b", history)
+    assert [t["function"]["name"] for t in tools] == ["Read", "Bash", "NotebookEdit"]
+    assert tokens < full_tokens // 2
+    # Resending the same history (retries, count_tokens) doesn't count the turn again
+    prepare_tools(TOOLS, None, "ollama/qwen2.5-coder:1.5b", history)
+    prepare_tools(TOOLS, None, "ollama/qwen2.5-coder:1.5b", history + [{"role": "user", "content": "more"}])
+    assert tool_definitions.tool_usage.turns == 1
+    for i in range(1, 4):
+        bash_turn(i)
+        prepare_tools(TOOLS, None, "ollama/qwen2.5-coder:1.5b", history, record_usage=False)
+    assert tool_definitions.tool_usage.turns == 1
+    for _ in range(2):
+        tools, _ = prepare_tools(TOOLS, None, "ollama/qwen2.5-coder:1.5b", history)
+    assert tool_definitions.tool_usage.turns == 2
+    for i in range(4, 6):
+        bash_turn(i)
+        tools, _ = prepare_tools(TOOLS, None, "ollama/qwen2.5-coder:1.5b", history)
+    assert [t["function"]["name"] for t in tools] == ["Bash"]
+    # Named by tool_choice, so kept
+    tools, _ = prepare_tools(TOOLS, {"type": "tool", "name": "Read"}, "ollama/qwen2.5-coder:1.5b", history)
+    assert [t["function"]["name"] for t in tools] == ["Read", "Bash"]
+
+
+def test_upstream_params_route_tools(monkeypatch):
+    request = {"model": "ollama/qwen2.5-coder:7b", "messages": [], "tools": convert_tools(TOOLS).tools,
+               "tool_choice": "auto"}
+    backend = Backend("ollama/qwen2.5-coder:7b", "http://a")
+    assert server.upstream_params(request, backend)["model"] == "ollama_chat/qwen2.5-coder:7b"
+    assert server.upstream_params({"model": backend.model, "messages": []}, backend)["model"] == backend.model
+
+    # The registry knows this model can't take tools
+    monkeypatch.setattr(server.model_registry, "supports_tools", lambda model: False)
+    params = server.upstream_params(request, backend)
+    assert params["model"] == backend.model and "tools" not in params and "tool_choice" not in params
+
+
+def test_tools_are_forwarded(monkeypatch):
+    seen = {}
+
+    async def fake_acompletion(**kwargs):
+        seen.update(kwargs)
+        return {"id": "r", "choices": [{"message": {"content": "ok"}, "finish_reason": "stop"}], "usage": {}}
+
+    monkeypatch.setattr(server.llm, "acompletion", fake_acompletion)
+    body = {"model": "ollama/qwen2.5-coder:7b", "max_tokens": 10, "tools": TOOLS,
+            "tool_choice": {"type": "tool", "name": "Bash"}, "messages": [{"role": "user", "content": "hi"}]}
+    assert TestClient(server.app).post("/v1/messages", json=body).status_code == 200
+    assert seen["model"] == "ollama_chat/qwen2.5-coder:7b"
+    assert [t["function"]["name"] for t in seen["tools"]] == ["Read", "Bash", "NotebookEdit"]
+    assert seen["tool_choice"] == {"type": "function", "function": {"name": "Bash"}}
+    assert "tool_tokens" not in seen
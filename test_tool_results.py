@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for tool_result conversion and the large-payload policy.
+"""
+
+from server import MessagesRequest, convert_anthropic_to_litellm
+from app.utils.tool_results import parse_tool_result_content, truncate_tool_output
+
+
+def _request(messages):
+    return MessagesRequest(model="codellama:13b", max_tokens=100, messages=messages)
+
+
+def test_tool_results_become_tool_messages():
+    """tool_result blocks follow the assistant call as role=tool messages"""
+    converted = convert_anthropic_to_litellm(_request([
+        {"role": "user", "content": "List the files"},
+        {"role": "assistant", "content": [
+            {"type": "tool_use", "id": "toolu_1", "name": "ls", "input": {"path": "."}}
+        ]},
+        {"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": "toolu_1",
+             "content": [{"type": "text", "text": "a.py"}, {"type": "text", "text": "b.py"}]},
+            {"type": "text", "text": "Now open a.py"}
+        ]},
+    ]))
+    roles = [m["role"] for m in converted["messages"]]
+    assert roles == ["user", "assistant", "tool", "user"]
+    tool_message = converted["messages"][2]
+    assert tool_message == {"role": "tool", "tool_call_id": "toolu_1", "content": "a.py\nb.py"}
+
+
+def test_repeated_outputs_are_deduplicated():
+    """A tool output identical to an earlier one is replaced by a reference"""
+    payload = "x" * 5000
+    messages = []
+    for i in range(2):
+        messages.append({"role": "assistant", "content": [
+            {"type": "tool_use", "id": f"toolu_{i}", "name": "read", "input": {}}
+        ]})
+        messages.append({"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": f"toolu_{i}", "content": payload}
+        ]})
+    converted = convert_anthropic_to_litellm(_request([{"role": "user", "content": "go"}] + messages))
+    tool_messages = [m for m in converted["messages"] if m["role"] == "tool"]
+    assert tool_messages[0]["content"] == payload
+    assert "toolu_0" in tool_messages[1]["content"]
+    assert len(tool_messages[1]["content"]) < 100
+
+
+def test_head_tail_truncation():
+    text = "H" * 100 + "M" * 1000 + "T" * 50
+    truncated = truncate_tool_output(text, head_chars=100, tail_chars=50)
+    assert truncated.startswith("H" * 100)
+    assert truncated.endswith("T" * 50)
+    assert "1000 characters truncated" in truncated
+    assert truncate_tool_output("short", head_chars=100, tail_chars=50) == "short"
+
+
+def test_parse_tool_result_content_shapes():
+    assert parse_tool_result_content(None) == "No content provided"
+    assert parse_tool_result_content({"type": "text", "text": "ok"}) == "ok"
+    assert parse_tool_result_content(["a", {"k": 1}]) == 'a\n{"k": 1}'